@@ -0,0 +1,143 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+import unicodedata
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterable, Iterator, Optional
+
+from base.llm_router import is_error_answer
+
+# 运算符号会影响语义（1+1 和 1-1），不能当标点去掉
+_KEEP = set("+-*/=<>%^")
+
+
+def _keep(question: str, i: int) -> bool:
+    ch = question[i]
+    if ch in _KEEP:
+        return True
+    if ch == "." and 0 < i < len(question) - 1 and question[i - 1].isdigit() and question[i + 1].isdigit():
+        return True  # 小数点（1.5 和 15 不同）
+    # 去掉标点（P*）、空白（Z*）、控制字符和表情（So）
+    category = unicodedata.category(ch)
+    return category[0] not in "PZC" and category != "So"
+
+
+def normalize_question(question: str) -> str:
+    """全角转半角、统一小写、去掉标点和空白"""
+    question = unicodedata.normalize("NFKC", question or "").lower()
+    return "".join(ch for i, ch in enumerate(question) if _keep(question, i))
+
+
+def char_ngrams(text: str, n: int = 2) -> frozenset:
+    if len(text) <= n:
+        return frozenset([text])
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class AnswerCache(object):
+    """大模型回答缓存
+    按 (模型, 提示词标识, 规范化后的问题) 精确匹配；开启相似度匹配时，
+    再用字符 n-gram 的 Jaccard 相似度找足够相似的问题，全部在本地计算。
+    """
+
+    def __init__(self, ttl: float = 600, max_size: int = 1000, similarity: float = 0, ngram: int = 2,
+                 exclude: Optional[Iterable[str]] = None) -> None:
+        """
+        :param ttl: 过期时间，秒
+        :param max_size: 最多缓存的回答数，超出时淘汰最久未使用的
+        :param similarity: 相似度阈值，0 表示只做精确匹配
+        :param ngram: n-gram 的 n
+        :param exclude: 不使用缓存的群或个人
+        """
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self.similarity = similarity
+        self.ngram = ngram
+        self.exclude = set(exclude or [])
+        self.entries = OrderedDict()  # (scope, 问题) -> (过期时间, 回答, n-grams)
+        self.lock = Lock()
+        self.counters = {"exact_hits": 0, "near_hits": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    @classmethod
+    def from_config(cls, conf: dict) -> "AnswerCache":
+        conf = conf or {}
+        return cls(ttl=conf.get("ttl", 600), max_size=conf.get("max_size", 1000),
+                   similarity=conf.get("similarity", 0), exclude=conf.get("exclude"))
+
+    def enabled_for(self, receiver: str) -> bool:
+        return receiver not in self.exclude
+
+    def get(self, question: str, scope: str) -> Optional[str]:
+        """查找缓存的回答
+        :param question: 用户的问题
+        :param scope: 模型和提示词的标识，不同模型、不同人设的回答不能混用
+        """
+        norm = normalize_question(question)
+        if not norm:
+            return None
+
+        now = time.monotonic()
+        with self.lock:
+            item = self.entries.get((scope, norm))
+            if item and item[0] > now:
+                self.entries.move_to_end((scope, norm))
+                self.counters["exact_hits"] += 1
+                return item[1]
+
+            if self.similarity > 0:
+                grams = char_ngrams(norm, self.ngram)
+                best, bestKey = 0.0, None
+                for key, (expire_at, _, other) in self.entries.items():
+                    if key[0] != scope or expire_at <= now:
+                        continue
+                    score = jaccard(grams, other)
+                    if score > best:
+                        best, bestKey = score, key
+                if bestKey is not None and best >= self.similarity:
+                    self.entries.move_to_end(bestKey)
+                    self.counters["near_hits"] += 1
+                    return self.entries[bestKey][1]
+
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, question: str, scope: str, answer: str) -> None:
+        norm = normalize_question(question)
+        if not norm or is_error_answer(answer):
+            return
+
+        with self.lock:
+            self.entries[(scope, norm)] = (time.monotonic() + self.ttl, answer, char_ngrams(norm, self.ngram))
+            self.entries.move_to_end((scope, norm))
+            self.counters["puts"] += 1
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def record(self, pieces: Iterable[str], question: str, scope: str) -> Iterator[str]:
+        """透传流式回答的片段，正常结束后把完整回答放入缓存
+        流式过程中出错时，模型把错误提示作为一个片段返回（或者直接抛出异常），前面的部分回答也不缓存
+        """
+        answer, failed = "", False
+        for piece in pieces:
+            answer += piece
+            failed = failed or bool(piece) and is_error_answer(piece)
+            yield piece
+        if not failed:
+            self.put(question, scope, answer)
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.entries)
+        lookups = stats["exact_hits"] + stats["near_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["near_hits"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,83 @@
+import time
+import unittest
+
+from base.answer_cache import AnswerCache, normalize_question
+
+
+class NormalizeQuestionTestCase(unittest.TestCase):
+    def test_punctuation_and_width(self):
+        self.assertEqual(normalize_question("Ｈｅｌｌｏ，  World！"), "helloworld")
+        self.assertEqual(normalize_question("今天天气怎么样？"), normalize_question("今天天气怎么样"))
+
+    def test_operators_and_decimals_kept(self):
+        self.assertNotEqual(normalize_question("1+1"), normalize_question("1-1"))
+        self.assertNotEqual(normalize_question("1.5+2"), normalize_question("15+2"))
+        self.assertEqual(normalize_question("1.5+2=?"), "1.5+2=")
+        self.assertEqual(normalize_question("你好."), "你好")
+
+
+class AnswerCacheTestCase(unittest.TestCase):
+    def test_exact_hit_and_scope(self):
+        cache = AnswerCache()
+        cache.put("你好？", "gpt", "hi")
+
+        self.assertEqual(cache.get("你好", "gpt"), "hi")
+        self.assertIsNone(cache.get("你好", "glm"))
+
+    def test_expire(self):
+        cache = AnswerCache(ttl=0.05)
+        cache.put("q", "s", "a")
+        time.sleep(0.06)
+
+        self.assertIsNone(cache.get("q", "s"))
+
+    def test_error_answer_not_cached(self):
+        cache = AnswerCache()
+        cache.put("q", "s", "发生未知错误：boom")
+        cache.put("q2", "s", "")
+
+        self.assertEqual(cache.stats()["puts"], 0)
+
+    def test_near_match(self):
+        cache = AnswerCache(similarity=0.6)
+        cache.put("北京今天天气怎么样", "s", "晴")
+
+        self.assertEqual(cache.get("北京今天的天气怎么样", "s"), "晴")
+        self.assertIsNone(cache.get("上海明天下雨吗", "s"))
+
+    def test_record_stream(self):
+        cache = AnswerCache()
+        pieces = list(cache.record(iter(["你", "好"]), "q", "s"))
+
+        self.assertEqual(pieces, ["你", "好"])
+        self.assertEqual(cache.get("q", "s"), "你好")
+
+    def test_record_stream_with_error_piece(self):
+        cache = AnswerCache()
+        list(cache.record(iter(["部分回答", "发生未知错误：连接断开"]), "q", "s"))
+
+        self.assertIsNone(cache.get("q", "s"))
+
+    def test_record_stream_raised(self):
+        def broken():
+            yield "部分回答"
+            raise RuntimeError("boom")
+
+        cache = AnswerCache()
+        with self.assertRaises(RuntimeError):
+            list(cache.record(broken(), "q", "s"))
+        self.assertIsNone(cache.get("q", "s"))
+
+    def test_lru_eviction(self):
+        cache = AnswerCache(max_size=2)
+        cache.put("a", "s", "1")
+        cache.put("b", "s", "2")
+        cache.get("a", "s")
+        cache.put("c", "s", "3")
+
+        self.assertIsNone(cache.get("b", "s"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
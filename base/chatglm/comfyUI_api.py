@@ -1,41 +1,64 @@
-# This is an example that uses the websockets api to know when a prompt execution is done
-# Once the prompt execution is done it downloads the images using the /history endpoint
+# ComfyUI 客户端：通过 websocket 等待任务执行完，再用 /history 找到输出图片并下载
 
-import io
 import json
+import logging
 import random
-import urllib
+import time
+import urllib.parse
 import uuid
+from collections import OrderedDict
+from threading import Condition, Lock, Thread
 
-import requests
+from httptool import http_client
 # NOTE: websocket-client (https://github.com/websocket-client/websocket-client)
 import websocket
-from PIL import Image
 
 
 class ComfyUIApi():
-    def __init__(self, server_address="127.0.0.1:8188"):
+    """长期使用的 ComfyUI 客户端，整个进程共用一个
+    - 只保持一条 websocket 连接，后台线程接收消息，按 prompt_id 通知对应的请求，多个画图任务可以同时进行
+    - 连接断开后自动重连（指数退避），重连后用 /history 补查断线期间完成的任务
+    - 每张输出图片只下载一次，返回原始字节，不做解码再编码
+    """
+
+    def __init__(self, server_address="127.0.0.1:8188", reconnect_delay: float = 1, max_reconnect_delay: float = 30,
+                 poll_interval: float = 10) -> None:
+        """
+        :param server_address: ComfyUI 地址
+        :param reconnect_delay: 断线后第一次重连前等待的秒数，之后每次翻倍
+        :param max_reconnect_delay: 重连等待的上限
+        :param poll_interval: 等结果时每隔多少秒查一次 /history，防止漏掉完成消息
+        """
+        self.LOG = logging.getLogger("ComfyUIApi")
         self.server_address = server_address
+        # 重连时沿用同一个 client_id，ComfyUI 才会把已提交任务的消息发到新连接上
         self.client_id = str(uuid.uuid4())
-        self.ws = websocket.WebSocket()
-        self.ws.connect(
-            "ws://{}/ws?clientId={}".format(server_address, self.client_id))
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.poll_interval = poll_interval
+        self.ws = None
+        self.thread = None
+        self.running = True
+        self.pending = set()  # 等待完成的 prompt_id
+        # 最近完成的 prompt_id；完成消息可能比 /prompt 的响应先到，所以不管有没有人在等都记下来
+        self.finished = OrderedDict()
+        self.connections = 0  # 每次连上加一，等待的请求据此发现重连过
+        self.cond = Condition(Lock())
+        self.counters = {"prompts": 0, "completed": 0, "timeouts": 0, "reconnects": 0, "images": 0,
+                         "image_bytes": 0}
 
     def queue_prompt(self, prompt):
         p = {"prompt": prompt, "client_id": self.client_id}
         data = json.dumps(p).encode('utf-8')
-        req = requests.post(
+        req = http_client.post(
             "http://{}/prompt".format(self.server_address), data=data)
-        print(req.text)
-        return json.loads(req.text)
+        req.raise_for_status()
+        return req.json()
 
-    def get_image(self, filename, subfolder, folder_type):
-        data = {"filename": filename,
-                "subfolder": subfolder, "type": folder_type}
-        url_values = urllib.parse.urlencode(data)
-        with requests.get("http://{}/view?{}".format(self.server_address, url_values)) as response:
-            image = Image.open(io.BytesIO(response.content))
-            return image
+    def get_image(self, filename, subfolder, folder_type) -> bytes:
+        with http_client.get(self.get_image_url(filename, subfolder, folder_type)) as response:
+            response.raise_for_status()
+            return response.content
 
     def get_image_url(self, filename, subfolder, folder_type):
         data = {"filename": filename,
@@ -44,36 +67,124 @@ class ComfyUIApi():
         return "http://{}/view?{}".format(self.server_address, url_values)
 
     def get_history(self, prompt_id):
-        with requests.get("http://{}/history/{}".format(self.server_address, prompt_id)) as response:
+        with http_client.get("http://{}/history/{}".format(self.server_address, prompt_id)) as response:
             return json.loads(response.text)
 
-    def get_images(self, prompt, isUrl=False):
+    def get_images(self, prompt, isUrl=False, timeout: float = 300) -> list:
+        """提交工作流并等待执行完
+        :return: [{"filename", "subfolder", "type", "image"}]，image 为图片原始字节，isUrl 为 True 时为图片地址
+        """
+        self._start()
         prompt_id = self.queue_prompt(prompt)['prompt_id']
+        with self.cond:
+            self.counters["prompts"] += 1
+            self.pending.add(prompt_id)
+        try:
+            history = self._wait(prompt_id, timeout)
+        finally:
+            with self.cond:
+                self.pending.discard(prompt_id)
+                self.finished.pop(prompt_id, None)
+
         output_images = []
-        while True:
-            out = self.ws.recv()
-            if isinstance(out, str):
-                message = json.loads(out)
-                if message['type'] == 'executing':
-                    data = message['data']
-                    if data['node'] is None and data['prompt_id'] == prompt_id:
-                        break  # Execution is done
-            else:
-                continue  # previews are binary data
-
-        history = self.get_history(prompt_id)[prompt_id]
-        for o in history['outputs']:
-            for node_id in history['outputs']:
-                node_output = history['outputs'][node_id]
-                if 'images' in node_output:
-                    for image in node_output['images']:
-                        image_data = self.get_image_url(image['filename'], image['subfolder'], image['type']) if isUrl else self.get_image(
-                            image['filename'], image['subfolder'], image['type'])
-                        image['image'] = image_data
-                        output_images.append(image)
+        for node_output in history['outputs'].values():
+            for image in node_output.get('images', []):
+                if isUrl:
+                    image['image'] = self.get_image_url(image['filename'], image['subfolder'], image['type'])
+                else:
+                    image['image'] = self.get_image(image['filename'], image['subfolder'], image['type'])
+                    with self.cond:
+                        self.counters["images"] += 1
+                        self.counters["image_bytes"] += len(image['image'])
+                output_images.append(image)
 
         return output_images
 
+    def stats(self) -> dict:
+        with self.cond:
+            return dict(self.counters, pending=len(self.pending), connected=self.ws is not None)
+
+    def close(self) -> None:
+        self.running = False
+        ws = self.ws
+        if ws:
+            ws.close()
+
+    def _start(self) -> None:
+        """第一次画图时才连接，导入模块时不连"""
+        with self.cond:
+            if self.thread is None:
+                self.thread = Thread(target=self._run, name="ComfyUIApi", daemon=True)
+                self.thread.start()
+
+    def _wait(self, prompt_id: str, timeout: float) -> dict:
+        """等 websocket 的完成消息，每隔 poll_interval 秒也查一次 /history"""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.cond:
+                connections = self.connections
+                self.cond.wait_for(lambda: prompt_id in self.finished or self.connections != connections,
+                                   min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+            history = self.get_history(prompt_id).get(prompt_id)
+            if history:
+                with self.cond:
+                    self.counters["completed"] += 1
+                return history
+            if time.monotonic() >= deadline:
+                with self.cond:
+                    self.counters["timeouts"] += 1
+                raise TimeoutError(f"ComfyUI 任务 {prompt_id} 超过 {timeout}s 没有完成")
+
+    def _finish(self, prompt_id: str) -> None:
+        with self.cond:
+            self.finished[prompt_id] = time.monotonic()
+            while len(self.finished) > 1000:
+                self.finished.popitem(last=False)
+            self.cond.notify_all()
+
+    def _connect(self) -> None:
+        ws = websocket.WebSocket()
+        ws.connect("ws://{}/ws?clientId={}".format(self.server_address, self.client_id))
+        self.ws = ws
+
+    def _run(self) -> None:
+        delay = self.reconnect_delay
+        while self.running:
+            try:
+                self._connect()
+            except Exception as e:
+                self.LOG.warning(f"连接 ComfyUI 失败，{delay}s 后重试: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            delay = self.reconnect_delay
+            # 断线期间完成的任务收不到消息了，唤醒等待的请求去查 /history
+            with self.cond:
+                self.connections += 1
+                self.cond.notify_all()
+            try:
+                while self.running:
+                    out = self.ws.recv()
+                    if not isinstance(out, str):
+                        continue  # previews are binary data
+                    message = json.loads(out)
+                    if message['type'] == 'executing':
+                        data = message['data']
+                        if data['node'] is None:
+                            self._finish(data['prompt_id'])  # Execution is done
+            except Exception as e:
+                if self.running:
+                    self.LOG.warning(f"ComfyUI 连接断开，重连: {e}")
+                    with self.cond:
+                        self.counters["reconnects"] += 1
+            finally:
+                ws, self.ws = self.ws, None
+                try:
+                    ws.close()
+                except Exception:
+                    pass
+
 
 prompt_text = """
 {
@@ -164,6 +275,10 @@ prompt_text = """
 }
 """
 if __name__ == '__main__':
+    import io
+
+    from PIL import Image
+
     prompt = json.loads(prompt_text)
     # set the text prompt for our positive CLIPTextEncode
     prompt["6"]["inputs"]["text"] = "masterpiece best quality man"
@@ -177,10 +292,5 @@ if __name__ == '__main__':
 
     # Commented out code to display the output images:
 
-    for node_id in images:
-        for image_data in images[node_id]:
-            import io
-
-            from PIL import Image
-            image = Image.open(io.BytesIO(image_data))
-            image.show()
+    for image in images:
+        Image.open(io.BytesIO(image['image'])).show()
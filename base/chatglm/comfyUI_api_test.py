@@ -0,0 +1,198 @@
+import json
+import queue
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from base.chatglm.comfyUI_api import ComfyUIApi
+
+
+class Handler(BaseHTTPRequestHandler):
+    """假的 ComfyUI：/prompt 分配 prompt_id，done 里的任务在 /history 里有输出图片"""
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with server.lock:
+            server.count += 1
+            prompt_id = f"p{server.count}"
+        if server.on_prompt:
+            server.on_prompt(prompt_id)
+        self.reply(json.dumps({"prompt_id": prompt_id}).encode())
+
+    def do_GET(self):
+        server = self.server
+        if self.path.startswith("/history/"):
+            prompt_id = self.path.split("/")[-1]
+            history = {}
+            if prompt_id in server.done:
+                images = [{"filename": f"{prompt_id}.png", "subfolder": "", "type": "output"}]
+                history = {prompt_id: {"outputs": {"9": {"images": images}}}}
+            self.reply(json.dumps(history).encode())
+        else:
+            self.reply(b"image:" + self.path.encode())
+
+    def reply(self, body):
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeWebSocket(object):
+    """recv 从队列里取消息，放入异常表示连接断开"""
+
+    def __init__(self) -> None:
+        self.messages = queue.Queue()
+
+    def recv(self):
+        message = self.messages.get()
+        if isinstance(message, Exception):
+            raise message
+        return message
+
+    def finish(self, prompt_id):
+        self.messages.put(json.dumps({"type": "executing", "data": {"node": None, "prompt_id": prompt_id}}))
+
+    def close(self):
+        self.messages.put(ConnectionError("closed"))
+
+
+class FakeComfyUIApi(ComfyUIApi):
+    def __init__(self, *args, fail_connects=0, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.fail_connects = fail_connects
+        self.sockets = []
+        self.connected = threading.Event()
+
+    def _connect(self) -> None:
+        if self.fail_connects:
+            self.fail_connects -= 1
+            raise ConnectionRefusedError("refused")
+        self.ws = FakeWebSocket()
+        self.sockets.append(self.ws)
+        self.connected.set()
+
+
+class ComfyUIApiTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.address = f"127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.count = 0
+        self.server.done = set()
+        self.server.on_prompt = None
+
+    def make(self, **kwargs):
+        kwargs = dict({"reconnect_delay": 0.01, "poll_interval": 10}, **kwargs)
+        api = FakeComfyUIApi(self.address, **kwargs)
+        self.addCleanup(api.close)
+        return api
+
+    def run_async(self, api, **kwargs):
+        result = {}
+
+        def run():
+            try:
+                result["images"] = api.get_images({}, **kwargs)
+            except Exception as e:
+                result["error"] = e
+
+        t = threading.Thread(target=run, daemon=True)
+        t.start()
+        return t, result
+
+    def wait_pending(self, api, n):
+        deadline = time.monotonic() + 2
+        while api.stats()["pending"] < n:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+        self.assertTrue(api.connected.wait(1))
+
+    def test_route_by_prompt_id(self):
+        api = self.make()
+        first, r1 = self.run_async(api)
+        self.wait_pending(api, 1)
+        second, r2 = self.run_async(api)
+        self.wait_pending(api, 2)
+
+        # 后提交的任务先完成，只唤醒对应的请求
+        self.server.done.add("p2")
+        api.ws.finish("p2")
+        second.join(2)
+        self.assertTrue(first.is_alive())
+        self.assertEqual([i["image"] for i in r2["images"]], [b"image:/view?filename=p2.png&subfolder=&type=output"])
+
+        self.server.done.add("p1")
+        api.ws.finish("p1")
+        first.join(2)
+        self.assertEqual(r1["images"][0]["filename"], "p1.png")
+        stats = api.stats()
+        self.assertEqual((stats["prompts"], stats["completed"], stats["images"], stats["pending"]), (2, 2, 2, 0))
+        # 一直用同一条连接
+        self.assertEqual(len(api.sockets), 1)
+
+    def test_finished_before_prompt_response(self):
+        api = self.make()
+        api._start()
+        self.assertTrue(api.connected.wait(1))
+
+        def finish_early(prompt_id):
+            self.server.done.add(prompt_id)
+            api.ws.finish(prompt_id)
+            time.sleep(0.05)  # 让完成消息先于 /prompt 的响应处理
+
+        self.server.on_prompt = finish_early
+        start = time.monotonic()
+        images = api.get_images({}, isUrl=True)
+
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(images[0]["image"], api.get_image_url("p1.png", "", "output"))
+
+    def test_reconnect_checks_history(self):
+        api = self.make()
+        t, result = self.run_async(api)
+        self.wait_pending(api, 1)
+
+        # 断线期间任务完成，收不到完成消息
+        self.server.done.add("p1")
+        api.ws.messages.put(ConnectionResetError("reset"))
+        t.join(2)
+
+        self.assertEqual(result["images"][0]["filename"], "p1.png")
+        self.assertEqual(len(api.sockets), 2)
+        self.assertEqual(api.stats()["reconnects"], 1)
+
+    def test_connect_retry(self):
+        api = self.make(fail_connects=2)
+        api._start()
+
+        self.assertTrue(api.connected.wait(1))
+        self.assertTrue(api.stats()["connected"])
+
+    def test_timeout(self):
+        api = self.make(poll_interval=0.05)
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            api.get_images({}, timeout=0.2)
+
+        self.assertLess(time.monotonic() - start, 1)
+        stats = api.stats()
+        self.assertEqual((stats["timeouts"], stats["pending"]), (1, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
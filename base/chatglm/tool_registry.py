@@ -1,19 +1,25 @@
-import inspect
+import copy
 import json
+import os
 import random
 import re
-import traceback
-from copy import deepcopy
 from datetime import datetime
-from types import GenericAlias
-from typing import Annotated, get_origin
+from typing import Annotated
 
 from base.chatglm.comfyUI_api import ComfyUIApi
 from base.func_news import News
+from base.tool_registry import dispatch_tool, get_tools, register_tool
+from cachetool import TTLCache
+from httptool import http_client
 from zhdate import ZhDate
 
-_TOOL_HOOKS = {}
-_TOOL_DESCRIPTIONS = {}
+# ChatGLM 工具模式可以使用的工具
+CHATGLM_TOOLS = ("get_weather", "get_confyui_image", "get_news", "get_time")
+_WEATHER_CACHE = TTLCache(max_size=256, ttl=10 * 60)
+# 整个进程共用一个 ComfyUI 连接，第一次画图时才连接
+_COMFYUI = ComfyUIApi(server_address="127.0.0.1:8188")  # 根据自己comfyUI地址修改
+_COMFYUI_WORKFLOW = os.path.join(os.path.dirname(os.path.abspath(__file__)), "base.json")
+_comfyui_template = None
 
 
 def extract_code(text: str) -> str:
@@ -21,60 +27,6 @@ def extract_code(text: str) -> str:
     matches = re.findall(pattern, text, re.DOTALL)
     return matches[-1][1]
 
-
-def register_tool(func: callable):
-    tool_name = func.__name__
-    tool_description = inspect.getdoc(func).strip()
-    python_params = inspect.signature(func).parameters
-    tool_params = []
-    for name, param in python_params.items():
-        annotation = param.annotation
-        if annotation is inspect.Parameter.empty:
-            raise TypeError(f"Parameter `{name}` missing type annotation")
-        if get_origin(annotation) != Annotated:
-            raise TypeError(
-                f"Annotation type for `{name}` must be typing.Annotated")
-
-        typ, (description, required) = annotation.__origin__, annotation.__metadata__
-        typ: str = str(typ) if isinstance(typ, GenericAlias) else typ.__name__
-        if not isinstance(description, str):
-            raise TypeError(f"Description for `{name}` must be a string")
-        if not isinstance(required, bool):
-            raise TypeError(f"Required for `{name}` must be a bool")
-
-        tool_params.append({
-            "name": name,
-            "description": description,
-            "type": typ,
-            "required": required
-        })
-    tool_def = {
-        "name": tool_name,
-        "description": tool_description,
-        "params": tool_params
-    }
-
-    # print("[registered tool] " + pformat(tool_def))
-    _TOOL_HOOKS[tool_name] = func
-    _TOOL_DESCRIPTIONS[tool_name] = tool_def
-
-    return func
-
-
-def dispatch_tool(tool_name: str, tool_params: dict) -> str:
-    if tool_name not in _TOOL_HOOKS:
-        return f"Tool `{tool_name}` not found. Please use a provided tool."
-    tool_call = _TOOL_HOOKS[tool_name]
-    try:
-        ret = tool_call(**tool_params)
-    except BaseException:
-        ret = traceback.format_exc()
-    return ret
-
-
-def get_tools() -> dict:
-    return deepcopy(_TOOL_DESCRIPTIONS)
-
 # Tool Definitions
 
 # @register_tool
@@ -109,13 +61,17 @@ def get_weather(
     key_selection = {
         "current_condition": ["temp_C", "FeelsLikeC", "humidity", "weatherDesc", "observation_time"],
     }
-    import requests
-    try:
-        resp = requests.get(f"https://wttr.in/{city_name}?format=j1")
+
+    def fetch():
+        resp = http_client.get(f"https://wttr.in/{city_name}?format=j1")
         resp.raise_for_status()
         resp = resp.json()
-        ret = {k: {_v: resp[k][0][_v] for _v in v}
-               for k, v in key_selection.items()}
+        return {k: {_v: resp[k][0][_v] for _v in v}
+                for k, v in key_selection.items()}
+
+    try:
+        # 同一城市十分钟内只查一次，并发的相同查询只发一个请求
+        ret = _WEATHER_CACHE.get_or_load(city_name.strip().lower(), fetch)
     except BaseException:
         import traceback
         ret = "Error encountered while fetching weather data!\n" + traceback.format_exc()
@@ -128,17 +84,21 @@ def get_confyui_image(prompt: Annotated[str, '要生成图片的提示词,注意
     '''
     生成图片
     '''
-    with open("chatglm\\base.json", "r", encoding="utf-8") as f:
-        data2 = json.load(f)
-        data2['prompt']['3']['inputs']['seed'] = ''.join(
-            random.sample('123456789012345678901234567890', 14))
-        # 模型名称
-        data2['prompt']['4']['inputs']['ckpt_name'] = 'chilloutmix_NiPrunedFp32Fix.safetensors'
-        data2['prompt']['6']['inputs']['text'] = prompt  # 正向提示词
-        # data2['prompt']['7']['inputs']['text']=''         #反向提示词
-        cfui = ComfyUIApi(server_address="127.0.0.1:8188")  # 根据自己comfyUI地址修改
-        images = cfui.get_images(data2['prompt'])
-        return {'res': images[0]['image'], 'res_type': 'image', 'filename': images[0]['filename']}
+    global _comfyui_template
+    if _comfyui_template is None:
+        # 工作流模板只读一次，每次画图复制一份再改
+        with open(_COMFYUI_WORKFLOW, "r", encoding="utf-8") as f:
+            _comfyui_template = json.load(f)
+    data2 = copy.deepcopy(_comfyui_template)
+    data2['prompt']['3']['inputs']['seed'] = ''.join(
+        random.sample('123456789012345678901234567890', 14))
+    # 模型名称
+    data2['prompt']['4']['inputs']['ckpt_name'] = 'chilloutmix_NiPrunedFp32Fix.safetensors'
+    data2['prompt']['6']['inputs']['text'] = prompt  # 正向提示词
+    # data2['prompt']['7']['inputs']['text']=''         #反向提示词
+    images = _COMFYUI.get_images(data2['prompt'])
+    # res 为图片的原始字节
+    return {'res': images[0]['image'], 'res_type': 'image', 'filename': images[0]['filename']}
 
 
 @register_tool
@@ -164,4 +124,4 @@ def get_time() -> str:
 
 if __name__ == "__main__":
     print(dispatch_tool("get_weather", {"city_name": "beijing"}))
-    print(get_tools())
+    print(get_tools(CHATGLM_TOOLS))
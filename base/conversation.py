@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+from collections import OrderedDict, deque
+from hashlib import md5
+from threading import Lock
+from typing import Hashable, Optional
+
+
+def message_size(message) -> int:
+    """估算一条消息占用的字节数，用于内存预算"""
+    if isinstance(message, dict):
+        return sum(len(str(v).encode()) for v in message.values()) + 16
+    return len(str(message).encode()) + 16
+
+
+def message_role(message) -> str:
+    if isinstance(message, dict):
+        return message.get("role", "")
+    return getattr(message, "role", "")
+
+
+class Conversation(object):
+    """一个会话的历史消息，不包含系统提示。deque 保证追加和裁剪都是 O(1)"""
+    __slots__ = ("messages", "sizes", "nbytes")
+
+    def __init__(self) -> None:
+        self.messages = deque()
+        self.sizes = deque()
+        self.nbytes = 0
+
+    def append(self, message) -> None:
+        size = message_size(message)
+        self.messages.append(message)
+        self.sizes.append(size)
+        self.nbytes += size
+
+    def popleft(self) -> None:
+        self.messages.popleft()
+        self.nbytes -= self.sizes.popleft()
+
+    def trim(self, max_history: int) -> None:
+        while len(self.messages) > max_history:
+            self.popleft()
+        # 工具调用结果不能脱离发起调用的那条 assistant 消息单独存在
+        while self.messages and message_role(self.messages[0]) in ("tool", "function"):
+            self.popleft()
+
+
+class ConversationStore(object):
+    """会话存储
+    - 每个会话最多保留 max_history 条历史
+    - 全局按会话数和总字节数做 LRU 淘汰，长时间不说话的会话会被淘汰
+    - 系统提示不存进会话，取消息时由调用方传入同一份，所有会话共享
+    - 配置了 spill_dir 时，被淘汰的会话写到磁盘，再次说话时读回来
+    """
+
+    def __init__(self, max_history: int = 50, max_conversations: int = 1000, max_bytes: int = 50 * 1024 * 1024,
+                 spill_dir: Optional[str] = None) -> None:
+        self.LOG = logging.getLogger("ConversationStore")
+        self.max_history = max(1, max_history)
+        self.max_conversations = max(1, max_conversations)
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        if spill_dir and not os.path.exists(spill_dir):
+            os.makedirs(spill_dir)
+        self.conversations = OrderedDict()  # key -> Conversation，按最近使用排序
+        self.nbytes = 0
+        self.lock = Lock()
+        self.counters = {"evicted": 0, "spilled": 0, "restored": 0}
+
+    @classmethod
+    def from_config(cls, conf: dict, max_history: int) -> "ConversationStore":
+        conf = conf or {}
+        return cls(max_history=conf.get("max_history", max_history),
+                   max_conversations=conf.get("max_conversations", 1000),
+                   max_bytes=int(conf.get("max_memory_mb", 50) * 1024 * 1024),
+                   spill_dir=conf.get("spill_dir"))
+
+    def append(self, key: Hashable, message) -> None:
+        """追加一条消息，超过 max_history 时从最旧的开始裁剪"""
+        with self.lock:
+            conv = self._get(key)
+            self.nbytes -= conv.nbytes
+            conv.append(message)
+            conv.trim(self.max_history)
+            self.nbytes += conv.nbytes
+            self._evict()
+
+    def messages(self, key: Hashable, system: Optional[list] = None) -> list:
+        """系统提示 + 历史消息，返回新列表，调用方可以随意修改"""
+        with self.lock:
+            conv = self._get(key)
+            self._evict()
+            return list(system or []) + list(conv.messages)
+
+    def clear(self, key: Hashable) -> None:
+        with self.lock:
+            conv = self.conversations.pop(key, None)
+            if conv:
+                self.nbytes -= conv.nbytes
+            path = self._spill_path(key)
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self.lock:
+            return key in self.conversations
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats["conversations"] = len(self.conversations)
+            stats["bytes"] = self.nbytes
+            return stats
+
+    def _get(self, key: Hashable) -> Conversation:
+        conv = self.conversations.get(key)
+        if conv is None:
+            conv = self._restore(key) or Conversation()
+            self.conversations[key] = conv
+            self.nbytes += conv.nbytes
+        self.conversations.move_to_end(key)
+        return conv
+
+    def _evict(self) -> None:
+        # 至少保留刚使用的那个会话
+        while len(self.conversations) > 1 and (len(self.conversations) > self.max_conversations
+                                               or self.nbytes > self.max_bytes):
+            key, conv = self.conversations.popitem(last=False)
+            self.nbytes -= conv.nbytes
+            self.counters["evicted"] += 1
+            self._spill(key, conv)
+
+    def _spill_path(self, key: Hashable) -> Optional[str]:
+        if not self.spill_dir:
+            return None
+        return os.path.join(self.spill_dir, md5(repr(key).encode()).hexdigest() + ".json")
+
+    def _spill(self, key: Hashable, conv: Conversation) -> None:
+        path = self._spill_path(key)
+        if not path or not conv.messages:
+            return
+        try:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(list(conv.messages), f, ensure_ascii=False, default=str)
+            self.counters["spilled"] += 1
+        except Exception as e:
+            self.LOG.error(f"Spill conversation {key} error: {e}")
+
+    def _restore(self, key: Hashable) -> Optional[Conversation]:
+        path = self._spill_path(key)
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                messages = json.load(f)
+            os.remove(path)
+        except Exception as e:
+            self.LOG.error(f"Restore conversation {key} error: {e}")
+            return None
+
+        conv = Conversation()
+        for message in messages:
+            conv.append(message)
+        conv.trim(self.max_history)
+        self.counters["restored"] += 1
+        return conv
@@ -0,0 +1,88 @@
+import os
+import tempfile
+import unittest
+
+from base.conversation import ConversationStore
+
+
+def msg(role, content):
+    return {"role": role, "content": content}
+
+
+class ConversationStoreTestCase(unittest.TestCase):
+    def test_history_trimmed(self):
+        store = ConversationStore(max_history=3)
+        for i in range(5):
+            store.append("a", msg("user", str(i)))
+
+        system = [msg("system", "prompt")]
+        self.assertEqual([m["content"] for m in store.messages("a", system)], ["prompt", "2", "3", "4"])
+
+    def test_trim_drops_orphan_tool_results(self):
+        store = ConversationStore(max_history=2)
+        store.append("a", msg("assistant", "call"))
+        store.append("a", msg("tool", "result"))
+        store.append("a", msg("tool", "result2"))
+
+        # 发起调用的 assistant 消息被裁掉后，工具结果也一起丢弃
+        self.assertEqual(store.messages("a"), [])
+
+    def test_lru_by_count(self):
+        store = ConversationStore(max_conversations=2)
+        store.append("a", msg("user", "1"))
+        store.append("b", msg("user", "1"))
+        store.messages("a")  # a 最近使用过，应该淘汰 b
+        store.append("c", msg("user", "1"))
+
+        self.assertIn("a", store)
+        self.assertNotIn("b", store)
+        self.assertEqual(store.stats()["evicted"], 1)
+
+    def test_lru_by_bytes(self):
+        store = ConversationStore(max_bytes=300)
+        store.append("a", msg("user", "x" * 200))
+        store.append("b", msg("user", "y" * 200))
+
+        self.assertNotIn("a", store)
+        self.assertLessEqual(store.stats()["bytes"], 300)
+
+    def test_spill_and_reload(self):
+        with tempfile.TemporaryDirectory() as d:
+            store = ConversationStore(max_history=10, max_conversations=1, spill_dir=d)
+            store.append("a", msg("user", "你好"))
+            store.append("a", msg("assistant", "hi"))
+            store.append("b", msg("user", "1"))  # a 被淘汰写到磁盘
+            self.assertNotIn("a", store)
+            self.assertEqual(len(os.listdir(d)), 1)
+
+            self.assertEqual([m["content"] for m in store.messages("a")], ["你好", "hi"])
+            stats = store.stats()
+            self.assertEqual((stats["spilled"], stats["restored"]), (2, 1))
+            # 读回来之后删除磁盘上的文件，b 被淘汰写到磁盘
+            self.assertEqual(len(os.listdir(d)), 1)
+
+    def test_reload_trims_to_current_limit(self):
+        with tempfile.TemporaryDirectory() as d:
+            store = ConversationStore(max_history=10, max_conversations=1, spill_dir=d)
+            for i in range(5):
+                store.append("a", msg("user", str(i)))
+            store.append("b", msg("user", "1"))
+
+            smaller = ConversationStore(max_history=2, spill_dir=d)
+            self.assertEqual([m["content"] for m in smaller.messages("a")], ["3", "4"])
+
+    def test_clear_removes_spilled(self):
+        with tempfile.TemporaryDirectory() as d:
+            store = ConversationStore(max_conversations=1, spill_dir=d)
+            store.append("a", msg("user", "1"))
+            store.append("b", msg("user", "1"))
+            store.clear("a")
+            store.clear("b")
+
+            self.assertEqual(os.listdir(d), [])
+            self.assertEqual(store.messages("a"), [])
+            self.assertEqual(store.stats()["bytes"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
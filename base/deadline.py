@@ -0,0 +1,71 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from collections import Counter
+from threading import Lock
+from typing import Optional
+
+# 超出时间预算时给用户的回复，以“请求超时”开头，不会被当成正常回答缓存
+TIMEOUT_REPLY = "请求超时，请稍后再试"
+
+
+class DeadlineStats(object):
+    """各阶段因为超出时间预算被取消或降级的次数"""
+
+    def __init__(self) -> None:
+        self.misses = Counter()
+        self.lock = Lock()
+
+    def miss(self, stage: str) -> None:
+        with self.lock:
+            self.misses[stage] += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.misses)
+
+
+deadline_stats = DeadlineStats()
+
+
+class Deadline(object):
+    """一条消息从收到到回复完的时间预算，沿着处理链路往下传
+    每个阶段开始前用 check() 判断剩余时间，网络请求用 timeout() 作为超时
+    budget 为 0 或空表示不限时
+    """
+
+    def __init__(self, budget: float = None) -> None:
+        self.budget = budget
+        self.expires = time.monotonic() + budget if budget else None
+        self.missed = set()
+
+    def __repr__(self):
+        return f"Deadline({self.remaining():.1f}s left)" if self.expires else "Deadline(unlimited)"
+
+    def remaining(self) -> float:
+        if self.expires is None:
+            return float("inf")
+        return max(0.0, self.expires - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, default: float = None) -> Optional[float]:
+        """本阶段的超时：default 和剩余时间中较小的一个，都没有时返回 None"""
+        if self.expires is None:
+            return default
+        return self.remaining() if default is None else min(default, self.remaining())
+
+    def check(self, stage: str, reserve: float = 0) -> bool:
+        """剩余时间是否足够执行 stage（至少 reserve 秒），不够时记一次超时"""
+        if self.remaining() > reserve:
+            return True
+        self.miss(stage)
+        return False
+
+    def miss(self, stage: str) -> None:
+        """记录 stage 超时，同一条消息的同一阶段只记一次"""
+        if stage not in self.missed:
+            self.missed.add(stage)
+            deadline_stats.miss(stage)
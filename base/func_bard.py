@@ -4,6 +4,8 @@
 import os
 import google.generativeai as genai
 
+from base.deadline import Deadline
+
 
 class BardAssistant:
     def __init__(self, conf: dict) -> None:
@@ -25,7 +27,8 @@ class BardAssistant:
                 return True
         return False
 
-    def get_answer(self, msg: str, sender: str = None) -> str:
+    def get_answer(self, msg: str, sender: str = None, deadline: Deadline = None) -> str:
+        # SDK 不支持设置超时，deadline 只为和其他模型保持同样的接口
         response = self._bard.generate_content([{'role': 'user', 'parts': [msg]}])
         return response.text
 
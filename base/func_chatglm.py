@@ -2,29 +2,38 @@
 # -*- coding: utf-8 -*-
 
 import json
+import logging
 import os
 import random
 from datetime import datetime
-from typing import Optional
+from hashlib import md5
+from typing import Iterator, Optional
 
 import openai
 from base.chatglm.code_kernel import CodeKernel, execute
-from base.chatglm.tool_registry import dispatch_tool, extract_code, get_tools
+from base.chatglm.tool_registry import CHATGLM_TOOLS, dispatch_tool, extract_code, get_tools
+from base.conversation import ConversationStore
+from base.deadline import TIMEOUT_REPLY, Deadline
+from base.media_store import media_store
+from base.token_budget import ContextBuilder
 from wcferry import Wcf
 
-functions = get_tools()
+functions = get_tools(CHATGLM_TOOLS)
 
 
 class ChatGLM:
 
-    def __init__(self, config={}, wcf: Optional[Wcf] = None, max_retry=5) -> None:
+    def __init__(self, config={}, wcf: Optional[Wcf] = None, max_retry=5, store_conf: dict = None) -> None:
         openai.api_key = config.get("key", "empty")
         # 自己搭建或第三方代理的接口
         openai.api_base = config["api"]
         proxy = config.get("proxy")
         if proxy:
             openai.proxy = {"http": proxy, "https": proxy}
-        self.conversation_list = {}
+        # 按 (wxid, 模式) 存历史消息，系统提示在请求时拼上，所有会话共享同一份
+        self.conversations = ConversationStore.from_config(store_conf, max_history=10)
+        self.context = ContextBuilder.from_config(store_conf)
+        self.LOG = logging.getLogger("ChatGLM")
         self.chat_type = {}
         self.max_retry = max_retry
         self.wcf = wcf
@@ -44,8 +53,15 @@ class ChatGLM:
                 return True
         return False
 
-    def get_answer(self, question: str, wxid: str) -> str:
+    def cache_identity(self, wxid: str) -> Optional[str]:
+        """回答缓存的标识，只有聊天模式的回答可以缓存，工具模式和代码模式有副作用"""
+        if self.getChatType(wxid) != 'chat':
+            return None
+        return "ChatGLM:" + md5(self.system_content_msg['chat'][0]['content'].encode()).hexdigest()
+
+    def get_answer(self, question: str, wxid: str, deadline: Deadline = None) -> str:
         # wxid或者roomid,个人时为微信id，群消息时为群id
+        deadline = deadline or Deadline()
         if '#帮助' == question:
             return '本助手有三种模式，#聊天模式 = #1 ，#工具模式 = #2 ，#代码模式 = #3 , #清除模式会话 = #4 , #清除全部会话 = #5 可用发送#对应模式 或者 #编号 进行切换'
         elif '#聊天模式' == question or '#1' == question:
@@ -58,22 +74,28 @@ class ChatGLM:
             self.chat_type[wxid] = 'code'
             return '已切换#代码模式 \n代码模式可以用于写python代码，例如：\n用python画一个爱心'
         elif '#清除模式会话' == question or '#4' == question:
-            self.conversation_list[wxid][self.chat_type[wxid]
-                                         ] = self.system_content_msg[self.chat_type[wxid]]
+            self.conversations.clear((wxid, self.getChatType(wxid)))
             return '已清除'
         elif '#清除全部会话' == question or '#5' == question:
-            self.conversation_list[wxid] = self.system_content_msg
+            for chat_type in self.system_content_msg:
+                self.conversations.clear((wxid, chat_type))
             return '已清除'
 
         self.updateMessage(wxid, question, "user")
 
         try:
             params = dict(model="chatglm3", temperature=1.0,
-                          messages=self.conversation_list[wxid][self.chat_type[wxid]], stream=False)
-            if 'tool' == self.chat_type[wxid]:
+                          messages=self.getMessages(wxid), stream=False)
+            if 'tool' == self.getChatType(wxid):
                 params["functions"] = functions
-            response = openai.ChatCompletion.create(**params)
+            response = self.createCompletion(params, deadline)
             for _ in range(self.max_retry):
+                message = response.choices[0].message
+                if (message.get("function_call") or message.content.find('interpreter') != -1) \
+                        and not deadline.check("tools"):
+                    # 时间预算用完了，不再执行工具和代码
+                    rsp = TIMEOUT_REPLY
+                    break
                 if response.choices[0].message.get("function_call"):
                     function_call = response.choices[0].message.function_call
                     print(
@@ -89,7 +111,9 @@ class ChatGLM:
                         if res_type == 'image':
                             filename = observation['filename']
                             filePath = os.path.join(self.filePath, filename)
-                            res.save(filePath)
+                            with open(filePath, "wb") as f:
+                                f.write(res)
+                            media_store.add(filePath, "comfyui")
                             self.wcf and self.wcf.send_image(filePath, wxid)
                         tool_response = '[Image]' if res_type == 'image' else res
                     else:
@@ -97,16 +121,17 @@ class ChatGLM:
                             observation, str) else str(observation)
                     print(f"Tool Call Response: {tool_response}")
 
-                    params["messages"].append(response.choices[0].message)
-                    params["messages"].append(
+                    self.appendMessage(wxid, response.choices[0].message)
+                    self.appendMessage(
+                        wxid,
                         {
                             "role": "function",
                             "name": function_call.name,
                             "content": tool_response,  # 调用函数返回结果
                         }
                     )
-                    self.updateMessage(wxid, tool_response, "function")
-                    response = openai.ChatCompletion.create(**params)
+                    params["messages"] = self.getMessages(wxid)
+                    response = self.createCompletion(params, deadline)
                 elif response.choices[0].message.content.find('interpreter') != -1:
                     output_text = response.choices[0].message.content
                     code = extract_code(output_text)
@@ -122,51 +147,87 @@ class ChatGLM:
                             'abcdefghijklmnopqrstuvwxyz1234567890', 8)))
                         filePath = os.path.join(self.filePath, filename)
                         res.save(filePath)
+                        media_store.add(filePath, "plot")
                         self.wcf and self.wcf.send_image(filePath, wxid)
                     else:
                         self.wcf and self.wcf.send_text("执行结果:\n" + res, wxid)
                     tool_response = '[Image]' if res_type == 'image' else res
                     print("Received:", res_type, res)
-                    params["messages"].append(response.choices[0].message)
-                    params["messages"].append(
+                    self.appendMessage(wxid, response.choices[0].message)
+                    self.appendMessage(
+                        wxid,
                         {
                             "role": "function",
                             "name": "interpreter",
                             "content": tool_response,  # 调用函数返回结果
                         }
                     )
-                    self.updateMessage(wxid, tool_response, "function")
-                    response = openai.ChatCompletion.create(**params)
+                    params["messages"] = self.getMessages(wxid)
+                    response = self.createCompletion(params, deadline)
                 else:
                     rsp = response.choices[0].message.content
                     break
 
             self.updateMessage(wxid, rsp, "assistant")
         except Exception as e0:
-            rsp = "发生未知错误：" + str(e0)
+            if deadline.expired():
+                deadline.miss("llm")
+                rsp = TIMEOUT_REPLY
+            else:
+                rsp = "发生未知错误：" + str(e0)
 
         return rsp
 
-    def updateMessage(self, wxid: str, question: str, role: str) -> None:
-        now_time = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    @staticmethod
+    def createCompletion(params: dict, deadline: Deadline):
+        """请求超时不超过剩余的时间预算"""
+        timeout = deadline.timeout()
+        if timeout is not None:
+            params["request_timeout"] = timeout
+        return openai.ChatCompletion.create(**params)
+
+    def get_answer_stream(self, question: str, wxid: str, deadline: Deadline = None) -> Iterator[str]:
+        """流式回答，只有聊天模式支持；指令、工具模式和代码模式需要完整结果，仍然一次性返回"""
+        deadline = deadline or Deadline()
+        if question.startswith('#') or self.getChatType(wxid) != 'chat':
+            yield self.get_answer(question, wxid, deadline)
+            return
 
-        # 初始化聊天记录,组装系统信息
-        if wxid not in self.conversation_list.keys():
-            self.conversation_list[wxid] = self.system_content_msg
-        if wxid not in self.chat_type.keys():
-            self.chat_type[wxid] = 'chat'
+        self.updateMessage(wxid, question, "user")
+        rsp = ""
+        try:
+            response = self.createCompletion(dict(model="chatglm3", temperature=1.0,
+                                                  messages=self.getMessages(wxid), stream=True), deadline)
+            for chunk in response:
+                content = chunk.choices[0].delta.get("content")
+                if content:
+                    rsp += content
+                    yield content
+            self.updateMessage(wxid, rsp, "assistant")
+        except Exception as e0:
+            if deadline.expired():
+                deadline.miss("llm")
+                yield TIMEOUT_REPLY
+            else:
+                yield "发生未知错误：" + str(e0)
+
+    def getChatType(self, wxid: str) -> str:
+        return self.chat_type.setdefault(wxid, 'chat')
+
+    def getMessages(self, wxid: str) -> list:
+        """当前模式的系统提示 + 预算内的历史消息"""
+        chat_type = self.getChatType(wxid)
+        messages, tokens = self.context.build(self.system_content_msg[chat_type],
+                                              self.conversations.messages((wxid, chat_type)))
+        self.LOG.info(f"[{wxid}] prompt tokens: ~{tokens}, messages: {len(messages)}")
+        return messages
+
+    def appendMessage(self, wxid: str, message) -> None:
+        # 超过 max_history（默认 10 条）时从最旧的开始滚动清除
+        self.conversations.append((wxid, self.getChatType(wxid)), message)
 
-        # 当前问题
-        content_question_ = {"role": role, "content": question}
-        self.conversation_list[wxid][self.chat_type[wxid]].append(
-            content_question_)
-
-        # 只存储10条记录，超过滚动清除
-        i = len(self.conversation_list[wxid][self.chat_type[wxid]])
-        if i > 10:
-            print("滚动清除微信记录：" + wxid)
-            # 删除多余的记录，倒着删，且跳过第一个的系统消息
-            del self.conversation_list[wxid][self.chat_type[wxid]][1]
+    def updateMessage(self, wxid: str, question: str, role: str) -> None:
+        self.appendMessage(wxid, {"role": role, "content": question})
 
 
 if __name__ == "__main__":
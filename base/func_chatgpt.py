@@ -1,37 +1,101 @@
 #! /usr/bin/env python3
 # -*- coding: utf-8 -*-
 import json
+import logging
 import os
+import re
 import sys
+import tempfile
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
 from hashlib import md5
+from threading import Lock
+from typing import Annotated, Any, Callable, Iterator
 
 import httpx
 import openai
-import requests
 from openai import OpenAI
 
+from base.conversation import ConversationStore
+from base.deadline import TIMEOUT_REPLY, Deadline
+from base.key_pool import KeyPool, KeyPoolExhausted, parse_retry_after
+from base.token_budget import ContextBuilder, message_tokens
+from base.tool_registry import register_tool, registry
 from openapi import openapi
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from configuration import Config
+from base.media_store import media_store
+from httptool import media_downloader
+
+
+_openapi = openapi.OpenAPIHandler()
+# ChatGPT 可以使用的工具
+CHATGPT_TOOLS = ("weather", "search_movie")
+# 句子结束的位置，切分后标点留在句子末尾
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;\n])")
+
+
+def split_sentences(text: str, max_chars: int) -> list:
+    """按句子切分，相邻的短句合并成不超过 max_chars 的段；单句超长时单独成段"""
+    segments, current = [], ""
+    for sentence in _SENTENCE_END.split(text):
+        if current and len(current) + len(sentence) > max_chars:
+            segments.append(current)
+            current = ""
+        current += sentence
+    segments.append(current)
+    return [s for s in segments if s.strip()] or [text]
+
+
+@register_tool(timeout=10)
+def weather(city: Annotated[str, '城市名称', True]) -> dict:
+    """获取中国城市天气预报"""
+    return _openapi.weather(city)
+
+
+@register_tool(timeout=15)
+def search_movie(movie_name: Annotated[str, '影视名称', True]) -> list:
+    """搜索影视资源,返回电影资源标题和网盘链接"""
+    return _openapi.search_movie(movie_name)['data'][:3]
+
+
+class KeyPoolOpenAI(OpenAI):
+    """429 不在 SDK 里原地重试，交给 key 池冷却这个 key 再换 key；连接失败、5xx 等仍由 SDK 重试"""
+
+    def _should_retry(self, response: httpx.Response) -> bool:
+        if response.status_code == 429:
+            return False
+        return super()._should_retry(response)
 
 
 class ChatGPT:
+    TOOLS = registry.schemas("openai", CHATGPT_TOOLS)
+    TTS_MODEL, TTS_VOICE = "tts-1", "nova"
+    IMAGE_MODEL, IMAGE_SIZE = "dall-e-2", "512x512"
 
-    def __init__(self, conf: dict) -> None:
-        client = OpenAI(
-            api_key=conf["key"],
-            base_url=conf["api"],
-            http_client=httpx.Client(
-                proxies=conf["proxy"],
-            ),
-        )
-        self.openapi = openapi.OpenAPIHandler()
-        self.client = client
-        self.conversation_list = {}
+    def __init__(self, conf: dict, store_conf: dict = None) -> None:
+        self.LOG = logging.getLogger("ChatGPT")
+        # 可以配置多个 key，按限额轮流使用，被限流的 key 暂时跳过
+        maxRetries = conf.get("max_retries", 2)
+        self.keyPool = KeyPool.from_config(conf, lambda key, api, proxy: self.createClient(key, api, proxy, maxRetries))
+        self.reservedTokens = conf.get("reserved_tokens", 500)
+        # 只存历史消息，系统提示在请求时拼上，所有会话共享同一份
+        self.conversations = ConversationStore.from_config(store_conf, max_history=50)
+        # 按 token 预算裁剪历史，而不是按条数
+        self.context = ContextBuilder.from_config(store_conf)
         self.system_content_msg = {"role": "system", "content": conf["prompt"]}
+        # 一轮里的多个工具调用（例如查三个城市的天气）并发执行
+        self.toolExecutor = ThreadPoolExecutor(max_workers=conf.get("tool_workers", 4), thread_name_prefix="ChatGPTTool")
+        self.toolTimeout = conf.get("tool_timeout", 20)
+        # 语音按文本哈希缓存；长回复按句子切段并发合成，再按顺序拼成一个文件
+        self.ttsExecutor = ThreadPoolExecutor(max_workers=conf.get("tts_workers", 4), thread_name_prefix="ChatGPTTTS")
+        self.ttsSegmentChars = conf.get("tts_segment_chars", 200)
+        self.ttsCounters = {"hits": 0, "misses": 0, "failures": 0, "segment_hits": 0, "segments": 0, "seconds": 0.0}
+        self.ttsLock = Lock()
 
     def __repr__(self):
         return 'ChatGPT'
@@ -39,95 +103,55 @@ class ChatGPT:
     @staticmethod
     def value_check(conf: dict) -> bool:
         if conf:
-            if conf.get("key") and conf.get("api") and conf.get("prompt"):
+            if (conf.get("keys") or conf.get("key") and conf.get("api")) and conf.get("prompt"):
                 return True
         return False
 
-    def get_answer(self, question: str, wxid: str) -> str:
+    @staticmethod
+    def createClient(key: str, api: str, proxy: str, max_retries: int = 2) -> OpenAI:
+        return KeyPoolOpenAI(
+            api_key=key,
+            base_url=api,
+            http_client=httpx.Client(
+                proxies=proxy,
+            ),
+            max_retries=max_retries,
+        )
+
+    def cache_identity(self, wxid: str) -> str:
+        """回答缓存的标识，人设不同的回答不能混用"""
+        return "ChatGPT:" + md5(self.system_content_msg["content"].encode()).hexdigest()
+
+    def get_answer(self, question: str, wxid: str, deadline: Deadline = None) -> str:
         # wxid或者roomid,个人时为微信id，群消息时为群id
+        deadline = deadline or Deadline()
         self.updateMessage(wxid, question, "user")
         try:
-
-            tools = [
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "weather",
-                        "description": "获取中国城市天气预报",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "city": {
-                                    "type": "string",
-                                    "description": "城市名称",
-                                },
-                            },
-                            "required": ["city"],
-                        },
-                    },
-                },
-                {
-                    "type": "function",
-                    "function": {
-                        "name": "search_movie",
-                        "description": "搜索影视资源,返回电影资源标题和网盘链接",
-                        "parameters": {
-                            "type": "object",
-                            "properties": {
-                                "movie_name": {
-                                    "type": "string",
-                                    "description": "影视名称",
-                                },
-                            },
-                            "required": ["movie_name"],
-                        },
-                    },
-                }
-            ]
-            response = self.client.chat.completions.create(
+            response = self.createCompletion(
+                deadline,
                 model="gpt-3.5-turbo-1106",
-                messages=self.conversation_list[wxid],
-                tools=tools,
+                messages=self.getMessages(wxid),
+                tools=self.TOOLS,
                 tool_choice="auto",
             )
             response_message = response.choices[0].message
+            if response.usage:
+                self.LOG.info(f"[{wxid}] prompt tokens (api): {response.usage.prompt_tokens}")
             tool_calls = response_message.tool_calls
             # Step 2: check if the model wanted to call a function
-            if tool_calls:
+            if tool_calls and not deadline.check("tools"):
+                # 时间预算用完了，不再调用工具
+                rsp = response_message.content or TIMEOUT_REPLY
+            elif tool_calls:
                 # Step 3: call the function
-                # Note: the JSON response may not always be valid; be sure to handle errors
-                available_functions = {
-                    "weather": self.openapi.weather,
-                    "search_movie": self.openapi.search_movie,
-                }  # only one function in this example, but you can have multiple
-                self.conversation_list[wxid].append(response_message)  # extend conversation with assistant's reply
-                # Step 4: send the info for each function call and function response to the model
-
-                for tool_call in tool_calls:
-                    function_name = tool_call.function.name
-                    function_to_call = available_functions[function_name]
-                    function_args = json.loads(tool_call.function.arguments)
-                    if function_name == "weather":
-                        function_response = function_to_call(
-                            city=function_args.get("city"),
-                        )
-                    elif function_name == "search_movie":
-                        function_response = function_to_call(
-                            movie_name=function_args.get("movie_name"),
-                        )
-                        function_response = function_response['data'][:3]
-
-                    self.conversation_list[wxid].append(
-                        {
-                            "tool_call_id": tool_call.id,
-                            "role": "tool",
-                            "name": function_name,
-                            "content": json.dumps(function_response),
-                        }
-                    )  # extend conversation with function response
-                second_response = self.client.chat.completions.create(
+                self.runToolCalls(wxid, response_message.content, [tool_call.model_dump() for tool_call in tool_calls],
+                                  deadline)
+                if not deadline.check("llm_second"):
+                    return TIMEOUT_REPLY
+                second_response = self.createCompletion(
+                    deadline,
                     model="gpt-3.5-turbo-1106",
-                    messages=self.conversation_list[wxid],
+                    messages=self.getMessages(wxid),
                 )  # get a new response from the model where it can see the function response
                 print(second_response)
                 rsp = second_response.choices[0].message.content
@@ -139,97 +163,292 @@ class ChatGPT:
                 rsp = rsp.replace("\n\n", "\n")
 
             self.updateMessage(wxid, rsp, "assistant")
-        except openai.AuthenticationError as e3:
-            rsp = "OpenAI API 认证失败，请检查 API 密钥是否正确"
-        except openai.APIConnectionError as e2:
-            rsp = "无法连接到 OpenAI API，请检查网络连接"
-        except openai.APIError as e1:
-            rsp = "OpenAI API 返回了错误：" + str(e1)
-        except Exception as e0:
-            # 打印堆栈
-            print(traceback.print_exc())
-            rsp = "发生未知错误：" + str(e0)
+        except Exception as e:
+            rsp = self.errorReply(e, deadline, "llm")
 
         return rsp
 
-    def generateAudio(self, question: str) -> str:
-        """生成语音"""
-        response = self.client.audio.speech.create(
-            model="tts-1",
-            voice="nova",
-            input=question
-        )
-        today = datetime.now().strftime("%Y-%m-%d")
-        dirPath = os.path.join(os.path.join(os.getcwd(), "audio"), today)
-        if not os.path.exists(dirPath):
-            os.makedirs(dirPath)
-        fileName = md5(question.encode()).hexdigest() + ".mp3"
-        savePath = os.path.join(dirPath, fileName)
-        response.stream_to_file(savePath)
-        return savePath
-
-    def generateImage(self, question: str) -> str:
+    def get_answer_stream(self, question: str, wxid: str, deadline: Deadline = None) -> Iterator[str]:
+        """流式回答，模型每生成一段文本就返回一段，不等整个回答生成完"""
+        deadline = deadline or Deadline()
+        self.updateMessage(wxid, question, "user")
+        rsp = ""
+        try:
+            stream = self.createCompletion(
+                deadline,
+                model="gpt-3.5-turbo-1106",
+                messages=self.getMessages(wxid),
+                tools=self.TOOLS,
+                tool_choice="auto",
+                stream=True,
+            )
+            tool_calls = {}
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                # 工具调用是分片返回的，按 index 拼起来
+                for tc in delta.tool_calls or []:
+                    call = tool_calls.setdefault(tc.index, {"id": "", "type": "function",
+                                                            "function": {"name": "", "arguments": ""}})
+                    if tc.id:
+                        call["id"] = tc.id
+                    if tc.function and tc.function.name:
+                        call["function"]["name"] += tc.function.name
+                    if tc.function and tc.function.arguments:
+                        call["function"]["arguments"] += tc.function.arguments
+                if delta.content:
+                    rsp += delta.content
+                    yield delta.content
+
+            if tool_calls and deadline.check("tools"):
+                self.runToolCalls(wxid, rsp or None, [tool_calls[i] for i in sorted(tool_calls)], deadline)
+                if not deadline.check("llm_second"):
+                    yield TIMEOUT_REPLY
+                    return
+                stream = self.createCompletion(
+                    deadline,
+                    model="gpt-3.5-turbo-1106",
+                    messages=self.getMessages(wxid),
+                    stream=True,
+                )
+                for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        rsp += chunk.choices[0].delta.content
+                        yield chunk.choices[0].delta.content
+
+            elif tool_calls and not rsp:
+                yield TIMEOUT_REPLY
+                return
+
+            self.updateMessage(wxid, rsp, "assistant")
+        except Exception as e:
+            yield self.errorReply(e, deadline, "llm")
+
+    def withKey(self, fn: Callable[[OpenAI], Any], tokens: int = 0, deadline: Deadline = None):
+        """从 key 池取一个 key 调用 fn(client)，遇到 429 冷却这个 key 再重试
+        所有 key 都在冷却时等到有 key 可用，总的等待时间不超过 acquire_timeout 和剩余预算
+        :param tokens: 预估的 token 用量，用于 tpm 限速
+        :param deadline: 等待 key 的时间不超过剩余预算
+        """
+        deadline = deadline or Deadline()
+        wait = Deadline(self.keyPool.acquire_timeout)
+        while True:
+            timeout = deadline.timeout(wait.remaining())
+            if timeout <= 0:
+                raise KeyPoolExhausted("所有 key 都被限流")
+            key = self.keyPool.acquire(tokens, timeout)
+            try:
+                result = fn(key.client)
+            except openai.RateLimitError as e:
+                self.keyPool.release(key, tokens, 0)
+                self.keyPool.rate_limited(key, parse_retry_after(e.response.headers))
+                continue
+            except Exception:
+                self.keyPool.release(key, tokens, 0)
+                self.keyPool.failed(key)
+                raise
+            usage = getattr(result, "usage", None)
+            self.keyPool.release(key, tokens, usage.total_tokens if usage else None)
+            return result
+
+    def createCompletion(self, deadline: Deadline = None, **kwargs):
+        """对话补全请求，预估 token = 提示 + 预留的回答长度，请求超时不超过剩余预算"""
+        tokens = sum(message_tokens(m) for m in kwargs["messages"]) + self.reservedTokens
+        if deadline and deadline.timeout() is not None:
+            kwargs["timeout"] = deadline.timeout()
+        return self.withKey(lambda client: client.chat.completions.create(**kwargs), tokens, deadline)
+
+    def stats(self) -> dict:
+        with self.ttsLock:
+            tts = dict(self.ttsCounters)
+        lookups = tts["hits"] + tts["misses"]
+        tts["hit_rate"] = tts["hits"] / lookups if lookups else 0.0
+        tts["avg_seconds"] = tts["seconds"] / tts["misses"] if tts["misses"] else 0.0
+        return {"keys": self.keyPool.stats(), "tts": tts}
+
+    def runToolCalls(self, wxid: str, content: str, tool_calls: list, deadline: Deadline = None) -> None:
+        """并发执行模型要求的工具调用，按调用顺序把调用和结果写入会话
+        单个工具出错或超时不影响其他工具，结果里写明错误交给模型处理
+        :param content: 模型随工具调用一起返回的文本，一般为空
+        :param tool_calls: [{"id": ..., "type": "function", "function": {"name": ..., "arguments": ...}}]
+        :param deadline: 工具超时不超过剩余预算
+        """
+        deadline = deadline or Deadline()
+        # extend conversation with assistant's reply
+        self.conversations.append(wxid, {"role": "assistant", "content": content, "tool_calls": tool_calls})
+        # Step 4: send the info for each function call and function response to the model
+        futures = [(time.monotonic(), self.toolExecutor.submit(self.callTool, tool_call)) for tool_call in tool_calls]
+        for tool_call, (submitted, future) in zip(tool_calls, futures):
+            function_name = tool_call["function"]["name"]
+            timeout = deadline.timeout(registry.timeout(function_name, self.toolTimeout))
+            try:
+                function_response = future.result(timeout=max(0, submitted + timeout - time.monotonic()))
+            except FutureTimeoutError:
+                future.cancel()
+                if deadline.expired():
+                    deadline.miss("tools")
+                self.LOG.warning(f"Tool {function_name} timed out after {timeout}s")
+                function_response = {"error": f"工具 {function_name} 超时，请直接告诉用户暂时查不到"}
+            except Exception as e:
+                self.LOG.error(f"Tool {function_name} error: {e}")
+                function_response = {"error": f"工具 {function_name} 调用失败：{e}"}
+
+            self.conversations.append(
+                wxid,
+                {
+                    "tool_call_id": tool_call["id"],
+                    "role": "tool",
+                    "name": function_name,
+                    "content": json.dumps(function_response, ensure_ascii=False),
+                }
+            )  # extend conversation with function response
+
+    @staticmethod
+    def callTool(tool_call: dict):
+        """执行单个工具调用，在线程池里运行"""
+        # Note: the JSON response may not always be valid; be sure to handle errors
+        function_args = json.loads(tool_call["function"]["arguments"] or "{}")
+        return registry.call(tool_call["function"]["name"], function_args)
+
+    @staticmethod
+    def errorReply(e: Exception, deadline: Deadline = None, stage: str = "") -> str:
+        if deadline and deadline.expired():
+            deadline.miss(stage)
+            return TIMEOUT_REPLY
+        if isinstance(e, KeyPoolExhausted):
+            return "OpenAI API 请求太频繁，请稍后再试"
+        if isinstance(e, openai.AuthenticationError):
+            return "OpenAI API 认证失败，请检查 API 密钥是否正确"
+        if isinstance(e, openai.APIConnectionError):
+            return "无法连接到 OpenAI API，请检查网络连接"
+        if isinstance(e, openai.APIError):
+            return "OpenAI API 返回了错误：" + str(e)
+        # 打印堆栈
+        traceback.print_exc()
+        return "发生未知错误：" + str(e)
+
+    def generateAudio(self, question: str, deadline: Deadline = None) -> str:
+        """生成语音，同样的文本直接用之前生成的文件
+        长文本按句子切段并发合成（每段也按哈希缓存），再按顺序拼接成一个 mp3
+        """
+        deadline = deadline or Deadline()
+        dirPath = os.path.join(os.getcwd(), "audio", "tts")
+        os.makedirs(dirPath, exist_ok=True)
+        savePath = self.audioPath(dirPath, question)
+        if os.path.isfile(savePath) and os.path.getsize(savePath) > 0:
+            self.countTTS(hits=1)
+            return media_store.add(savePath, "tts")
+
+        start = time.monotonic()
+        segments = split_sentences(question, self.ttsSegmentChars)
+        try:
+            if len(segments) == 1:
+                self.synthesize(question, savePath, deadline)
+            else:
+                futures = [self.ttsExecutor.submit(self.synthesizeSegment, s, dirPath, deadline) for s in segments]
+                paths = [f.result(timeout=deadline.timeout()) for f in futures]
+                self.writeAtomically(savePath, lambda tmp: self.concatAudio(paths, tmp))
+        except Exception:
+            # 失败的合成也计入未命中和耗时，命中率和延迟才准确
+            self.countTTS(misses=1, failures=1, seconds=time.monotonic() - start)
+            raise
+        self.countTTS(misses=1, seconds=time.monotonic() - start)
+        self.LOG.info(f"语音合成 {len(question)} 字，{len(segments)} 段，耗时 {time.monotonic() - start:.2f}s")
+        return media_store.add(savePath, "tts")
+
+    def audioPath(self, dirPath: str, text: str) -> str:
+        key = f"{self.TTS_MODEL}:{self.TTS_VOICE}:{text}"
+        return os.path.join(dirPath, md5(key.encode()).hexdigest() + ".mp3")
+
+    def synthesizeSegment(self, text: str, dirPath: str, deadline: Deadline) -> str:
+        path = self.audioPath(dirPath, text)
+        if os.path.isfile(path) and os.path.getsize(path) > 0:
+            self.countTTS(segment_hits=1)
+        else:
+            self.synthesize(text, path, deadline)
+        return media_store.add(path, "tts")
+
+    def synthesize(self, text: str, savePath: str, deadline: Deadline) -> None:
+        """调用 TTS 接口，先写临时文件再改名，避免半个文件被当成缓存"""
+        timeout = deadline.timeout()
+        response = self.withKey(lambda client: client.audio.speech.create(
+            model=self.TTS_MODEL,
+            voice=self.TTS_VOICE,
+            input=text,
+            **({"timeout": timeout} if timeout is not None else {})
+        ), deadline=deadline)
+        self.writeAtomically(savePath, response.stream_to_file)
+        self.countTTS(segments=1)
+
+    @staticmethod
+    def concatAudio(paths: list, savePath: str) -> None:
+        # mp3 由独立的帧组成，按顺序首尾相接即可播放
+        with open(savePath, "wb") as out:
+            for p in paths:
+                with open(p, "rb") as f:
+                    out.write(f.read())
+
+    @staticmethod
+    def writeAtomically(savePath: str, write: Callable[[str], Any]) -> None:
+        """write 写到同目录下唯一的临时文件再改名，同一文本并发生成时互不干扰，也不会留下半个文件"""
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(savePath))
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, savePath)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def countTTS(self, **deltas) -> None:
+        with self.ttsLock:
+            for k, v in deltas.items():
+                self.ttsCounters[k] += v
+
+    def image_identity(self) -> str:
+        """画图结果缓存的标识，模型或尺寸变了不能复用"""
+        return f"ChatGPT:{self.IMAGE_MODEL}:{self.IMAGE_SIZE}"
+
+    def generateImage(self, question: str, deadline: Deadline = None) -> str:
         """生成图片"""
+        deadline = deadline or Deadline()
+        timeout = deadline.timeout()
         try:
-            response = self.client.images.generate(
-                model="dall-e-2",
+            response = self.withKey(lambda client: client.images.generate(
+                model=self.IMAGE_MODEL,
                 prompt=question,
-                size="512x512",
+                size=self.IMAGE_SIZE,
                 # size="1024x1024",
                 n=1,
                 # style="vivid"
-            )
+                **({"timeout": timeout} if timeout is not None else {})
+            ), deadline=deadline)
 
             image_url = response.data[0].url
             today = datetime.now().strftime("%Y-%m-%d")
             dirPath = os.path.join(os.path.join(os.getcwd(), "images"), today)
-            if not os.path.exists(dirPath):
-                os.makedirs(dirPath)
-            fileName = md5(question.encode()).hexdigest() + ".jpg"
-            savePath = os.path.join(dirPath, fileName)
-
-            response = requests.get(image_url)
-            if response.status_code == 200:
-                with open(savePath, 'wb') as file:
-                    file.write(response.content)
-                return savePath
-            else:
-                return ""
+            return media_store.add(media_downloader.download(image_url, dirPath, ".png",
+                                                             timeout=deadline.timeout(30)), "dalle")
         except Exception as e:
             print(e)
             return ""
 
-    def updateMessage(self, wxid: str, question: str, role: str) -> None:
+    def getMessages(self, wxid: str) -> list:
+        """系统提示 + 当前时间 + 预算内的历史消息"""
+        time_mk = "当需要回答时间时请直接参考回复:"
         now_time = str(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        system = [self.system_content_msg, {"role": "system", "content": time_mk + now_time}]
+        messages, tokens = self.context.build(system, self.conversations.messages(wxid))
+        self.LOG.info(f"[{wxid}] prompt tokens: ~{tokens}, messages: {len(messages)}")
+        return messages
 
-        time_mk = "当需要回答时间时请直接参考回复:"
-        # 初始化聊天记录,组装系统信息
-        if wxid not in self.conversation_list.keys():
-            question_ = [
-                self.system_content_msg,
-                {"role": "system", "content": "" + time_mk + now_time}
-            ]
-            self.conversation_list[wxid] = question_
-
-        # 当前问题
-        content_question_ = {"role": role, "content": question}
-        self.conversation_list[wxid].append(content_question_)
-
-        for cont in self.conversation_list[wxid]:
-            # 判断是否是字典
-            if not isinstance(cont, dict):
-                continue
-            if cont["role"] != "system":
-                continue
-            if cont["content"].startswith(time_mk):
-                cont["content"] = time_mk + now_time
-
-        # 只存储10条记录，超过滚动清除
-        i = len(self.conversation_list[wxid])
-        if i > 50:
-            print("滚动清除微信记录：" + wxid)
-            # 删除多余的记录，倒着删，且跳过第一个的系统消息
-            del self.conversation_list[wxid][1]
+    def updateMessage(self, wxid: str, question: str, role: str) -> None:
+        # 超过 max_history（默认 50 条）时从最旧的开始滚动清除
+        self.conversations.append(wxid, {"role": role, "content": question})
 
 
 if __name__ == "__main__":
@@ -0,0 +1,183 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from typing import Annotated
+from unittest import mock
+
+from base.deadline import Deadline
+from base.func_chatgpt import ChatGPT, split_sentences
+from base.tool_registry import ToolRegistry
+
+
+def make_chat(**conf):
+    # 本地不存在的地址，只构造客户端，不会发请求
+    return ChatGPT(dict({"key": "sk-test", "api": "http://127.0.0.1:9", "prompt": "你是机器人"}, **conf))
+
+
+class RunToolCallsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = ToolRegistry()
+        patcher = mock.patch("base.func_chatgpt.registry", self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.gate = threading.Event()
+        self.addCleanup(self.gate.set)
+
+        @self.registry.register
+        def echo(text: Annotated[str, '内容', True]) -> str:
+            """原样返回"""
+            time.sleep(0.05)
+            return text
+
+        @self.registry.register(timeout=0.1)
+        def hang() -> str:
+            """一直不返回"""
+            self.gate.wait(5)
+            return "late"
+
+        @self.registry.register
+        def fail() -> str:
+            """总是失败"""
+            raise ValueError("boom")
+
+        self.chat = make_chat(tool_timeout=1)
+        self.addCleanup(self.chat.toolExecutor.shutdown, wait=False)
+
+    @staticmethod
+    def call(i, name, **args):
+        return {"id": str(i), "type": "function", "function": {"name": name, "arguments": json.dumps(args)}}
+
+    def tool_messages(self, wxid):
+        return [m for m in self.chat.conversations.messages(wxid) if m["role"] == "tool"]
+
+    def test_results_in_call_order(self):
+        calls = [self.call(i, "echo", text=f"t{i}") for i in range(3)]
+        start = time.monotonic()
+        self.chat.runToolCalls("wxid", "", calls)
+
+        # 并发执行，总耗时接近单个工具的耗时
+        self.assertLess(time.monotonic() - start, 0.14)
+        messages = self.chat.conversations.messages("wxid")
+        self.assertEqual(messages[0]["tool_calls"], calls)
+        self.assertEqual([(m["tool_call_id"], json.loads(m["content"])) for m in self.tool_messages("wxid")],
+                         [("0", "t0"), ("1", "t1"), ("2", "t2")])
+
+    def test_slow_tool_timeout(self):
+        start = time.monotonic()
+        self.chat.runToolCalls("wxid", "", [self.call(0, "hang"), self.call(1, "echo", text="ok")])
+
+        # 用工具自己的超时，而不是默认的 tool_timeout
+        self.assertLess(time.monotonic() - start, 0.5)
+        hang, echo = self.tool_messages("wxid")
+        self.assertIn("超时", json.loads(hang["content"])["error"])
+        self.assertEqual(json.loads(echo["content"]), "ok")
+
+    def test_deadline_caps_timeout(self):
+        self.registry.tools["hang"].timeout = None
+        start = time.monotonic()
+        self.chat.runToolCalls("wxid", "", [self.call(0, "hang")], Deadline(0.1))
+
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertIn("超时", json.loads(self.tool_messages("wxid")[0]["content"])["error"])
+
+    def test_failing_tool(self):
+        self.chat.runToolCalls("wxid", "", [self.call(0, "fail"), self.call(1, "echo", text="ok")])
+
+        fail, echo = self.tool_messages("wxid")
+        self.assertIn("boom", json.loads(fail["content"])["error"])
+        self.assertEqual(json.loads(echo["content"]), "ok")
+
+
+class TTSCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        cwd = os.getcwd()
+        os.chdir(tmp.name)
+        self.addCleanup(os.chdir, cwd)
+        patcher = mock.patch("base.func_chatgpt.media_store")
+        patcher.start().add.side_effect = lambda path, kind: path
+        self.addCleanup(patcher.stop)
+
+        self.chat = make_chat(tts_segment_chars=10)
+        self.addCleanup(self.chat.ttsExecutor.shutdown, wait=False)
+        self.synthesized = []
+        self.chat.synthesize = self.fake_synthesize
+
+    def fake_synthesize(self, text, savePath, deadline):
+        """把文本当作音频内容写入，记录合成过的段"""
+        def write(tmp):
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(text)
+
+        self.synthesized.append(text)
+        self.chat.writeAtomically(savePath, write)
+        self.chat.countTTS(segments=1)
+
+    @staticmethod
+    def read(path):
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+
+    def test_split_sentences(self):
+        self.assertEqual(split_sentences("你好。今天天气不错！出去玩吗？", 10), ["你好。今天天气不错！", "出去玩吗？"])
+        # 单句超长时单独成段
+        self.assertEqual(split_sentences("短句。" + "长" * 20 + "。", 10), ["短句。", "长" * 20 + "。"])
+        self.assertEqual(split_sentences("没有标点", 10), ["没有标点"])
+        self.assertEqual(split_sentences("", 10), [""])
+
+    def test_cache_hit(self):
+        first = self.chat.generateAudio("你好。")
+        second = self.chat.generateAudio("你好。")
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.synthesized, ["你好。"])
+        counters = self.chat.ttsCounters
+        self.assertEqual((counters["hits"], counters["misses"]), (1, 1))
+
+    def test_long_text_segments(self):
+        text = "第一句话说完了。第二句话也说完。第三句。"
+        path = self.chat.generateAudio(text)
+
+        # 按顺序拼接
+        self.assertEqual(self.read(path), text)
+        self.assertEqual(sorted(self.synthesized), sorted(split_sentences(text, 10)))
+
+        # 共用的句子直接复用之前合成的段
+        self.synthesized.clear()
+        self.chat.generateAudio("第一句话说完了。另外一句。")
+        self.assertEqual(self.synthesized, ["另外一句。"])
+        self.assertEqual(self.chat.ttsCounters["segment_hits"], 1)
+
+    def test_failure_not_cached(self):
+        def fail(text, savePath, deadline):
+            raise RuntimeError("tts down")
+
+        self.chat.synthesize = fail
+        with self.assertRaises(RuntimeError):
+            self.chat.generateAudio("你好。")
+        self.assertEqual(self.chat.ttsCounters["failures"], 1)
+        self.assertEqual(os.listdir(os.path.join("audio", "tts")), [])
+
+        self.chat.synthesize = self.fake_synthesize
+        self.chat.generateAudio("你好。")
+        self.assertEqual(self.synthesized, ["你好。"])
+
+    def test_write_atomically_cleans_up(self):
+        path = os.path.join(os.getcwd(), "out.mp3")
+
+        def broken(tmp):
+            with open(tmp, "w") as f:
+                f.write("half")
+            raise IOError("disk full")
+
+        with self.assertRaises(IOError):
+            self.chat.writeAtomically(path, broken)
+        self.assertEqual(os.listdir(os.getcwd()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,8 +3,8 @@
 
 import logging
 
-import requests
-from random import randint
+from base.deadline import TIMEOUT_REPLY, Deadline
+from httptool import http_client
 
 
 class TigerBot:
@@ -13,7 +13,6 @@ class TigerBot:
         self.tburl = "https://api.tigerbot.com/bot-service/ai_service/gpt"
         self.tbheaders = {"Authorization": "Bearer " + tbconf["key"]}
         self.tbmodel = tbconf["model"]
-        self.fallback = ["滚", "快滚", "赶紧滚"]
 
     def __repr__(self):
         return 'TigerBot'
@@ -24,19 +23,26 @@ class TigerBot:
             return all(conf.values())
         return False
 
-    def get_answer(self, msg: str, sender: str = None) -> str:
+    def get_answer(self, msg: str, sender: str = None, deadline: Deadline = None) -> str:
+        deadline = deadline or Deadline()
         payload = {
             "text": msg,
             "modelVersion": self.tbmodel
         }
         rsp = ""
         try:
-            rsp = requests.post(self.tburl, headers=self.tbheaders, json=payload).json()
+            # 大模型生成较慢，读取超时放宽一些，但不超过剩余的时间预算
+            rsp = http_client.post(self.tburl, headers=self.tbheaders, json=payload,
+                                   timeout=(5, deadline.timeout(120))).json()
             rsp = rsp["data"]["result"][0]
         except Exception as e:
             self.LOG.error(f"{e}: {payload}\n{rsp}")
-            idx = randint(0, len(self.fallback) - 1)
-            rsp = self.fallback[idx]
+            # 出错时返回带错误前缀的提示，路由按失败处理并切换模型，回答缓存也不会保存
+            if deadline.expired():
+                deadline.miss("llm")
+                rsp = TIMEOUT_REPLY
+            else:
+                rsp = "发生未知错误：" + str(e)
 
         return rsp
 
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 from sparkdesk_web.core import SparkWeb
 
+from base.deadline import Deadline
+
 
 class XinghuoWeb:
     def __init__(self, xhconf=None) -> None:
@@ -25,7 +27,8 @@ class XinghuoWeb:
             return all(conf.values())
         return False
 
-    def get_answer(self, msg: str, sender: str = None) -> str:
+    def get_answer(self, msg: str, sender: str = None, deadline: Deadline = None) -> str:
+        # SDK 不支持设置超时，deadline 只为和其他模型保持同样的接口
         answer = self._chat.chat(msg)
         return answer
 
@@ -0,0 +1,128 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import md5
+from threading import Lock
+from typing import Callable, Tuple
+
+from base.deadline import Deadline
+from cachetool import TTLCache
+
+
+class ImageJobs(object):
+    """后台画图任务队列
+    画图请求提交后立即返回，由固定数量的线程生成图片，画好后通过 deliver 发给请求人；
+    结果按 (模型和参数, 提示词) 缓存，同样的提示词正在画时不会重复画，画好后一起发。
+    """
+    # submit 的结果
+    CACHED, STARTED, QUEUED, JOINED, REJECTED = "cached", "started", "queued", "joined", "rejected"
+
+    def __init__(self, chat, deliver: Callable[[str, str], None], workers: int = 2, max_queue: int = 20,
+                 timeout: float = 120, cache_size: int = 256, cache_ttl: float = 86400) -> None:
+        """
+        :param chat: 有 generateImage(prompt, deadline) 方法的模型，可选 image_identity() 返回模型和参数的标识
+        :param deliver: 发送结果 (接收人, 图片路径)，失败时路径为空
+        :param workers: 同时画图的数量
+        :param max_queue: 最多排队的任务数，超出时拒绝
+        :param timeout: 单张图片的时间预算，秒
+        :param cache_size: 最多缓存的结果数
+        :param cache_ttl: 结果缓存的时间，秒
+        """
+        self.LOG = logging.getLogger("ImageJobs")
+        self.chat = chat
+        self.deliver = deliver
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.workers = max(1, workers)
+        self.cache = TTLCache(cache_size, cache_ttl)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ImageJobs")
+        self.waiting = {}  # 缓存键 -> 等结果的接收人列表，同一提示词只画一次
+        self.queued = 0
+        self.running = 0
+        self.counters = {"submitted": 0, "cache_hits": 0, "coalesced": 0, "rejected": 0, "completed": 0,
+                         "failed": 0, "generate_seconds": 0.0, "wait_seconds": 0.0}
+        self.lock = Lock()
+
+    @classmethod
+    def from_config(cls, conf: dict, chat, deliver: Callable[[str, str], None]) -> "ImageJobs":
+        conf = conf or {}
+        return cls(chat, deliver, conf.get("workers", 2), conf.get("max_queue", 20), conf.get("timeout", 120),
+                   conf.get("cache_size", 256), conf.get("cache_ttl", 86400))
+
+    def submit(self, prompt: str, receiver: str) -> Tuple[str, int]:
+        """提交画图任务
+        :return: (状态, 前面还要等几张图画完)，状态为
+            CACHED 命中缓存已经发出，STARTED 马上开始画，QUEUED 排队中，
+            JOINED 同样的提示词正在画或排队，画好一起发，REJECTED 队列已满
+        """
+        key = self.key(prompt)
+        path = self.cache.get(key)
+        if path and os.path.isfile(path):
+            with self.lock:
+                self.counters["submitted"] += 1
+                self.counters["cache_hits"] += 1
+            self.deliver(receiver, path)
+            return self.CACHED, 0
+
+        with self.lock:
+            self.counters["submitted"] += 1
+            if key in self.waiting:
+                self.waiting[key].append(receiver)
+                self.counters["coalesced"] += 1
+                return self.JOINED, 0
+            if self.queued >= self.max_queue:
+                self.counters["rejected"] += 1
+                return self.REJECTED, 0
+            self.waiting[key] = [receiver]
+            self.queued += 1
+            # 空闲的线程会马上取走排在前面的任务，剩下的要等正在画的图画完
+            ahead = max(0, self.queued - (self.workers - self.running))
+        self.executor.submit(self._run, key, prompt, time.monotonic())
+        return (self.QUEUED, ahead) if ahead else (self.STARTED, 0)
+
+    def key(self, prompt: str) -> str:
+        identity = self.chat.image_identity() if hasattr(self.chat, "image_identity") else repr(self.chat)
+        return md5(f"{identity}:{prompt}".encode()).hexdigest()
+
+    def stats(self) -> dict:
+        with self.lock:
+            c = dict(self.counters, queued=self.queued, running=self.running)
+        done = c["completed"] + c["failed"]
+        c["avg_generate_seconds"] = c["generate_seconds"] / done if done else 0.0
+        c["avg_wait_seconds"] = c["wait_seconds"] / done if done else 0.0
+        c["hit_rate"] = c["cache_hits"] / c["submitted"] if c["submitted"] else 0.0
+        return c
+
+    def stop(self) -> None:
+        self.executor.shutdown(wait=False)
+
+    def _run(self, key: str, prompt: str, submitted_at: float) -> None:
+        start = time.monotonic()
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+        try:
+            path = self.chat.generateImage(prompt, Deadline(self.timeout))
+        except Exception as e:
+            self.LOG.error(f"画图失败: {e}")
+            path = ""
+        if path:
+            self.cache.set(key, path)
+
+        cost = time.monotonic() - start
+        with self.lock:
+            self.running -= 1
+            receivers = self.waiting.pop(key, [])
+            self.counters["completed" if path else "failed"] += 1
+            self.counters["generate_seconds"] += cost
+            self.counters["wait_seconds"] += start - submitted_at
+        self.LOG.info(f"画图完成，耗时 {cost:.2f}s，发给 {len(receivers)} 个人: {prompt}")
+        for receiver in receivers:
+            try:
+                self.deliver(receiver, path)
+            except Exception as e:
+                self.LOG.error(f"发送图片给 {receiver} 失败: {e}")
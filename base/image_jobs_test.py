@@ -0,0 +1,114 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from base.image_jobs import ImageJobs
+
+
+class FakeChat(object):
+    """画图前等 gate，画出的图片写到临时目录"""
+
+    def __init__(self, dirPath) -> None:
+        self.dirPath = dirPath
+        self.gate = threading.Event()
+        self.prompts = []
+        self.fail = False
+
+    def image_identity(self):
+        return "fake"
+
+    def generateImage(self, prompt, deadline):
+        self.prompts.append(prompt)
+        self.gate.wait(2)
+        if self.fail:
+            raise RuntimeError("api down")
+        path = os.path.join(self.dirPath, f"{len(self.prompts)}.png")
+        with open(path, "wb") as f:
+            f.write(b"png")
+        return path
+
+
+class ImageJobsTestCase(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.chat = FakeChat(tmp.name)
+        self.addCleanup(self.chat.gate.set)
+        self.delivered = []
+        self.done = threading.Condition()
+
+    def deliver(self, receiver, path):
+        with self.done:
+            self.delivered.append((receiver, path))
+            self.done.notify_all()
+
+    def wait_delivered(self, n):
+        with self.done:
+            self.assertTrue(self.done.wait_for(lambda: len(self.delivered) >= n, 2))
+
+    def make(self, **kwargs):
+        jobs = ImageJobs(self.chat, self.deliver, **kwargs)
+        self.addCleanup(jobs.stop)
+        return jobs
+
+    def test_coalesce_same_prompt(self):
+        jobs = self.make()
+        self.assertEqual(jobs.submit("猫", "a"), (ImageJobs.STARTED, 0))
+        self.assertEqual(jobs.submit("猫", "b"), (ImageJobs.JOINED, 0))
+        self.chat.gate.set()
+        self.wait_delivered(2)
+
+        # 只画一次，两个人都收到同一张图
+        self.assertEqual(self.chat.prompts, ["猫"])
+        self.assertEqual({r for r, _ in self.delivered}, {"a", "b"})
+        self.assertEqual(len({p for _, p in self.delivered}), 1)
+        self.assertEqual(jobs.stats()["coalesced"], 1)
+
+    def test_cache_hit(self):
+        jobs = self.make()
+        self.chat.gate.set()
+        jobs.submit("猫", "a")
+        self.wait_delivered(1)
+
+        self.assertEqual(jobs.submit("猫", "b"), (ImageJobs.CACHED, 0))
+        self.assertEqual(self.delivered[1], ("b", self.delivered[0][1]))
+        self.assertEqual(self.chat.prompts, ["猫"])
+        self.assertEqual(jobs.stats()["hit_rate"], 0.5)
+
+    def test_queue_position_and_reject(self):
+        jobs = self.make(workers=1, max_queue=2)
+        self.assertEqual(jobs.submit("p0", "a"), (ImageJobs.STARTED, 0))
+        while jobs.stats()["running"] < 1:
+            time.sleep(0.01)
+
+        self.assertEqual(jobs.submit("p1", "a"), (ImageJobs.QUEUED, 1))
+        self.assertEqual(jobs.submit("p2", "a"), (ImageJobs.QUEUED, 2))
+        self.assertEqual(jobs.submit("p3", "a"), (ImageJobs.REJECTED, 0))
+        # 排队中的提示词仍然可以合并
+        self.assertEqual(jobs.submit("p2", "b"), (ImageJobs.JOINED, 0))
+        self.assertEqual(jobs.stats()["rejected"], 1)
+
+        self.chat.gate.set()
+        self.wait_delivered(4)
+        self.assertEqual(self.chat.prompts, ["p0", "p1", "p2"])
+
+    def test_failure_delivers_empty_and_not_cached(self):
+        jobs = self.make()
+        self.chat.fail = True
+        self.chat.gate.set()
+        jobs.submit("猫", "a")
+        self.wait_delivered(1)
+
+        self.assertEqual(self.delivered, [("a", "")])
+        self.assertEqual(jobs.stats()["failed"], 1)
+
+        self.chat.fail = False
+        self.assertEqual(jobs.submit("猫", "a")[0], ImageJobs.STARTED)
+        self.wait_delivered(2)
+        self.assertTrue(self.delivered[1][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
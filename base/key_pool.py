@@ -0,0 +1,137 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from email.utils import parsedate_to_datetime
+from threading import Lock
+from typing import Callable
+
+from base.rate_limit import TokenBucket
+
+
+class KeyPoolExhausted(Exception):
+    """在等待时间内没有可用的 key"""
+
+
+def parse_retry_after(headers) -> float:
+    """解析 Retry-After / retry-after-ms 响应头，返回秒数，没有时返回 None"""
+    if not headers:
+        return None
+    ms = headers.get("retry-after-ms")
+    if ms:
+        try:
+            return float(ms) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ApiKey(object):
+    """一个 key（和它的接口地址），带每分钟请求数和 token 数两个令牌桶"""
+
+    def __init__(self, key: str, client, rpm: int = 0, tpm: int = 0) -> None:
+        self.key = key
+        self.client = client
+        self.requests = TokenBucket.per_minute(rpm)
+        self.tokens = TokenBucket.per_minute(tpm)
+        self.cooldown_until = 0.0
+        self.counters = {"requests": 0, "tokens": 0, "rate_limited": 0, "errors": 0}
+
+    @property
+    def name(self) -> str:
+        return f"{self.key[:3]}...{self.key[-4:]}" if self.key and len(self.key) > 10 else "***"
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.cooldown_until - now, self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+
+class KeyPool(object):
+    """多个 key 轮流使用
+    - 每个 key 按 rpm / tpm 限速，优先使用剩余额度最多的 key
+    - 收到 429 时按 Retry-After 冷却这个 key，请求换下一个 key 重试
+    - 所有 key 都不可用时等待，超过 acquire_timeout 抛出 KeyPoolExhausted
+    """
+
+    def __init__(self, keys: list, acquire_timeout: float = 30, cooldown: float = 20) -> None:
+        if not keys:
+            raise ValueError("KeyPool 至少需要一个 key")
+        self.LOG = logging.getLogger("KeyPool")
+        self.keys = keys
+        self.acquire_timeout = acquire_timeout
+        self.cooldown = cooldown  # 429 没有 Retry-After 时的默认冷却时间
+        self.lock = Lock()
+
+    @classmethod
+    def from_config(cls, conf: dict, client_factory: Callable) -> "KeyPool":
+        """
+        :param conf: chatgpt 配置，keys 为空时使用 key / api / proxy
+        :param client_factory: (key, api, proxy) -> 客户端
+        """
+        entries = conf.get("keys") or [{"key": conf.get("key")}]
+        keys = []
+        for entry in entries:
+            if isinstance(entry, str):
+                entry = {"key": entry}
+            client = client_factory(entry["key"], entry.get("api") or conf.get("api"),
+                                    entry.get("proxy", conf.get("proxy")))
+            keys.append(ApiKey(entry["key"], client, entry.get("rpm", conf.get("rpm", 0)),
+                               entry.get("tpm", conf.get("tpm", 0))))
+        return cls(keys, conf.get("acquire_timeout", 30), conf.get("rate_limit_cooldown", 20))
+
+    def acquire(self, tokens: int = 0, timeout: float = None) -> ApiKey:
+        """拿一个当前可用的 key，并扣掉一次请求和预估的 token
+        :param timeout: 最多等多少秒，默认 acquire_timeout
+        """
+        timeout = self.acquire_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                waits = [(k.wait_time(tokens, now), -k.requests.fill_ratio(), i) for i, k in enumerate(self.keys)]
+                wait, _, i = min(waits)
+                if wait <= 0:
+                    key = self.keys[i]
+                    key.requests.try_consume(1)
+                    key.tokens.try_consume(tokens)
+                    key.counters["requests"] += 1
+                    return key
+
+            if now + wait > deadline:
+                raise KeyPoolExhausted(f"{timeout:.1f}s 内没有可用的 key")
+            time.sleep(min(max(wait, 0.05), 1))
+
+    def release(self, key: ApiKey, estimated: int, used: int = None) -> None:
+        """请求完成后按实际 token 用量修正预估"""
+        used = estimated if used is None else used
+        with self.lock:
+            key.tokens.adjust(used - estimated)
+            key.counters["tokens"] += used
+
+    def rate_limited(self, key: ApiKey, retry_after: float = None) -> None:
+        cooldown = self.cooldown if retry_after is None else retry_after
+        with self.lock:
+            key.cooldown_until = max(key.cooldown_until, time.monotonic() + cooldown)
+            key.counters["rate_limited"] += 1
+        self.LOG.warning(f"key {key.name} 被限流，冷却 {cooldown:.1f}s")
+
+    def failed(self, key: ApiKey) -> None:
+        with self.lock:
+            key.counters["errors"] += 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self.lock:
+            return {k.name: dict(k.counters, cooling_down=max(0.0, k.cooldown_until - now),
+                                 requests_left=k.requests.fill_ratio(), tokens_left=k.tokens.fill_ratio())
+                    for k in self.keys}
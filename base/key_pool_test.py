@@ -0,0 +1,100 @@
+import time
+import unittest
+
+from base.key_pool import ApiKey, KeyPool, KeyPoolExhausted, parse_retry_after
+from base.rate_limit import TokenBucket
+
+
+class TokenBucketTestCase(unittest.TestCase):
+    def test_burst_then_limited(self):
+        bucket = TokenBucket(10, 2)
+        self.assertTrue(bucket.try_consume())
+        self.assertTrue(bucket.try_consume())
+        self.assertFalse(bucket.try_consume())
+        self.assertGreater(bucket.wait_time(), 0)
+
+    def test_consume_waits_for_refill(self):
+        bucket = TokenBucket(20, 1)
+        bucket.try_consume()
+        start = time.monotonic()
+        self.assertTrue(bucket.consume())
+        self.assertGreaterEqual(time.monotonic() - start, 0.03)
+
+    def test_consume_timeout(self):
+        bucket = TokenBucket(1, 1)
+        bucket.try_consume()
+        self.assertFalse(bucket.consume(timeout=0.1))
+
+    def test_unlimited(self):
+        bucket = TokenBucket(0)
+        for _ in range(100):
+            self.assertTrue(bucket.try_consume())
+        self.assertEqual(bucket.wait_time(), 0)
+
+
+class KeyPoolTestCase(unittest.TestCase):
+    def test_rotates_to_key_with_most_quota(self):
+        pool = KeyPool([ApiKey("key-a-0000000", None, rpm=60), ApiKey("key-b-0000000", None, rpm=60)])
+        first, second = pool.acquire(), pool.acquire()
+        self.assertIsNot(first, second)
+
+    def test_rate_limited_key_is_skipped(self):
+        a, b = ApiKey("key-a-0000000", None), ApiKey("key-b-0000000", None)
+        pool = KeyPool([a, b])
+        pool.rate_limited(a, 10)
+
+        for _ in range(3):
+            self.assertIs(pool.acquire(), b)
+        self.assertEqual(a.counters["rate_limited"], 1)
+
+    def test_acquire_waits_for_cooldown(self):
+        a = ApiKey("key-a-0000000", None)
+        pool = KeyPool([a])
+        pool.rate_limited(a, 0.2)
+
+        start = time.monotonic()
+        self.assertIs(pool.acquire(timeout=1), a)
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_exhausted_when_cooldown_exceeds_timeout(self):
+        a = ApiKey("key-a-0000000", None)
+        pool = KeyPool([a])
+        pool.rate_limited(a, 5)
+
+        start = time.monotonic()
+        with self.assertRaises(KeyPoolExhausted):
+            pool.acquire(timeout=0.2)
+        # 等不到就立即失败，不会傻等到超时
+        self.assertLess(time.monotonic() - start, 0.2)
+
+    def test_release_adjusts_tokens(self):
+        a = ApiKey("key-a-0000000", None, tpm=600)
+        pool = KeyPool([a])
+        pool.acquire(tokens=300)
+        pool.release(a, 300, 100)
+
+        self.assertAlmostEqual(a.tokens.fill_ratio(), 500 / 600, places=2)
+        self.assertEqual(a.counters["tokens"], 100)
+
+    def test_empty_pool(self):
+        with self.assertRaises(ValueError):
+            KeyPool([])
+
+
+class ParseRetryAfterTestCase(unittest.TestCase):
+    def test_seconds_and_ms(self):
+        self.assertEqual(parse_retry_after({"retry-after": "3"}), 3.0)
+        self.assertEqual(parse_retry_after({"retry-after-ms": "1500", "retry-after": "3"}), 1.5)
+
+    def test_http_date(self):
+        value = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+        self.assertAlmostEqual(parse_retry_after({"retry-after": value}), 30, delta=2)
+
+    def test_missing_or_invalid(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after({}))
+        self.assertIsNone(parse_retry_after({"retry-after": "soon"}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,241 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import Lock
+from typing import Iterator, Optional
+
+from base.deadline import TIMEOUT_REPLY, Deadline
+
+# 模型出错时返回的提示文本都以这些前缀开头，路由时按失败处理；模型出错时不能返回正常的文本
+ERROR_PREFIXES = ("发生未知错误", "OpenAI API", "无法连接到", "请求超时")
+
+
+def is_error_answer(answer) -> bool:
+    """按模型约定的错误前缀判断，不看回答的内容"""
+    return not answer or not isinstance(answer, str) or answer.startswith(ERROR_PREFIXES)
+
+
+class BackendState(object):
+    """单个模型的健康状态：延迟和错误率的指数加权平均，以及熔断器"""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, chat) -> None:
+        self.name = name
+        self.chat = chat
+        self.latency = None  # 秒，None 表示还没有样本
+        self.error_rate = 0.0
+        self.failures = 0  # 连续失败次数
+        self.state = self.CLOSED
+        self.opened_at = 0.0
+        self.probing = False  # 半开状态下是否已经放出了一个探测请求
+        self.counters = {"calls": 0, "failures": 0, "hedged": 0, "circuit_opened": 0}
+
+
+class LLMRouter(object):
+    """多模型路由
+    - 按延迟 EWMA 选最快的健康模型，失败时依次切换到下一个
+    - 连续失败 failure_threshold 次熔断，cooldown 秒后放一个请求探测，成功即恢复
+    - 配置了 hedge_delay 时，首选模型超过这个时间还没返回，就同时请求第二个模型，谁先成功用谁
+    - 可以按群（或个人）单独配置可用模型和对冲延迟
+    """
+
+    def __init__(self, backends: dict, conf: dict = None) -> None:
+        """
+        :param backends: 名字 -> 模型实例，顺序即默认优先级
+        :param conf: 路由配置，见 config.yaml.template 的 router 部分
+        """
+        conf = conf or {}
+        self.LOG = logging.getLogger("LLMRouter")
+        self.backends = {name: BackendState(name, chat) for name, chat in backends.items()}
+        self.alpha = conf.get("ewma_alpha", 0.3)
+        self.failure_threshold = conf.get("failure_threshold", 3)
+        self.cooldown = conf.get("cooldown", 60)
+        self.hedge_delay = conf.get("hedge_delay", 0)
+        self.default_backends = conf.get("backends") or list(backends)
+        self.groups = conf.get("groups") or {}
+        self.lock = Lock()
+        self.executor = ThreadPoolExecutor(max_workers=conf.get("workers", 8), thread_name_prefix="LLMRouter")
+
+    def __repr__(self):
+        return f"LLMRouter({', '.join(self.backends)})"
+
+    def cache_identity(self, wxid: str) -> Optional[str]:
+        """回答缓存的标识：可能用到的所有模型的标识，其中任何一个不能缓存则不缓存"""
+        identities = []
+        for name in self._allowed(wxid):
+            chat = self.backends[name].chat
+            identity = chat.cache_identity(wxid) if hasattr(chat, "cache_identity") else repr(chat)
+            if not identity:
+                return None
+            identities.append(identity)
+        return "LLMRouter:" + ",".join(identities)
+
+    def get_answer(self, question: str, wxid: str, deadline: Deadline = None) -> str:
+        deadline = deadline or Deadline()
+        candidates = self._candidates(wxid)
+        if not candidates:
+            return "发生未知错误：没有可用的模型"
+
+        hedge_delay = self.groups.get(wxid, {}).get("hedge_delay", self.hedge_delay)
+        rsp = ""
+        try:
+            while candidates:
+                if rsp and not deadline.check("failover"):
+                    return TIMEOUT_REPLY
+                primary = candidates.pop(0)
+                if hedge_delay and candidates:
+                    rsp, ok = self._hedged(primary, candidates, question, wxid, hedge_delay, deadline)
+                else:
+                    rsp, ok = self._call(primary, question, wxid, deadline)
+                if ok:
+                    return rsp
+                self.LOG.warning(f"{primary.name} 回答失败，尝试下一个模型")
+            return rsp
+        finally:
+            self._release_probes(candidates)
+
+    def get_answer_stream(self, question: str, wxid: str, deadline: Deadline = None) -> Iterator[str]:
+        """流式回答交给当前最快的健康模型，不支持流式的模型一次性返回；流式过程中不做切换和对冲"""
+        deadline = deadline or Deadline()
+        candidates = self._candidates(wxid)
+        if not candidates:
+            yield "发生未知错误：没有可用的模型"
+            return
+
+        backend = candidates[0]
+        self._release_probes(candidates[1:])
+        if not hasattr(backend.chat, "get_answer_stream"):
+            yield self.get_answer(question, wxid, deadline)
+            return
+
+        start = time.monotonic()
+        answer = ""
+        try:
+            for piece in backend.chat.get_answer_stream(question, wxid, deadline):
+                answer += piece
+                yield piece
+        except Exception as e:
+            self._record(backend, time.monotonic() - start, True)
+            raise e
+        self._record(backend, time.monotonic() - start, is_error_answer(answer))
+
+    def generateAudio(self, question: str, deadline: Deadline = None) -> str:
+        """语音和画图不参与路由，交给第一个支持的模型，都不支持时返回空"""
+        chat = self._first_with("generateAudio")
+        return chat.generateAudio(question, deadline) if chat else ""
+
+    def generateImage(self, question: str, deadline: Deadline = None) -> str:
+        chat = self._first_with("generateImage")
+        return chat.generateImage(question, deadline) if chat else ""
+
+    def image_identity(self) -> str:
+        chat = self._first_with("generateImage")
+        return chat.image_identity() if hasattr(chat, "image_identity") else repr(chat)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {b.name: dict(b.counters, state=b.state, error_rate=b.error_rate,
+                                 latency_ms=b.latency * 1000 if b.latency is not None else None)
+                    for b in self.backends.values()}
+
+    def _first_with(self, method: str):
+        return next((b.chat for b in self.backends.values() if hasattr(b.chat, method)), None)
+
+    def _allowed(self, wxid: str) -> list:
+        names = self.groups.get(wxid, {}).get("backends") or self.default_backends
+        return [n for n in names if n in self.backends]
+
+    def _candidates(self, wxid: str) -> list:
+        """按优先顺序返回本次可以尝试的模型
+        冷却结束的熔断模型排在最前面，用这个请求探测（失败了还能切换到健康的模型），
+        然后是健康的模型，按延迟从低到高
+        """
+        now = time.monotonic()
+        healthy, probes = [], []
+        with self.lock:
+            for order, name in enumerate(self._allowed(wxid)):
+                b = self.backends[name]
+                if b.state == BackendState.OPEN and now - b.opened_at >= self.cooldown:
+                    b.state = BackendState.HALF_OPEN
+                    b.probing = False
+                if b.state == BackendState.CLOSED:
+                    # 还没有样本的模型延迟按 0 处理，保证每个模型都会被试到
+                    healthy.append((b.latency or 0, order, b))
+                elif b.state == BackendState.HALF_OPEN and not b.probing:
+                    b.probing = True
+                    probes.append(b)
+        return probes + [b for _, _, b in sorted(healthy, key=lambda x: x[:2])]
+
+    def _call(self, backend: BackendState, question: str, wxid: str, deadline: Deadline):
+        start = time.monotonic()
+        try:
+            rsp = backend.chat.get_answer(question, wxid, deadline=deadline)
+            failed = is_error_answer(rsp)
+        except Exception as e:
+            self.LOG.error(f"{backend.name} error: {e}")
+            rsp, failed = "发生未知错误：" + str(e), True
+        # 时间预算用完导致的失败不算模型不健康
+        if not (failed and deadline.expired()):
+            self._record(backend, time.monotonic() - start, failed)
+        return rsp, not failed
+
+    def _hedged(self, primary: BackendState, candidates: list, question: str, wxid: str, delay: float,
+                deadline: Deadline):
+        """先请求首选模型，delay 秒内没返回再从 candidates 取出下一个同时请求，谁先成功用谁
+        首选在 delay 内就返回（成功或失败）时不动 candidates，失败时由调用方继续尝试下一个
+        """
+        futures = {self.executor.submit(self._call, primary, question, wxid, deadline): primary}
+        done, _ = wait(futures, timeout=deadline.timeout(delay))
+        if done:
+            return next(iter(done)).result()
+
+        secondary = candidates.pop(0)
+        with self.lock:
+            secondary.counters["hedged"] += 1
+        self.LOG.info(f"{primary.name} 超过 {delay}s 未返回，同时请求 {secondary.name}")
+        futures[self.executor.submit(self._call, secondary, question, wxid, deadline)] = secondary
+
+        rsp, ok = "", False
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=deadline.timeout(), return_when=FIRST_COMPLETED)
+            if not done:
+                deadline.miss("llm")
+                return TIMEOUT_REPLY, False
+            for f in done:
+                rsp, ok = f.result()
+                if ok:
+                    return rsp, ok
+        return rsp, ok
+
+    def _release_probes(self, backends: list) -> None:
+        # 候选里的半开模型没有真正被调用，把探测名额还回去
+        with self.lock:
+            for b in backends:
+                if b.state == BackendState.HALF_OPEN:
+                    b.probing = False
+
+    def _record(self, backend: BackendState, cost: float, failed: bool) -> None:
+        with self.lock:
+            b = backend
+            b.counters["calls"] += 1
+            b.error_rate = self.alpha * int(failed) + (1 - self.alpha) * b.error_rate
+            if failed:
+                b.counters["failures"] += 1
+                b.failures += 1
+                if b.state == BackendState.HALF_OPEN or b.failures >= self.failure_threshold:
+                    if b.state != BackendState.OPEN:
+                        b.counters["circuit_opened"] += 1
+                        self.LOG.warning(f"{b.name} 连续失败 {b.failures} 次，熔断 {self.cooldown}s")
+                    b.state = BackendState.OPEN
+                    b.opened_at = time.monotonic()
+                    b.probing = False
+            else:
+                # 失败的请求往往是超时或快速报错，不计入延迟
+                b.latency = cost if b.latency is None else self.alpha * cost + (1 - self.alpha) * b.latency
+                b.failures = 0
+                b.state = BackendState.CLOSED
+                b.probing = False
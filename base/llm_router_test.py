@@ -0,0 +1,108 @@
+import time
+import unittest
+
+from base.llm_router import BackendState, LLMRouter
+
+
+class FakeChat(object):
+    def __init__(self, answer="ok", delay=0.0, error=None):
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    def get_answer(self, question, wxid, deadline=None):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.answer
+
+
+class LLMRouterTestCase(unittest.TestCase):
+    def router(self, backends, **conf):
+        router = LLMRouter(backends, conf)
+        self.addCleanup(router.executor.shutdown, False)
+        return router
+
+    def test_failover_to_next_backend(self):
+        bad, good = FakeChat(error=RuntimeError("boom")), FakeChat("good")
+        router = self.router({"bad": bad, "good": good})
+
+        self.assertEqual(router.get_answer("q", "wxid"), "good")
+        self.assertEqual(bad.calls, 1)
+        self.assertEqual(router.stats()["bad"]["failures"], 1)
+
+    def test_error_prefixed_answer_counts_as_failure(self):
+        # 例如 TigerBot 出错时返回“发生未知错误：...”
+        tiger, good = FakeChat("发生未知错误：500"), FakeChat("good")
+        router = self.router({"tiger": tiger, "good": good})
+
+        self.assertEqual(router.get_answer("q", "wxid"), "good")
+        self.assertEqual(router.stats()["tiger"]["failures"], 1)
+
+    def test_all_failed_returns_last_error(self):
+        router = self.router({"a": FakeChat(error=RuntimeError("boom"))})
+
+        self.assertTrue(router.get_answer("q", "wxid").startswith("发生未知错误"))
+
+    def test_circuit_opens_and_recovers(self):
+        flaky, good = FakeChat(error=RuntimeError("boom")), FakeChat("good")
+        router = self.router({"flaky": flaky, "good": good}, failure_threshold=2, cooldown=0.2)
+
+        for _ in range(2):
+            router.get_answer("q", "wxid")
+        self.assertEqual(router.stats()["flaky"]["state"], BackendState.OPEN)
+
+        # 熔断期间不再请求
+        router.get_answer("q", "wxid")
+        self.assertEqual(flaky.calls, 2)
+
+        # 冷却结束后放一个探测请求，成功即恢复
+        time.sleep(0.25)
+        flaky.error = None
+        flaky.answer = "back"
+        self.assertEqual(router.get_answer("q", "wxid"), "back")
+        self.assertEqual(router.stats()["flaky"]["state"], BackendState.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        flaky = FakeChat(error=RuntimeError("boom"))
+        router = self.router({"flaky": flaky, "good": FakeChat("good")}, failure_threshold=1, cooldown=0.1)
+        router.get_answer("q", "wxid")
+
+        time.sleep(0.15)
+        self.assertEqual(router.get_answer("q", "wxid"), "good")
+        stats = router.stats()["flaky"]
+        self.assertEqual(stats["state"], BackendState.OPEN)
+        self.assertEqual(stats["circuit_opened"], 2)
+        self.assertEqual(flaky.calls, 2)
+
+    def test_hedge_uses_faster_secondary(self):
+        slow, fast = FakeChat("slow", delay=0.5), FakeChat("fast")
+        router = self.router({"slow": slow, "fast": fast}, hedge_delay=0.05)
+
+        start = time.monotonic()
+        self.assertEqual(router.get_answer("q", "wxid"), "fast")
+        self.assertLess(time.monotonic() - start, 0.4)
+        self.assertEqual(router.stats()["fast"]["hedged"], 1)
+
+    def test_hedge_primary_fails_fast(self):
+        # 首选在对冲延迟之前就失败，仍然要切换到第二个
+        bad, good = FakeChat(error=RuntimeError("boom")), FakeChat("good")
+        router = self.router({"bad": bad, "good": good}, hedge_delay=0.5)
+
+        self.assertEqual(router.get_answer("q", "wxid"), "good")
+        self.assertEqual(good.calls, 1)
+        self.assertEqual(router.stats()["good"]["hedged"], 0)
+
+    def test_no_hedge_when_primary_is_fast(self):
+        primary, secondary = FakeChat("primary"), FakeChat("secondary")
+        router = self.router({"primary": primary, "secondary": secondary}, hedge_delay=0.2)
+
+        self.assertEqual(router.get_answer("q", "wxid"), "primary")
+        self.assertEqual(secondary.calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,174 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import shutil
+import time
+from collections import OrderedDict, deque
+from threading import Event, Lock, Thread
+from typing import Callable, Optional
+
+from base.prefetch import file_sha256
+
+
+class ReadyPool(object):
+    """预先下载好的媒体文件池
+    后台线程调用 producer 下载文件，保持池里有 size 个可用文件；取走一个就触发补充。
+    - 池里文件总大小不超过 max_bytes，单个文件超过上限的直接丢弃
+    - 放进池里超过 ttl 秒的文件过期删除
+    - 按内容哈希去重，最近发过的也不会再放进池里
+    - 取出的文件移到 out_dir 下按日期建的目录，池目录里只有还没发出的文件，重启后不会重复发送
+    """
+
+    def __init__(self, producer: Callable[[], str], pool_dir: str, size: int = 5, max_bytes: int = 200 << 20,
+                 ttl: float = 86400, backoff: float = 5, max_backoff: float = 300, name: str = "ReadyPool",
+                 out_dir: str = None) -> None:
+        """
+        :param producer: 下载一个文件，返回本地路径，失败返回空
+        :param pool_dir: 池文件的存放目录
+        :param size: 池里保持的文件数
+        :param max_bytes: 池里文件总大小上限
+        :param ttl: 文件的有效期，秒
+        :param backoff: 下载失败后第一次重试前等待的秒数，之后每次翻倍
+        :param max_backoff: 重试等待的上限
+        :param out_dir: 取出的文件移到这个目录下的日期目录里，默认为池目录的上一级
+        """
+        self.LOG = logging.getLogger(name)
+        self.producer = producer
+        self.pool_dir = pool_dir
+        self.out_dir = out_dir or os.path.dirname(os.path.abspath(pool_dir))
+        self.size = size
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.items = OrderedDict()  # 哈希 -> (路径, 大小, 放入时间)，先放入的先取出
+        self.seen = deque(maxlen=1000)  # 最近放入或发出过的哈希
+        self.counters = {"hits": 0, "misses": 0, "produced": 0, "duplicates": 0, "expired": 0, "oversize": 0,
+                         "errors": 0}
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.running = True
+        os.makedirs(pool_dir, exist_ok=True)
+        self._adopt()
+        self.thread = Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_config(cls, conf: dict, producer: Callable[[], str], pool_dir: str, name: str = "ReadyPool",
+                    out_dir: str = None):
+        conf = conf or {}
+        return cls(producer, conf.get("dir", pool_dir), conf.get("size", 5), conf.get("max_mb", 200) << 20,
+                   conf.get("ttl", 86400), name=name, out_dir=conf.get("out_dir", out_dir))
+
+    def take(self) -> Optional[str]:
+        """取出一个文件，移出池目录后返回新路径，池空时返回 None；取出的文件由调用方负责"""
+        path = None
+        with self.lock:
+            self._expire()
+            while self.items and path is None:
+                _, (pooled, _, _) = self.items.popitem(last=False)
+                path = self._move_out(pooled)
+            self.counters["hits" if path else "misses"] += 1
+        self.wakeup.set()
+        return path
+
+    def stats(self) -> dict:
+        with self.lock:
+            c = dict(self.counters, ready=len(self.items), bytes=sum(size for _, size, _ in self.items.values()))
+        c["hit_rate"] = c["hits"] / (c["hits"] + c["misses"]) if c["hits"] + c["misses"] else 0.0
+        return c
+
+    def stop(self) -> None:
+        self.running = False
+        self.wakeup.set()
+
+    def _adopt(self) -> None:
+        """启动时接管上次留在池目录里的文件"""
+        for name in sorted(os.listdir(self.pool_dir), key=lambda n: os.path.getmtime(os.path.join(self.pool_dir, n))):
+            path = os.path.join(self.pool_dir, name)
+            if os.path.isfile(path) and not name.endswith(".tmp"):
+                digest = os.path.splitext(name)[0]
+                self.items[digest] = (path, os.path.getsize(path), os.path.getmtime(path))
+                self.seen.append(digest)
+        self._expire()
+
+    def _expire(self) -> None:
+        now = time.time()
+        for digest, (path, _, added) in list(self.items.items()):
+            if now - added > self.ttl:
+                del self.items[digest]
+                self.counters["expired"] += 1
+                self._remove(path)
+
+    def _full(self) -> bool:
+        with self.lock:
+            self._expire()
+            used = sum(size for _, size, _ in self.items.values())
+            return len(self.items) >= self.size or used >= self.max_bytes
+
+    def _add(self, path: str) -> bool:
+        """放入池中，重复或超过容量时删除文件并返回 False"""
+        size = os.path.getsize(path)
+        digest = file_sha256(path)
+        with self.lock:
+            if digest in self.seen:
+                self.counters["duplicates"] += 1
+                reason = "重复"
+            elif size > self.max_bytes - sum(s for _, s, _ in self.items.values()):
+                self.counters["oversize"] += 1
+                reason = "超过容量"
+            else:
+                target = os.path.join(self.pool_dir, digest + os.path.splitext(path)[1])
+                shutil.move(path, target)
+                self.items[digest] = (target, size, time.time())
+                self.seen.append(digest)
+                self.counters["produced"] += 1
+                return True
+        self.LOG.info(f"丢弃{reason}的文件: {path}")
+        self._remove(path)
+        return False
+
+    def _move_out(self, path: str) -> Optional[str]:
+        target_dir = os.path.join(self.out_dir, time.strftime("%Y-%m-%d"))
+        target = os.path.join(target_dir, os.path.basename(path))
+        try:
+            os.makedirs(target_dir, exist_ok=True)
+            shutil.move(path, target)
+            return target
+        except OSError as e:
+            self.LOG.error(f"移出池目录失败: {path}, {e}")
+            self._remove(path)
+            return None
+
+    def _remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        wait = self.backoff
+        while self.running:
+            if self._full():
+                # 池满时等有人取走，或者到期检查一次过期
+                self.wakeup.wait(min(self.ttl, 600))
+                self.wakeup.clear()
+                continue
+            try:
+                path = self.producer()
+            except Exception as e:
+                self.LOG.error(f"下载失败: {e}")
+                path = ""
+            if path and os.path.isfile(path) and os.path.getsize(path) > 0:
+                if self._add(path):
+                    wait = self.backoff
+                    continue
+            else:
+                with self.lock:
+                    self.counters["errors"] += 1
+            # 失败或者拿到重复的文件，退避后再试，避免一直请求接口
+            self.wakeup.wait(wait)
+            self.wakeup.clear()
+            wait = min(wait * 2, self.max_backoff)
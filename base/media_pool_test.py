@@ -0,0 +1,102 @@
+import itertools
+import os
+import tempfile
+import time
+import unittest
+
+from base.media_pool import ReadyPool
+
+
+class ReadyPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.pool_dir = os.path.join(self.tmp.name, "video", "pool")
+        self.counter = itertools.count()
+
+    def producer(self, content=None, size=10):
+        def produce():
+            path = os.path.join(self.tmp.name, f"download-{next(self.counter)}.mp4")
+            with open(path, "wb") as f:
+                f.write(content if content is not None else os.urandom(size))
+            return path
+        return produce
+
+    def pool(self, producer, **kwargs):
+        pool = ReadyPool(producer, self.pool_dir, backoff=0.01, max_backoff=0.05, **kwargs)
+        self.addCleanup(pool.stop)
+        return pool
+
+    def wait_ready(self, pool, n):
+        end = time.monotonic() + 2
+        while pool.stats()["ready"] < n and time.monotonic() < end:
+            time.sleep(0.01)
+        self.assertEqual(pool.stats()["ready"], n)
+
+    def test_fill_and_take_moves_out_of_pool(self):
+        pool = self.pool(self.producer(), size=2)
+        self.wait_ready(pool, 2)
+
+        path = pool.take()
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(os.path.dirname(path), os.path.join(self.tmp.name, "video", time.strftime("%Y-%m-%d")))
+        self.assertEqual(len(os.listdir(self.pool_dir)), 1)
+        self.wait_ready(pool, 2)  # 取走后自动补充
+
+    def test_taken_file_not_served_after_restart(self):
+        pool = self.pool(self.producer(), size=2)
+        self.wait_ready(pool, 2)
+        taken = os.path.basename(pool.take())
+        pool.stop()
+        pool.thread.join(1)
+
+        restarted = self.pool(lambda: "", size=2)
+        served = [restarted.take(), restarted.take()]
+        self.assertIsNotNone(served[0])
+        self.assertNotIn(taken, [os.path.basename(p) for p in served if p])
+
+    def test_duplicates_dropped(self):
+        pool = self.pool(self.producer(b"same"), size=3)
+        self.wait_ready(pool, 1)
+        end = time.monotonic() + 1
+        while pool.stats()["duplicates"] == 0 and time.monotonic() < end:
+            time.sleep(0.01)
+
+        self.assertEqual(pool.stats()["ready"], 1)
+        self.assertGreaterEqual(pool.stats()["duplicates"], 1)
+
+    def test_oversize_dropped(self):
+        pool = self.pool(self.producer(size=100), size=2, max_bytes=50)
+        end = time.monotonic() + 1
+        while pool.stats()["oversize"] == 0 and time.monotonic() < end:
+            time.sleep(0.01)
+
+        self.assertIsNone(pool.take())
+        self.assertEqual(pool.stats()["misses"], 1)
+        self.assertEqual([n for n in os.listdir(self.tmp.name) if n.startswith("download")], [])
+
+    def test_expired_removed(self):
+        pool = self.pool(lambda: "", ttl=0.05)
+        with open(os.path.join(self.pool_dir, "old.mp4"), "wb") as f:
+            f.write(b"old")
+        pool._adopt()
+        time.sleep(0.06)
+
+        self.assertIsNone(pool.take())
+        self.assertEqual(pool.stats()["expired"], 1)
+        self.assertEqual(os.listdir(self.pool_dir), [])
+
+    def test_producer_errors_counted(self):
+        def broken():
+            raise RuntimeError("boom")
+
+        pool = self.pool(broken)
+        end = time.monotonic() + 1
+        while pool.stats()["errors"] < 2 and time.monotonic() < end:
+            time.sleep(0.01)
+
+        self.assertGreaterEqual(pool.stats()["errors"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
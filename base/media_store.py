@@ -0,0 +1,188 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import sqlite3
+import time
+from threading import Lock
+from typing import Iterable
+
+
+class MediaStore(object):
+    """生成和下载的媒体文件（语音、图片、视频）的索引和清理
+    每个文件登记到 SQLite 索引里，记录大小、最后访问时间和引用计数（正在排队发送的文件）；
+    定时任务调用 sweep：先删除超过 max_age 的文件，总大小仍超过 max_bytes 时按最久未访问的顺序删除，
+    引用计数不为 0 的文件不删。
+    """
+
+    def __init__(self, db_path: str = "media.db", max_bytes: int = 2 << 30, max_age: float = 7 * 86400,
+                 roots: Iterable[str] = ("images", "audio", "video"), exclude: Iterable[str] = ()) -> None:
+        """
+        :param db_path: 索引文件路径
+        :param max_bytes: 所有文件的总大小上限
+        :param max_age: 文件保留的最长时间，秒
+        :param roots: 媒体目录，第一次清理时把里面还没登记的旧文件登记进来，删空的子目录也会清掉
+        :param exclude: 不登记的目录（例如自己管理容量的视频池）
+        """
+        self.LOG = logging.getLogger("MediaStore")
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.roots = [os.path.abspath(r) for r in roots]
+        self.exclude = [os.path.abspath(e) for e in exclude]
+        self.conn = None
+        self.adopted = False
+        self.counters = {"registered": 0, "evicted": 0, "expired": 0, "missing": 0, "evicted_bytes": 0,
+                         "sweeps": 0, "sweep_seconds": 0.0}
+        self.lock = Lock()
+
+    def configure(self, conf: dict, exclude: Iterable[str] = ()) -> None:
+        """按配置修改参数，需要在登记文件之前调用"""
+        conf = conf or {}
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+            self.db_path = conf.get("db_path", self.db_path)
+            self.max_bytes = conf.get("max_mb", self.max_bytes >> 20) << 20
+            self.max_age = conf.get("max_days", self.max_age / 86400) * 86400
+            self.roots = [os.path.abspath(r) for r in conf.get("roots", self.roots)]
+            self.exclude = [os.path.abspath(e) for e in exclude]
+
+    def add(self, path: str, kind: str = "file") -> str:
+        """登记一个文件，已经登记过的更新大小和访问时间；返回原路径，方便生成函数直接 return"""
+        if not path or not os.path.isfile(path):
+            return path
+        path = os.path.abspath(path)
+        now = time.time()
+        with self.lock:
+            self._db().execute("INSERT INTO files (path, kind, size, created, accessed, refs) VALUES (?, ?, ?, ?, ?, 0) "
+                               "ON CONFLICT(path) DO UPDATE SET size = excluded.size, accessed = excluded.accessed",
+                               (path, kind, os.path.getsize(path), now, now))
+            self.conn.commit()
+            self.counters["registered"] += 1
+        return path
+
+    def acquire(self, path: str) -> None:
+        """文件开始被使用（排队发送），清理时跳过"""
+        self._update("UPDATE files SET refs = refs + 1, accessed = ? WHERE path = ?", path)
+
+    def release(self, path: str) -> None:
+        self._update("UPDATE files SET refs = MAX(refs - 1, 0), accessed = ? WHERE path = ?", path)
+
+    def sweep(self) -> int:
+        """按年龄和总大小清理文件，在定时任务里执行；返回删除的文件数"""
+        start = time.perf_counter()
+        if not self.adopted:
+            self.adopted = True
+            self._adopt()
+
+        removed = []
+        with self.lock:
+            db = self._db()
+            # 已经被删除或者移走的文件只删索引
+            missing = [p for p, in db.execute("SELECT path FROM files") if not os.path.isfile(p)]
+            db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in missing])
+
+            expired = db.execute("SELECT path, size FROM files WHERE refs = 0 AND created < ?",
+                                 (time.time() - self.max_age,)).fetchall()
+            db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p, _ in expired])
+
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+            lru = []
+            if total > self.max_bytes:
+                for p, size in db.execute("SELECT path, size FROM files WHERE refs = 0 ORDER BY accessed"):
+                    if total <= self.max_bytes:
+                        break
+                    lru.append((p, size))
+                    total -= size
+                db.executemany("DELETE FROM files WHERE path = ?", [(p,) for p, _ in lru])
+            self.conn.commit()
+
+            removed = expired + lru
+            self.counters["missing"] += len(missing)
+            self.counters["expired"] += len(expired)
+            self.counters["evicted"] += len(lru)
+            self.counters["evicted_bytes"] += sum(size for _, size in removed)
+
+        for p, _ in removed:
+            self._remove(p)
+        self._prune_dirs({os.path.dirname(p) for p, _ in removed + [(m, 0) for m in missing]})
+
+        cost = time.perf_counter() - start
+        with self.lock:
+            self.counters["sweeps"] += 1
+            self.counters["sweep_seconds"] += cost
+        if removed or missing:
+            self.LOG.info(f"清理 {len(expired)} 个过期、{len(lru)} 个超出容量的文件，"
+                          f"{len(missing)} 个已不存在，耗时 {cost:.2f}s")
+        return len(removed)
+
+    def stats(self) -> dict:
+        with self.lock:
+            files, size, refs = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refs), 0) FROM files").fetchone()
+            return dict(self.counters, files=files, bytes=size, in_use=refs, max_bytes=self.max_bytes)
+
+    def _db(self) -> sqlite3.Connection:
+        """调用方持有 self.lock"""
+        if self.conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute("CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, kind TEXT, size INTEGER, "
+                              "created REAL, accessed REAL, refs INTEGER)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS files_accessed ON files (accessed)")
+            # 引用计数只在进程内有效，重启后排队中的发送已经不存在了
+            self.conn.execute("UPDATE files SET refs = 0")
+            self.conn.commit()
+        return self.conn
+
+    def _update(self, sql: str, path: str) -> None:
+        if not path:
+            return
+        with self.lock:
+            self._db().execute(sql, (time.time(), os.path.abspath(path)))
+            self.conn.commit()
+
+    def _excluded(self, path: str) -> bool:
+        return any(path == e or path.startswith(e + os.sep) for e in self.exclude)
+
+    def _adopt(self) -> None:
+        """把媒体目录里还没登记的旧文件登记进来，创建时间按文件修改时间"""
+        rows = []
+        for root in self.roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if not self._excluded(os.path.join(dirpath, d))]
+                for name in filenames:
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    rows.append((path, os.path.basename(root), st.st_size, st.st_mtime, st.st_mtime))
+        with self.lock:
+            cur = self._db().executemany("INSERT OR IGNORE INTO files (path, kind, size, created, accessed, refs) "
+                                         "VALUES (?, ?, ?, ?, ?, 0)", rows)
+            self.conn.commit()
+            self.counters["registered"] += max(cur.rowcount, 0)
+
+    def _prune_dirs(self, dirs: set) -> None:
+        """删除媒体目录下删空了的子目录（按日期建的目录）"""
+        for d in dirs:
+            if d in self.roots or not any(d.startswith(r + os.sep) for r in self.roots) or self._excluded(d):
+                continue
+            try:
+                os.rmdir(d)
+            except OSError:
+                pass  # 目录非空
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+media_store = MediaStore()
@@ -0,0 +1,121 @@
+import os
+import tempfile
+import time
+import unittest
+
+from base.media_store import MediaStore
+
+
+class MediaStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.root = os.path.join(self.tmp.name, "images")
+
+    def make(self, **kwargs):
+        store = MediaStore(os.path.join(self.tmp.name, "media.db"), roots=[self.root], **kwargs)
+        self.addCleanup(lambda: store.conn and store.conn.close())
+        return store
+
+    def write(self, name, size=10):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def set_times(self, store, path, created=None, accessed=None):
+        with store.lock:
+            if created is not None:
+                store.conn.execute("UPDATE files SET created = ? WHERE path = ?", (created, path))
+            if accessed is not None:
+                store.conn.execute("UPDATE files SET accessed = ? WHERE path = ?", (accessed, path))
+            store.conn.commit()
+
+    def test_add(self):
+        store = self.make()
+        path = self.write("a.png")
+
+        self.assertEqual(store.add(path, "dalle"), os.path.abspath(path))
+        store.add(path, "dalle")
+        self.assertEqual(store.add("", "dalle"), "")
+        stats = store.stats()
+        self.assertEqual((stats["files"], stats["bytes"]), (1, 10))
+
+    def test_sweep_expired(self):
+        store = self.make(max_age=60)
+        old, new = store.add(self.write("2024-01-01/old.png")), store.add(self.write("new.png"))
+        self.set_times(store, old, created=time.time() - 120)
+
+        self.assertEqual(store.sweep(), 1)
+        self.assertFalse(os.path.exists(old))
+        self.assertTrue(os.path.exists(new))
+        # 删空的日期目录一起删掉，媒体根目录保留
+        self.assertFalse(os.path.exists(os.path.dirname(old)))
+        self.assertTrue(os.path.isdir(self.root))
+        self.assertEqual(store.stats()["expired"], 1)
+
+    def test_sweep_lru_over_capacity(self):
+        store = self.make(max_bytes=25)
+        paths = [store.add(self.write(f"{i}.png")) for i in range(4)]
+        now = time.time()
+        for i, accessed in enumerate((now - 10, now - 30, now - 20, now)):
+            self.set_times(store, paths[i], accessed=accessed)
+
+        # 总共 40 字节，按最久未访问删掉 1 和 2
+        self.assertEqual(store.sweep(), 2)
+        self.assertEqual([os.path.exists(p) for p in paths], [True, False, False, True])
+        stats = store.stats()
+        self.assertEqual((stats["evicted"], stats["evicted_bytes"], stats["bytes"]), (2, 20, 20))
+
+    def test_refs_protect_files(self):
+        store = self.make(max_bytes=0, max_age=60)
+        path = store.add(self.write("a.png"))
+        self.set_times(store, path, created=time.time() - 120)
+        store.acquire(path)
+        store.acquire(path)
+        store.release(path)
+
+        self.assertEqual(store.stats()["in_use"], 1)
+        self.assertEqual(store.sweep(), 0)
+        self.assertTrue(os.path.exists(path))
+
+        store.release(path)
+        store.release(path)  # 不会减成负数
+        self.assertEqual(store.stats()["in_use"], 0)
+        self.assertEqual(store.sweep(), 1)
+        self.assertFalse(os.path.exists(path))
+
+    def test_refs_reset_after_restart(self):
+        store = self.make()
+        path = store.add(self.write("a.png"))
+        store.acquire(path)
+        store.conn.close()
+        store.conn = None
+
+        self.assertEqual(store.stats()["in_use"], 0)
+
+    def test_missing_files_dropped(self):
+        store = self.make()
+        path = store.add(self.write("a.png"))
+        os.remove(path)
+
+        self.assertEqual(store.sweep(), 0)
+        stats = store.stats()
+        self.assertEqual((stats["files"], stats["missing"]), (0, 1))
+
+    def test_adopt_existing_files(self):
+        old = self.write("2024-01-01/old.png")
+        os.utime(old, (time.time() - 120, time.time() - 120))
+        self.write("pool/keep.mp4")
+        store = self.make(max_age=60, exclude=[os.path.join(self.root, "pool")])
+
+        self.assertEqual(store.sweep(), 1)
+        self.assertFalse(os.path.exists(old))
+        # 排除的目录不登记也不删
+        self.assertTrue(os.path.exists(os.path.join(self.root, "pool", "keep.mp4")))
+        self.assertEqual(store.stats()["files"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
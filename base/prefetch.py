@@ -0,0 +1,206 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Any, Callable, Optional
+
+from base.media_store import media_store
+
+# 常见图片文件头，用来识别接口返回的是错误页面而不是图片
+_IMAGE_MAGIC = (b"\xff\xd8\xff", b"\x89PNG", b"GIF8", b"RIFF")
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_image(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(8).startswith(_IMAGE_MAGIC)
+    except OSError:
+        return False
+
+
+class PrefetchError(Exception):
+    """内容获取失败或没有通过校验"""
+
+
+class Prefetcher(object):
+    """每日定时内容的预取
+    在发送前 lead 秒获取内容，校验通过后按日期存到磁盘（文本存 JSON，文件按内容哈希命名），
+    失败按指数退避重试；发送时只读已经准备好的内容，预取失败时才临时获取一次。
+    预取到的内容和前一天完全相同（哈希一致）时视为接口还没更新，按失败重试；
+    发送时临时获取的内容即使和前一天相同也照常发送。
+    """
+
+    def __init__(self, cache_dir: str = "prefetch", lead: float = 600, retries: int = 4, backoff: float = 30,
+                 keep_days: int = 7) -> None:
+        """
+        :param cache_dir: 预取内容的存放目录
+        :param lead: 提前多少秒预取
+        :param retries: 失败后重试几次
+        :param backoff: 第一次重试前等待的秒数，之后每次翻倍
+        :param keep_days: 保留最近几天的内容
+        """
+        self.LOG = logging.getLogger("Prefetcher")
+        self.cache_dir = cache_dir
+        self.lead = lead
+        self.retries = retries
+        self.backoff = backoff
+        self.keep_days = keep_days
+        self.sources = {}
+        self.counters = {}
+        self.lock = Lock()
+
+    @classmethod
+    def from_config(cls, conf: dict) -> "Prefetcher":
+        conf = conf or {}
+        return cls(conf.get("cache_dir", "prefetch"), conf.get("lead", 600), conf.get("retries", 4),
+                   conf.get("backoff", 30), conf.get("keep_days", 7))
+
+    def register(self, name: str, fetch: Callable[[], Any], kind: str = "text",
+                 validate: Optional[Callable[[Any], bool]] = None) -> None:
+        """
+        :param name: 内容名称
+        :param fetch: 获取内容，kind 为 text 时返回字符串，为 files 时返回本地文件路径列表
+        :param kind: text 或 files
+        :param validate: 额外的校验，默认文本非空、文件为非空图片
+        """
+        self.sources[name] = (fetch, kind, validate)
+        self.counters[name] = {"prefetched": 0, "retries": 0, "failures": 0, "stale": 0, "hits": 0, "misses": 0}
+
+    def lead_time(self, at: str) -> str:
+        """发送时间 HH:MM[:SS] 对应的预取时间"""
+        t = datetime.strptime(at, "%H:%M:%S" if at.count(":") == 2 else "%H:%M")
+        return (t - timedelta(seconds=self.lead)).strftime("%H:%M:%S")
+
+    def prefetch(self, name: str) -> bool:
+        """获取并保存内容，失败按退避重试，在定时任务线程里执行"""
+        day = (datetime.now() + timedelta(seconds=self.lead)).date()
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count(name, "retries")
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+            try:
+                artifact = self._fetch(name, day)
+            except Exception as e:
+                self.LOG.warning(f"预取 {name} 失败（第 {attempt + 1} 次）: {e}")
+                continue
+            self._count(name, "prefetched")
+            self.LOG.info(f"预取 {name} 完成: {artifact['sha256'][:12]}")
+            self._cleanup()
+            return True
+
+        self._count(name, "failures")
+        self.LOG.error(f"预取 {name} 失败，发送时将临时获取")
+        return False
+
+    def get(self, name: str) -> Optional[dict]:
+        """读取今天已预取的内容，没有时临时获取一次（不重试，和前一天相同也接受）
+        :return: {"name", "date", "fetched_at", "sha256", "text", "files": [{"path", "sha256"}]}，获取失败返回 None
+        """
+        day = date.today()
+        artifact = self._load(name, day)
+        if artifact:
+            self._count(name, "hits")
+            return artifact
+
+        self._count(name, "misses")
+        try:
+            return self._fetch(name, day, accept_stale=True)
+        except Exception as e:
+            self.LOG.error(f"获取 {name} 失败: {e}")
+            return None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {name: dict(c) for name, c in self.counters.items()}
+
+    def _count(self, name: str, key: str) -> None:
+        with self.lock:
+            self.counters[name][key] += 1
+
+    def _dir(self, day: date) -> str:
+        return os.path.join(self.cache_dir, day.isoformat())
+
+    def _meta_path(self, name: str, day: date) -> str:
+        return os.path.join(self._dir(day), f"{name}.json")
+
+    def _fetch(self, name: str, day: date, accept_stale: bool = False) -> dict:
+        """获取、校验并保存内容
+        :param accept_stale: 和前一天相同时是否照常保存，否则抛出 PrefetchError 等待重试
+        """
+        fetch, kind, validate = self.sources[name]
+        payload = fetch()
+        if kind == "files":
+            paths = [p for p in (payload or []) if p]
+            if not paths or not all(os.path.getsize(p) > 0 and is_image(p) for p in paths):
+                raise PrefetchError("文件为空或不是图片")
+        elif not payload or not isinstance(payload, str):
+            raise PrefetchError("内容为空")
+        if validate and not validate(payload):
+            raise PrefetchError("内容没有通过校验")
+
+        os.makedirs(self._dir(day), exist_ok=True)
+        artifact = {"name": name, "date": day.isoformat(), "fetched_at": time.time(), "text": None, "files": []}
+        if kind == "files":
+            for p in paths:
+                digest = file_sha256(p)
+                target = os.path.join(self._dir(day), digest[:16] + os.path.splitext(p)[1])
+                shutil.move(p, target)
+                media_store.add(target, name)
+                artifact["files"].append({"path": os.path.abspath(target), "sha256": digest})
+            artifact["sha256"] = hashlib.sha256("".join(f["sha256"] for f in artifact["files"]).encode()).hexdigest()
+        else:
+            artifact["text"] = payload
+            artifact["sha256"] = hashlib.sha256(payload.encode()).hexdigest()
+
+        previous = self._load(name, day - timedelta(days=1))
+        if previous and previous["sha256"] == artifact["sha256"]:
+            self._count(name, "stale")
+            if not accept_stale:
+                raise PrefetchError("内容和前一天相同，接口可能还没更新")
+            self.LOG.warning(f"{name} 和前一天相同，照常发送")
+
+        meta = self._meta_path(name, day)
+        with open(meta + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(artifact, f, ensure_ascii=False)
+        os.replace(meta + ".tmp", meta)
+        return artifact
+
+    def _load(self, name: str, day: date) -> Optional[dict]:
+        """读取并校验已保存的内容，文件缺失或哈希不一致时返回 None"""
+        try:
+            with open(self._meta_path(name, day), encoding="utf-8") as f:
+                artifact = json.load(f)
+            for item in artifact["files"]:
+                if file_sha256(item["path"]) != item["sha256"]:
+                    raise PrefetchError(f"{item['path']} 哈希不一致")
+            return artifact
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            self.LOG.warning(f"读取预取的 {name} 失败: {e}")
+            return None
+
+    def _cleanup(self) -> None:
+        """删除 keep_days 天以前的内容"""
+        oldest = (date.today() - timedelta(days=self.keep_days)).isoformat()
+        try:
+            for d in os.listdir(self.cache_dir):
+                if d < oldest and os.path.isdir(os.path.join(self.cache_dir, d)):
+                    shutil.rmtree(os.path.join(self.cache_dir, d), ignore_errors=True)
+        except OSError as e:
+            self.LOG.warning(f"清理预取目录失败: {e}")
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+
+from base.prefetch import Prefetcher
+
+# 最小的 PNG 文件头，足够通过图片校验
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 16
+
+
+class PrefetcherTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch("base.prefetch.media_store")
+        self.media_store = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.prefetcher = Prefetcher(os.path.join(self.tmp.name, "prefetch"), lead=0, retries=2, backoff=0.01)
+
+    def save_yesterday(self, name, text):
+        day = date.today() - timedelta(days=1)
+        os.makedirs(self.prefetcher._dir(day), exist_ok=True)
+        with open(self.prefetcher._meta_path(name, day), "w", encoding="utf-8") as f:
+            json.dump({"name": name, "date": day.isoformat(), "text": text, "files": [],
+                       "sha256": hashlib.sha256(text.encode()).hexdigest()}, f)
+
+    def test_prefetch_then_get_from_disk(self):
+        calls = []
+        self.prefetcher.register("news", lambda: calls.append(1) or "today")
+
+        self.assertTrue(self.prefetcher.prefetch("news"))
+        self.assertEqual(self.prefetcher.get("news")["text"], "today")
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.prefetcher.stats()["news"]["hits"], 1)
+
+    def test_retry_then_fail_and_fallback(self):
+        answers = iter(["", "", "", "late"])
+        self.prefetcher.register("news", lambda: next(answers))
+
+        self.assertFalse(self.prefetcher.prefetch("news"))
+        c = self.prefetcher.stats()["news"]
+        self.assertEqual((c["retries"], c["failures"]), (2, 1))
+
+        # 发送时临时获取一次
+        self.assertEqual(self.prefetcher.get("news")["text"], "late")
+        self.assertEqual(self.prefetcher.stats()["news"]["misses"], 1)
+
+    def test_stale_retried_but_sent(self):
+        self.save_yesterday("news", "same")
+        self.prefetcher.register("news", lambda: "same")
+
+        # 预取时按失败重试，发送时照常发送
+        self.assertFalse(self.prefetcher.prefetch("news"))
+        self.assertEqual(self.prefetcher.stats()["news"]["stale"], 3)
+        self.assertEqual(self.prefetcher.get("news")["text"], "same")
+
+    def test_stale_recovers_after_update(self):
+        self.save_yesterday("news", "old")
+        answers = iter(["old", "new"])
+        self.prefetcher.register("news", lambda: next(answers))
+
+        self.assertTrue(self.prefetcher.prefetch("news"))
+        self.assertEqual(self.prefetcher.get("news")["text"], "new")
+
+    def test_files_moved_and_registered(self):
+        src = os.path.join(self.tmp.name, "moyu.jpg")
+        with open(src, "wb") as f:
+            f.write(PNG)
+        self.prefetcher.register("moyu", lambda: [src], kind="files")
+
+        self.assertTrue(self.prefetcher.prefetch("moyu"))
+        path = self.prefetcher.get("moyu")["files"][0]["path"]
+        self.assertFalse(os.path.exists(src))
+        self.assertTrue(path.startswith(os.path.abspath(self.prefetcher.cache_dir)))
+        # 移到预取目录之后再登记
+        self.media_store.add.assert_called_once_with(mock.ANY, "moyu")
+        self.assertEqual(os.path.abspath(self.media_store.add.call_args[0][0]), path)
+
+    def test_invalid_file_rejected(self):
+        src = os.path.join(self.tmp.name, "error.jpg")
+        with open(src, "wb") as f:
+            f.write(b"<html>error</html>")
+        self.prefetcher.register("moyu", lambda: [src], kind="files")
+
+        self.assertIsNone(self.prefetcher.get("moyu"))
+
+    def test_tampered_file_refetched(self):
+        answers = iter([[self.image("a")], [self.image("b")]])
+        self.prefetcher.register("moyu", lambda: next(answers), kind="files")
+        self.assertTrue(self.prefetcher.prefetch("moyu"))
+        with open(self.prefetcher.get("moyu")["files"][0]["path"], "ab") as f:
+            f.write(b"x")
+
+        self.assertEqual(self.prefetcher.stats()["moyu"]["misses"], 0)
+        self.assertIsNotNone(self.prefetcher.get("moyu"))
+        self.assertEqual(self.prefetcher.stats()["moyu"]["misses"], 1)
+
+    def image(self, suffix):
+        path = os.path.join(self.tmp.name, f"{suffix}.png")
+        with open(path, "wb") as f:
+            f.write(PNG + suffix.encode())
+        return path
+
+
+if __name__ == '__main__':
+    unittest.main()
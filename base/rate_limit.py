@@ -0,0 +1,77 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import time
+from threading import Lock
+
+
+class TokenBucket(object):
+    """令牌桶限速，rate 为每秒补充的令牌数，capacity 为桶容量（允许的突发量）
+    rate 为 0 或空时不限速
+    """
+
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.rate = rate or 0
+        self.capacity = capacity if capacity is not None else max(self.rate, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    @classmethod
+    def per_minute(cls, amount: float) -> "TokenBucket":
+        """每分钟 amount 个，允许一分钟的额度一次用完"""
+        return cls(amount / 60 if amount else 0, amount or None)
+
+    @property
+    def unlimited(self) -> bool:
+        return not self.rate
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, n: float = 1) -> float:
+        """还要等多少秒才有 n 个令牌；超过桶容量的请求等桶满即可"""
+        if self.unlimited:
+            return 0
+        with self.lock:
+            self._refill()
+            n = min(n, self.capacity)
+            return max(0.0, (n - self.tokens) / self.rate)
+
+    def try_consume(self, n: float = 1) -> bool:
+        if self.unlimited:
+            return True
+        with self.lock:
+            self._refill()
+            if self.tokens < min(n, self.capacity):
+                return False
+            # 超过桶容量的请求会让余额变成负数，后面的请求相应多等
+            self.tokens -= n
+            return True
+
+    def consume(self, n: float = 1, timeout: float = None) -> bool:
+        """阻塞直到拿到 n 个令牌，超时返回 False"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.try_consume(n):
+            wait = self.wait_time(n)
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(max(wait, 0.01), 1))
+        return True
+
+    def adjust(self, n: float) -> None:
+        """按实际用量修正：n 为正表示多用了，为负表示退回"""
+        if self.unlimited:
+            return
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - n)
+
+    def fill_ratio(self) -> float:
+        if self.unlimited:
+            return 1.0
+        with self.lock:
+            self._refill()
+            return self.tokens / self.capacity
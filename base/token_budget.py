@@ -0,0 +1,148 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import math
+import re
+from threading import Lock
+from typing import Tuple
+
+# 中日韩字符、全角标点大约一个字一个 token
+_CJK = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef\u3000-\u303f]")
+_MESSAGE_OVERHEAD = 4  # 每条消息的角色、分隔符等固定开销
+_REPLY_OVERHEAD = 3  # 回复的起始标记
+_TRUNCATED = "...(已截断)"
+
+
+def estimate_tokens(text) -> int:
+    """离线估算 token 数，不需要联网也不依赖 tiktoken
+    中文按一个字一个 token，其他字符按四个字符一个 token，和 gpt-3.5/gpt-4 的实际值误差一般在两成以内
+    """
+    if not text:
+        return 0
+    if not isinstance(text, str):
+        text = json.dumps(text, ensure_ascii=False, default=str)
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+def message_tokens(message) -> int:
+    """一条消息的 token 数，包括内容、函数名和工具调用参数"""
+    if not isinstance(message, dict):
+        message = {"content": str(message)}
+    tokens = _MESSAGE_OVERHEAD
+    for key in ("content", "name"):
+        tokens += estimate_tokens(message.get(key))
+    for tool_call in message.get("tool_calls") or []:
+        tokens += estimate_tokens(tool_call)
+    if message.get("function_call"):
+        tokens += estimate_tokens(message["function_call"])
+    return tokens
+
+
+def truncate_text(text: str, max_tokens: int, suffix: str = _TRUNCATED) -> str:
+    """把文本截断到不超过 max_tokens 个 token"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    used = 0.0
+    for i, ch in enumerate(text):
+        used += 1 if _CJK.match(ch) else 0.25
+        if used > max_tokens:
+            return text[:i] + suffix
+    return text
+
+
+def is_tool_message(message) -> bool:
+    return isinstance(message, dict) and message.get("role") in ("tool", "function")
+
+
+class ContextBuilder(object):
+    """按 token 预算组装请求上下文
+    - 系统提示总是保留
+    - 当前这一轮（最后一条用户消息及之后）总是保留
+    - 之前轮次的工具返回先截断到 tool_max_tokens
+    - 仍然超预算时从最旧的消息开始丢，工具返回和发起调用的 assistant 消息一起丢
+    """
+
+    def __init__(self, max_tokens: int = 3000, tool_max_tokens: int = 200) -> None:
+        self.max_tokens = max_tokens
+        self.tool_max_tokens = tool_max_tokens
+        self.lock = Lock()
+        self.counters = {"requests": 0, "total_tokens": 0, "max_tokens": 0, "last_tokens": 0,
+                         "dropped_messages": 0, "truncated_tools": 0}
+
+    @classmethod
+    def from_config(cls, conf: dict) -> "ContextBuilder":
+        conf = conf or {}
+        return cls(max_tokens=conf.get("max_prompt_tokens", 3000), tool_max_tokens=conf.get("tool_max_tokens", 200))
+
+    def build(self, system: list, history: list) -> Tuple[list, int]:
+        """返回 (要发送的消息列表, 估算的 prompt token 数)"""
+        last_user = max((i for i, m in enumerate(history) if isinstance(m, dict) and m.get("role") == "user"),
+                        default=max(len(history) - 1, 0))
+        budget = self.max_tokens - sum(message_tokens(m) for m in system) - _REPLY_OVERHEAD
+
+        # 当前这一轮整体保留，超预算时只能截断这一轮的工具返回
+        current = history[last_user:]
+        truncated = 0
+        if sum(message_tokens(m) for m in current) > budget:
+            tools = [i for i, m in enumerate(current) if is_tool_message(m) and isinstance(m.get("content"), str)]
+            if tools:
+                available = budget - sum(message_tokens(m) for i, m in enumerate(current) if i not in tools)
+                # 截断后缀也占 token
+                limit = available // len(tools) - _MESSAGE_OVERHEAD - estimate_tokens(_TRUNCATED)
+                limit = max(limit, self.tool_max_tokens)
+                current = list(current)
+                for i in tools:
+                    current[i], changed = self._truncate(current[i], limit)
+                    truncated += changed
+        used = sum(message_tokens(m) for m in current)
+
+        messages = []
+        for m in history[:last_user]:
+            if is_tool_message(m) and isinstance(m.get("content"), str):
+                m, changed = self._truncate(m, self.tool_max_tokens)
+                truncated += changed
+            messages.append(m)
+
+        # 工具返回挂在前一条消息后面，作为一个整体保留或丢弃
+        units = []
+        for m in messages:
+            if is_tool_message(m) and units:
+                units[-1].append(m)
+            else:
+                units.append([m])
+
+        kept = []
+        for unit in reversed(units):
+            tokens = sum(message_tokens(m) for m in unit)
+            if used + tokens > budget:
+                break
+            kept.append(unit)
+            used += tokens
+
+        dropped = len(units) - len(kept)
+        result = list(system) + [m for unit in reversed(kept) for m in unit] + current
+        total = self.max_tokens - budget + used
+        with self.lock:
+            c = self.counters
+            c["requests"] += 1
+            c["total_tokens"] += total
+            c["max_tokens"] = max(c["max_tokens"], total)
+            c["last_tokens"] = total
+            c["dropped_messages"] += sum(len(unit) for unit in units[:dropped])
+            c["truncated_tools"] += truncated
+        return result, total
+
+    @staticmethod
+    def _truncate(message: dict, max_tokens: int) -> Tuple[dict, int]:
+        content = truncate_text(message["content"], max_tokens)
+        if content is message["content"]:
+            return message, 0
+        return dict(message, content=content), 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+        stats["avg_tokens"] = stats["total_tokens"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
@@ -0,0 +1,38 @@
+import unittest
+
+from base.token_budget import ContextBuilder, message_tokens
+
+
+class ContextBuilderTestCase(unittest.TestCase):
+    def test_keep_current_turn_with_large_tool_result(self):
+        builder = ContextBuilder(max_tokens=120, tool_max_tokens=20)
+        system = [{"role": "system", "content": "你是机器人"}]
+        history = [
+            {"role": "user", "content": "以前的问题"},
+            {"role": "assistant", "content": "以前的回答"},
+            {"role": "user", "content": "北京天气怎么样"},
+            {"role": "assistant", "content": None, "tool_calls": [{"id": "1", "function": {"name": "weather"}}]},
+            {"role": "tool", "tool_call_id": "1", "content": "晴" * 500},
+        ]
+        messages, total = builder.build(system, history)
+
+        self.assertEqual([m["role"] for m in messages], ["system", "user", "assistant", "tool"])
+        self.assertEqual(messages[1]["content"], "北京天气怎么样")
+        self.assertLess(len(messages[3]["content"]), 500)
+        self.assertLessEqual(total, 120)
+        self.assertEqual(builder.stats()["dropped_messages"], 2)
+
+    def test_drop_oldest_history(self):
+        builder = ContextBuilder(max_tokens=60)
+        system = [{"role": "system", "content": "你是机器人"}]
+        history = [{"role": "user" if i % 2 == 0 else "assistant", "content": "消息%d" % i + "啊" * 10}
+                   for i in range(10)]
+        messages, total = builder.build(system, history)
+
+        self.assertEqual(messages[-1], history[-1])
+        self.assertLessEqual(total, 60)
+        self.assertEqual(total, sum(message_tokens(m) for m in messages) + 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
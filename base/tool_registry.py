@@ -0,0 +1,186 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import bisect
+import inspect
+import time
+import traceback
+from threading import Lock
+from types import GenericAlias
+from typing import Annotated, Callable, Optional, get_origin
+
+# Python 类型 -> JSON Schema 类型
+_JSON_TYPES = {"str": "string", "int": "integer", "float": "number", "bool": "boolean",
+               "list": "array", "tuple": "array", "dict": "object"}
+# 耗时直方图的分桶上限，毫秒
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Tool(object):
+    """注册好的工具，两种模型需要的描述在注册时就生成好"""
+
+    def __init__(self, func: Callable, timeout: Optional[float] = None) -> None:
+        self.func = func
+        self.name = func.__name__
+        self.timeout = timeout
+        self.description = inspect.getdoc(func).strip()
+        self.params = self._parse_params(func)
+        # ChatGLM3 function call 格式
+        self.chatglm_schema = {
+            "name": self.name,
+            "description": self.description,
+            "params": self.params,
+        }
+        # OpenAI tools 格式
+        self.openai_schema = {
+            "type": "function",
+            "function": {
+                "name": self.name,
+                "description": self.description,
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        p["name"]: {"type": _JSON_TYPES.get(p["type"].split("[")[0], "string"),
+                                    "description": p["description"]}
+                        for p in self.params
+                    },
+                    "required": [p["name"] for p in self.params if p["required"]],
+                },
+            },
+        }
+
+    @staticmethod
+    def _parse_params(func: Callable) -> list:
+        params = []
+        for name, param in inspect.signature(func).parameters.items():
+            annotation = param.annotation
+            if annotation is inspect.Parameter.empty:
+                raise TypeError(f"Parameter `{name}` missing type annotation")
+            if get_origin(annotation) != Annotated:
+                raise TypeError(
+                    f"Annotation type for `{name}` must be typing.Annotated")
+
+            typ, (description, required) = annotation.__origin__, annotation.__metadata__
+            typ: str = str(typ) if isinstance(typ, GenericAlias) else typ.__name__
+            if not isinstance(description, str):
+                raise TypeError(f"Description for `{name}` must be a string")
+            if not isinstance(required, bool):
+                raise TypeError(f"Required for `{name}` must be a bool")
+
+            params.append({
+                "name": name,
+                "description": description,
+                "type": typ,
+                "required": required
+            })
+        return params
+
+
+class ToolRegistry(object):
+    """ChatGPT 和 ChatGLM 共用的工具注册表
+    - 工具描述在注册时生成好，取用时不再构造或深拷贝，调用方不要修改返回的描述
+    - 按名字查表分发
+    - 统计每个工具的调用次数、失败率和耗时分布
+    """
+
+    def __init__(self) -> None:
+        self.tools = {}
+        self.lock = Lock()
+        self.counters = {}
+        self._schema_cache = {}
+
+    def register(self, func: Callable = None, *, timeout: Optional[float] = None):
+        """注册工具，可以直接用 @register 或者 @register(timeout=10)
+        函数文档作为工具描述，参数需要用 Annotated[类型, 说明, 是否必填] 标注
+        """
+        def decorator(f: Callable) -> Callable:
+            tool = Tool(f, timeout)
+            with self.lock:
+                self.tools[tool.name] = tool
+                self.counters[tool.name] = {"calls": 0, "errors": 0, "total_ms": 0.0,
+                                            "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+                self._schema_cache.clear()
+            return f
+
+        return decorator(func) if func else decorator
+
+    def schemas(self, provider: str, names: Optional[tuple] = None) -> list:
+        """工具描述列表
+        :param provider: openai 或 chatglm
+        :param names: 只要这些工具，默认全部
+        """
+        key = (provider, tuple(names) if names else None)
+        schemas = self._schema_cache.get(key)
+        if schemas is None:
+            tools = [self.tools[n] for n in names] if names else list(self.tools.values())
+            attr = "openai_schema" if provider == "openai" else "chatglm_schema"
+            schemas = [getattr(t, attr) for t in tools]
+            self._schema_cache[key] = schemas
+        return schemas
+
+    def timeout(self, name: str, default: Optional[float] = None) -> Optional[float]:
+        tool = self.tools.get(name)
+        return tool.timeout if tool and tool.timeout is not None else default
+
+    def call(self, name: str, params: dict):
+        """调用工具，出错时抛出异常"""
+        tool = self.tools.get(name)
+        if tool is None:
+            raise KeyError(f"Tool `{name}` not found")
+
+        start = time.perf_counter()
+        failed = True
+        try:
+            result = tool.func(**params)
+            failed = False
+            return result
+        finally:
+            self._record(name, (time.perf_counter() - start) * 1000, failed)
+
+    def dispatch(self, name: str, params: dict):
+        """调用工具，出错时返回错误信息而不是抛出异常，给模型作为观察结果"""
+        if name not in self.tools:
+            return f"Tool `{name}` not found. Please use a provided tool."
+        try:
+            return self.call(name, params)
+        except BaseException:
+            return traceback.format_exc()
+
+    def stats(self) -> dict:
+        """每个工具的调用次数、失败次数、失败率、平均耗时和耗时直方图（毫秒分桶）"""
+        with self.lock:
+            stats = {}
+            for name, c in self.counters.items():
+                labels = [f"<={b}" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+                stats[name] = {
+                    "calls": c["calls"],
+                    "errors": c["errors"],
+                    "error_rate": c["errors"] / c["calls"] if c["calls"] else 0.0,
+                    "avg_ms": c["total_ms"] / c["calls"] if c["calls"] else 0.0,
+                    "histogram_ms": dict(zip(labels, c["buckets"])),
+                }
+            return stats
+
+    def _record(self, name: str, cost: float, failed: bool) -> None:
+        with self.lock:
+            c = self.counters[name]
+            c["calls"] += 1
+            c["errors"] += int(failed)
+            c["total_ms"] += cost
+            c["buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, cost)] += 1
+
+
+# 进程内共享的注册表
+registry = ToolRegistry()
+register_tool = registry.register
+
+
+def dispatch_tool(tool_name: str, tool_params: dict):
+    return registry.dispatch(tool_name, tool_params)
+
+
+def get_tools(names: Optional[tuple] = None) -> dict:
+    """ChatGLM 格式的工具描述，按名字索引
+    :param names: 只要这些工具，默认全部
+    """
+    return {schema["name"]: schema for schema in registry.schemas("chatglm", names)}
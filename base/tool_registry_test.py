@@ -0,0 +1,94 @@
+import time
+import unittest
+from typing import Annotated
+
+from base.tool_registry import ToolRegistry
+
+
+class ToolRegistryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.registry = ToolRegistry()
+
+        @self.registry.register(timeout=5)
+        def weather(city: Annotated[str, '城市名称', True], days: Annotated[int, '天数', False] = 1) -> str:
+            """获取天气"""
+            return f"{city}:{days}"
+
+        @self.registry.register
+        def fail() -> None:
+            """总是失败"""
+            raise ValueError("boom")
+
+    def test_register(self):
+        self.assertEqual(set(self.registry.tools), {"weather", "fail"})
+        self.assertEqual(self.registry.timeout("weather"), 5)
+        self.assertEqual(self.registry.timeout("fail", 30), 30)
+        self.assertEqual(self.registry.timeout("missing", 30), 30)
+
+    def test_annotation_required(self):
+        with self.assertRaises(TypeError):
+            @self.registry.register
+            def bad(city: str) -> str:
+                """缺少 Annotated"""
+                return city
+
+        with self.assertRaises(TypeError):
+            @self.registry.register
+            def bad_required(city: Annotated[str, '城市名称', 'yes']) -> str:
+                """必填标记不是 bool"""
+                return city
+
+    def test_schemas(self):
+        openai = self.registry.schemas("openai", ("weather",))
+        params = openai[0]["function"]["parameters"]
+        self.assertEqual(params["properties"]["city"], {"type": "string", "description": "城市名称"})
+        self.assertEqual(params["properties"]["days"]["type"], "integer")
+        self.assertEqual(params["required"], ["city"])
+
+        chatglm = self.registry.schemas("chatglm")
+        self.assertEqual([s["name"] for s in chatglm], ["weather", "fail"])
+        self.assertEqual(chatglm[0]["description"], "获取天气")
+
+    def test_schemas_cached(self):
+        first = self.registry.schemas("openai")
+        self.assertIs(self.registry.schemas("openai"), first)
+
+        @self.registry.register
+        def ping() -> str:
+            """新工具"""
+            return "pong"
+
+        # 注册新工具后缓存失效
+        self.assertEqual(len(self.registry.schemas("openai")), 3)
+
+    def test_call_and_dispatch(self):
+        self.assertEqual(self.registry.call("weather", {"city": "北京", "days": 3}), "北京:3")
+        with self.assertRaises(ValueError):
+            self.registry.call("fail", {})
+        with self.assertRaises(KeyError):
+            self.registry.call("missing", {})
+
+        self.assertIn("ValueError: boom", self.registry.dispatch("fail", {}))
+        self.assertIn("not found", self.registry.dispatch("missing", {}))
+
+    def test_stats(self):
+        @self.registry.register
+        def slow() -> None:
+            """慢工具"""
+            time.sleep(0.06)
+
+        self.registry.call("weather", {"city": "北京"})
+        self.registry.dispatch("fail", {})
+        self.registry.dispatch("fail", {})
+        self.registry.call("slow", {})
+
+        stats = self.registry.stats()
+        self.assertEqual((stats["weather"]["calls"], stats["weather"]["errors"]), (1, 0))
+        self.assertEqual((stats["fail"]["calls"], stats["fail"]["errors"], stats["fail"]["error_rate"]), (2, 2, 1.0))
+        self.assertEqual(stats["weather"]["histogram_ms"]["<=50"], 1)
+        self.assertEqual(stats["slow"]["histogram_ms"]["<=100"], 1)
+        self.assertGreaterEqual(stats["slow"]["avg_ms"], 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
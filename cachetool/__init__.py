@@ -0,0 +1,3 @@
+__all__ = ['ttl_cache']
+
+from .ttl_cache import *
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import time
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Callable, Hashable, Optional
+
+
+class _Call(object):
+    """一次正在进行中的加载，相同 key 的并发调用共享它的结果"""
+
+    def __init__(self) -> None:
+        self.event = Event()
+        self.result = None
+        self.error = None
+
+
+class TTLCache(object):
+    """带过期时间、按条数限制大小的 LRU 缓存
+    get_or_load 带 singleflight：同一个 key 同时只有一个线程真正去加载，其他线程等待并共享结果。
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 300) -> None:
+        """
+        :param max_size: 最多缓存的条数，超出时淘汰最久未使用的
+        :param ttl: 默认过期时间，秒
+        """
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self.data = OrderedDict()  # key -> (过期时间, 值)
+        self.inflight = {}  # key -> _Call
+        self.lock = Lock()
+        self.counters = {"hits": 0, "misses": 0, "coalesced": 0, "loads": 0, "load_errors": 0,
+                         "evictions": 0, "expired": 0}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            found, value = self._lookup(key)
+            self.counters["hits" if found else "misses"] += 1
+            return value if found else default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        with self.lock:
+            self._store(key, value, ttl)
+
+    def delete(self, key: Hashable) -> None:
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.data.clear()
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], ttl: Optional[float] = None,
+                    cache_none: bool = False) -> Any:
+        """命中直接返回，否则调用 loader 加载并缓存
+        :param key: 缓存键
+        :param loader: 加载函数，抛出的异常会传给所有等待这个 key 的调用方，且不会被缓存
+        :param ttl: 过期时间，默认使用构造时的 ttl
+        :param cache_none: 是否缓存 None，默认不缓存（接口出错时通常返回 None）
+        """
+        with self.lock:
+            found, value = self._lookup(key)
+            if found:
+                self.counters["hits"] += 1
+                return value
+
+            call = self.inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.inflight[key] = call
+                self.counters["misses"] += 1
+            else:
+                self.counters["coalesced"] += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = loader()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+                self.counters["loads"] += 1
+                if call.error is not None:
+                    self.counters["load_errors"] += 1
+                elif call.result is not None or cache_none:
+                    self._store(key, call.result, ttl)
+            call.event.set()
+
+        return call.result
+
+    def stats(self) -> dict:
+        """命中、未命中、合并的并发请求、淘汰、过期次数，以及当前条数和命中率"""
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.data)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.data)
+
+    def _lookup(self, key: Hashable):
+        item = self.data.get(key)
+        if item is None:
+            return False, None
+        expire_at, value = item
+        if expire_at <= time.monotonic():
+            del self.data[key]
+            self.counters["expired"] += 1
+            return False, None
+        self.data.move_to_end(key)
+        return True, value
+
+    def _store(self, key: Hashable, value: Any, ttl: Optional[float]) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        self.data[key] = (time.monotonic() + ttl, value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+            self.counters["evictions"] += 1
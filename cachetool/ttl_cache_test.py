@@ -0,0 +1,58 @@
+import threading
+import time
+import unittest
+
+from cachetool import TTLCache
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    def test_expire(self):
+        cache = TTLCache(max_size=4, ttl=0.05)
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+
+        time.sleep(0.06)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["expired"], 1)
+
+    def test_lru_eviction(self):
+        cache = TTLCache(max_size=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")  # a 最近使用过，应该淘汰 b
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+    def test_singleflight(self):
+        cache = TTLCache()
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.05)
+            return "value"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", loader))) for _ in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["value"] * 10)
+        self.assertEqual(cache.stats()["coalesced"], 9)
+
+    def test_error_and_none_not_cached(self):
+        cache = TTLCache()
+        with self.assertRaises(ZeroDivisionError):
+            cache.get_or_load("k", lambda: 1 / 0)
+        self.assertIsNone(cache.get_or_load("k", lambda: None))
+        self.assertEqual(cache.get_or_load("k", lambda: 1), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -38,3 +38,20 @@ class Config(object):
         self.CHATGLM = yconfig.get("chatglm", {})
         self.BardAssistant = yconfig.get("bard", {})
         self.DB = yconfig.get("db", {})
+        self.DISPATCHER = yconfig.get("dispatcher", {})
+        self.MSG_BUFFER = yconfig.get("msg_buffer", {})
+        self.INGRESS = yconfig.get("ingress", {}) or {}
+        self.HTTP = yconfig.get("http", {})
+        self.CONVERSATION = yconfig.get("conversation", {})
+        self.STREAM = yconfig.get("stream", {}) or {}
+        self.ANSWER_CACHE = yconfig.get("answer_cache", {}) or {}
+        self.ROUTER = yconfig.get("router", {}) or {}
+        self.LLM_SCHEDULER = yconfig.get("llm_scheduler", {}) or {}
+        self.DEADLINE = yconfig.get("deadline", {}) or {}
+        self.OUTBOX = yconfig.get("outbox", {}) or {}
+        self.BROADCAST = yconfig.get("broadcast", {}) or {}
+        self.SCHEDULER = yconfig.get("scheduler", {}) or {}
+        self.PREFETCH = yconfig.get("prefetch", {}) or {}
+        self.TIKTOK_POOL = yconfig.get("tiktok_pool", {}) or {}
+        self.MEDIA_STORE = yconfig.get("media_store", {}) or {}
+        self.IMAGE_JOBS = yconfig.get("image_jobs", {}) or {}
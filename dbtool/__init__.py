@@ -1,3 +1,4 @@
-__all__ = ['dbpool']
+__all__ = ['dbpool', 'msg_buffer']
 
 from .dbpool import *
+from .msg_buffer import *
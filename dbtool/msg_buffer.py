@@ -0,0 +1,171 @@
+# -*-coding:utf-8-*-
+import logging
+import time
+from threading import Event, Lock, Thread
+
+import pymysql
+
+from .dbpool import MysqlBase
+
+# MySQL server has gone away / Lost connection to MySQL server，重连后可以重试
+_CONNECTION_ERRORS = (2006, 2013)
+
+
+def is_connection_error(e: Exception) -> bool:
+    if isinstance(e, pymysql.InterfaceError):
+        return True
+    return isinstance(e, pymysql.Error) and bool(e.args) and e.args[0] in _CONNECTION_ERRORS
+
+
+class MsgBuffer:
+    """写缓冲：先把行数据攒在内存里，按数量或时间触发，用 executemany 在一个事务里批量写入
+    连接错误时整批放回队首，下次写入前先重连再重试；其他数据库错误（主键重复、编码错误）改为逐行写入，丢弃写不进去的行
+    """
+
+    def __init__(self, db: MysqlBase, sql, batch_size=100, flush_interval=1.0, max_size=10000):
+        """
+        :param db: 数据库实例
+        :param sql: 批量写入的语句
+        :param batch_size: 攒够多少行立即写入
+        :param flush_interval: 最长多少秒写入一次
+        :param max_size: 缓冲上限，写库持续失败时丢弃最旧的数据，避免内存无限增长
+        """
+        self.logger = logging.getLogger("MsgBuffer")
+        self.db = db
+        self.sql = sql
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_size = max(self.batch_size, max_size)
+        self.rows = []
+        self.lock = Lock()  # 保护 rows
+        self.flush_lock = Lock()  # 保证同一时间只有一个线程在写库
+        self.wakeup = Event()
+        self.stopped = Event()
+        self.disconnected = False  # 上次写入遇到连接错误，下次写入前需要重连
+        self.counters = {"appended": 0, "flushed": 0, "dropped": 0, "failed_flushes": 0, "bad_rows": 0,
+                         "reconnects": 0, "flushes": 0, "last_flush_ms": 0.0, "max_flush_ms": 0.0, "total_flush_ms": 0.0}
+        self.thread = Thread(target=self._run, name="MsgBuffer", daemon=True)
+        self.thread.start()
+
+    def append(self, row) -> None:
+        """追加一行，不阻塞调用方"""
+        with self.lock:
+            self.rows.append(row)
+            self.counters["appended"] += 1
+            overflow = len(self.rows) - self.max_size
+            if overflow > 0:
+                del self.rows[:overflow]
+                self.counters["dropped"] += overflow
+            full = len(self.rows) >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def flush(self) -> int:
+        """把当前缓冲的数据写入数据库，返回写入的行数"""
+        with self.flush_lock:
+            with self.lock:
+                rows, self.rows = self.rows, []
+            if not rows:
+                return 0
+            if self.disconnected and not self._reconnect():
+                self._requeue(rows)
+                return 0
+
+            start = time.perf_counter()
+            try:
+                self.db.executemany(self.sql, rows)
+                written = len(rows)
+            except Exception as e:
+                self.logger.error(f"Flush {len(rows)} rows error: {e}")
+                if not isinstance(e, pymysql.Error) or is_connection_error(e):
+                    self.disconnected = is_connection_error(e)
+                    self._requeue(rows)
+                    return 0
+                # 某一行数据有问题，整批都会失败，逐行写入找出这一行
+                self._rollback()
+                written = self._insert_each(rows)
+
+            cost = (time.perf_counter() - start) * 1000
+            with self.lock:
+                self.counters["flushes"] += 1
+                self.counters["flushed"] += written
+                self.counters["last_flush_ms"] = cost
+                self.counters["total_flush_ms"] += cost
+                self.counters["max_flush_ms"] = max(self.counters["max_flush_ms"], cost)
+            return written
+
+    def _reconnect(self) -> bool:
+        """连接断开（例如 MySQL 重启）后重连，数据库还没恢复时返回 False"""
+        try:
+            self.db.get_connection().ping(reconnect=True)
+        except Exception as e:
+            self.logger.error(f"Reconnect error: {e}")
+            return False
+        self.disconnected = False
+        with self.lock:
+            self.counters["reconnects"] += 1
+        return True
+
+    def _requeue(self, rows: list) -> None:
+        with self.lock:
+            # 放回队首等下次重试，超出上限的部分丢弃最旧的
+            self.rows = rows + self.rows
+            overflow = len(self.rows) - self.max_size
+            if overflow > 0:
+                del self.rows[:overflow]
+                self.counters["dropped"] += overflow
+            self.counters["failed_flushes"] += 1
+
+    def _rollback(self) -> None:
+        # executemany 可能已经写入了前面的部分，回滚掉，避免逐行写入时重复
+        try:
+            self.db.get_connection().rollback()
+        except Exception as e:
+            self.logger.warning(f"Rollback error: {e}")
+
+    def _insert_each(self, rows: list) -> int:
+        """逐行写入，丢弃写不进去的行；遇到连接错误时把剩下的行放回队首"""
+        written = 0
+        for i, row in enumerate(rows):
+            try:
+                self.db.execute(self.sql, row)
+                written += 1
+            except Exception as e:
+                if not isinstance(e, pymysql.Error) or is_connection_error(e):
+                    self.logger.error(f"Insert row error, requeue {len(rows) - i} rows: {e}")
+                    self.disconnected = is_connection_error(e)
+                    self._requeue(rows[i:])
+                    break
+                self.logger.error(f"Drop bad row {row!r:.200}: {e}")
+                with self.lock:
+                    self.counters["bad_rows"] += 1
+        return written
+
+    def depth(self) -> int:
+        """当前缓冲中等待写入的行数"""
+        with self.lock:
+            return len(self.rows)
+
+    def stats(self) -> dict:
+        with self.lock:
+            stats = dict(self.counters)
+            stats["depth"] = len(self.rows)
+        flushes = stats["flushes"]
+        stats["avg_flush_ms"] = stats["total_flush_ms"] / flushes if flushes else 0.0
+        return stats
+
+    def stop(self) -> None:
+        """停止后台线程并把剩余数据写完，退出前调用"""
+        self.stopped.set()
+        self.wakeup.set()
+        self.thread.join(timeout=5)
+        self.flush()
+        self.logger.info(f"MsgBuffer stopped: {self.stats()}")
+
+    def _run(self):
+        while not self.stopped.is_set():
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            if self.stopped.is_set():
+                break
+            self.flush()
@@ -0,0 +1,110 @@
+import unittest
+
+import pymysql
+
+from dbtool.msg_buffer import MsgBuffer
+
+
+class FakeDB(object):
+    """executemany 遇到坏行整批失败，execute 逐行写入
+    connected 为 False 时所有写入都报连接错误，只有服务可用（up）时 ping(reconnect=True) 才能恢复连接
+    """
+
+    def __init__(self, bad=(), errors=None) -> None:
+        self.bad = set(bad)
+        self.errors = list(errors or [])
+        self.rows = []
+        self.connected = True
+        self.up = True
+        self.pings = 0
+
+    def executemany(self, sql, rows):
+        if not self.connected:
+            raise pymysql.OperationalError(2006, "MySQL server has gone away")
+        if self.errors:
+            raise self.errors.pop(0)
+        if self.bad & set(rows):
+            raise pymysql.IntegrityError(1062, "Duplicate entry")
+        self.rows.extend(rows)
+
+    def execute(self, sql, row):
+        if not self.connected:
+            raise pymysql.OperationalError(2006, "MySQL server has gone away")
+        if row in self.bad:
+            raise pymysql.IntegrityError(1062, "Duplicate entry")
+        self.rows.append(row)
+
+    def get_connection(self):
+        return self
+
+    def rollback(self):
+        pass
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+        if not self.up:
+            raise pymysql.OperationalError(2003, "Can't connect to MySQL server")
+        if reconnect:
+            self.connected = True
+
+
+class MsgBufferTestCase(unittest.TestCase):
+    def make(self, db):
+        buffer = MsgBuffer(db, "INSERT", batch_size=100, flush_interval=60)
+        self.addCleanup(buffer.stopped.set)
+        return buffer
+
+    def test_drop_bad_row(self):
+        db = FakeDB(bad=[2])
+        buffer = self.make(db)
+        for i in range(5):
+            buffer.append(i)
+
+        self.assertEqual(buffer.flush(), 4)
+        self.assertEqual(db.rows, [0, 1, 3, 4])
+        self.assertEqual(buffer.depth(), 0)
+        self.assertEqual(buffer.stats()["bad_rows"], 1)
+
+    def test_requeue_on_connection_error(self):
+        db = FakeDB(errors=[pymysql.OperationalError(2013, "Lost connection")])
+        buffer = self.make(db)
+        buffer.append(1)
+        buffer.append(2)
+
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.depth(), 2)
+        buffer.append(3)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(db.rows, [1, 2, 3])
+
+
+    def test_reconnect_after_server_restart(self):
+        db = FakeDB()
+        buffer = self.make(db)
+        buffer.append(1)
+
+        # 服务重启：旧连接失效，服务恢复前重连也失败，数据留在缓冲里
+        db.connected, db.up = False, False
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.depth(), 1)
+        self.assertEqual(db.pings, 1)
+
+        # 服务恢复后，下次写入前重连成功
+        db.up = True
+        buffer.append(2)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(db.rows, [1, 2])
+        self.assertEqual(buffer.stats()["reconnects"], 1)
+
+    def test_no_ping_when_healthy(self):
+        db = FakeDB()
+        buffer = self.make(db)
+        buffer.append(1)
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(db.pings, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,4 @@
+__all__ = ['client', 'download']
+
+from .client import *
+from .download import *
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class HttpClient(object):
+    """共享的 HTTP 客户端
+    - 同一个 Session，按主机复用连接（keep-alive），省去每次的 TCP+TLS 握手
+    - 默认带连接/读取超时，避免一个卡死的接口拖住处理线程
+    - 连接失败和 429/5xx 有限次重试，指数退避，遵守 Retry-After
+    - 按主机限制并发数
+    - 按主机统计请求数、失败数和耗时
+    """
+
+    def __init__(self, timeout=(5, 30), retries: int = 2, backoff: float = 0.5, pool_size: int = 10,
+                 max_per_host: int = 8) -> None:
+        """
+        :param timeout: 默认超时 (连接超时, 读取超时)，单位秒
+        :param retries: 最大重试次数
+        :param backoff: 退避系数，第 n 次重试前等待 backoff * 2^(n-1) 秒
+        :param pool_size: 每个主机保持的连接数
+        :param max_per_host: 每个主机的最大并发请求数
+        """
+        self.LOG = logging.getLogger("HttpClient")
+        self.lock = Lock()
+        self.semaphores = {}
+        self.counters = {}
+        self.session = None
+        self.configure(timeout=timeout, retries=retries, backoff=backoff, pool_size=pool_size,
+                       max_per_host=max_per_host)
+
+    def configure(self, timeout=None, retries: int = None, backoff: float = None, pool_size: int = None,
+                  max_per_host: int = None) -> None:
+        """修改参数并重建连接池，没有传的参数保持不变"""
+        with self.lock:
+            self.timeout = tuple(timeout) if timeout is not None else self.timeout
+            self.retries = retries if retries is not None else self.retries
+            self.backoff = backoff if backoff is not None else self.backoff
+            self.pool_size = pool_size if pool_size is not None else self.pool_size
+            if max_per_host is not None:
+                self.max_per_host = max_per_host
+                self.semaphores = {}
+
+            retry = Retry(total=self.retries, connect=self.retries, read=self.retries, backoff_factor=self.backoff,
+                          status_forcelist=(429, 500, 502, 503, 504), raise_on_status=False)
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            old, self.session = self.session, session
+        if old:
+            old.close()
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """发送请求，参数同 requests.request，未指定 timeout 时使用默认超时
+        注意 stream=True 时并发名额在返回响应时就释放了，响应体需要调用方自己读完或关闭
+        """
+        host = urlsplit(url).netloc
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        with self._semaphore(host):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except Exception:
+                self._record(host, time.perf_counter() - start, True)
+                raise
+        self._record(host, time.perf_counter() - start, response.status_code >= 400)
+        return response
+
+    def get(self, url: str, params=None, **kwargs) -> requests.Response:
+        return self.request("GET", url, params=params, **kwargs)
+
+    def post(self, url: str, data=None, json=None, **kwargs) -> requests.Response:
+        return self.request("POST", url, data=data, json=json, **kwargs)
+
+    def stats(self) -> dict:
+        """按主机统计：请求数、失败数、平均/最大耗时（毫秒）"""
+        with self.lock:
+            stats = {}
+            for host, c in self.counters.items():
+                c = dict(c)
+                c["avg_ms"] = c["total_ms"] / c["count"] if c["count"] else 0.0
+                stats[host] = c
+            return stats
+
+    def _semaphore(self, host: str) -> BoundedSemaphore:
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = BoundedSemaphore(max(1, self.max_per_host))
+            return self.semaphores[host]
+
+    def _record(self, host: str, cost: float, failed: bool) -> None:
+        cost *= 1000
+        with self.lock:
+            c = self.counters.setdefault(host, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            c["count"] += 1
+            c["errors"] += int(failed)
+            c["total_ms"] += cost
+            c["max_ms"] = max(c["max_ms"], cost)
+        if failed:
+            self.LOG.warning(f"Request to {host} failed after {cost:.0f}ms")
+
+
+# 进程内共享的客户端，所有对外的 HTTP 请求都走这里
+http_client = HttpClient()
@@ -0,0 +1,107 @@
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from httptool.client import HttpClient
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.hits[self.path] = server.hits.get(self.path, 0) + 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+            hits = server.hits[self.path]
+        try:
+            if self.path == "/slow":
+                time.sleep(0.3)
+            status = 503 if self.path == "/flaky" and hits <= 2 or self.path == "/down" else 200
+            body = b"ok"
+            self.send_response(status)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpClientTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.lock = threading.Lock()
+        cls.server.handle_error = lambda *args: None  # 客户端超时断开
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+        cls.host = f"127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.hits = {}
+        self.server.active = 0
+        self.server.max_active = 0
+
+    def test_get_and_stats(self):
+        client = HttpClient()
+        self.assertEqual(client.get(self.base + "/ok").text, "ok")
+
+        stats = client.stats()[self.host]
+        self.assertEqual((stats["count"], stats["errors"]), (1, 0))
+
+    def test_retry_on_5xx(self):
+        client = HttpClient(retries=2, backoff=0)
+        self.assertEqual(client.get(self.base + "/flaky").status_code, 200)
+        self.assertEqual(self.server.hits["/flaky"], 3)
+
+    def test_retries_exhausted_counted_as_error(self):
+        client = HttpClient(retries=1, backoff=0)
+        self.assertEqual(client.get(self.base + "/down").status_code, 503)
+        self.assertEqual(self.server.hits["/down"], 2)
+        self.assertEqual(client.stats()[self.host]["errors"], 1)
+
+    def test_default_timeout(self):
+        client = HttpClient(timeout=(1, 0.1), retries=0)
+        start = time.monotonic()
+        with self.assertRaises(requests.exceptions.RequestException):
+            client.get(self.base + "/slow")
+        self.assertLess(time.monotonic() - start, 0.25)
+        self.assertEqual(client.stats()[self.host]["errors"], 1)
+
+    def test_connection_error(self):
+        client = HttpClient(timeout=(0.2, 0.2), retries=0)
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.get("http://127.0.0.1:1/")
+        self.assertEqual(client.stats()["127.0.0.1:1"]["errors"], 1)
+
+    def test_per_host_concurrency(self):
+        client = HttpClient(max_per_host=1)
+        threads = [threading.Thread(target=client.get, args=(self.base + "/slow",)) for _ in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(3)
+
+        self.assertEqual(self.server.hits["/slow"], 3)
+        self.assertEqual(self.server.max_active, 1)
+
+    def test_configure_keeps_unset_values(self):
+        client = HttpClient(timeout=(1, 2), retries=3)
+        client.configure(retries=0)
+
+        self.assertEqual((client.timeout, client.retries), ((1, 2), 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
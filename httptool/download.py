@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+import time
+from threading import Lock
+from urllib.parse import urlsplit
+
+from .client import HttpClient, http_client
+
+
+class DownloadError(Exception):
+    """下载失败：HTTP 状态码错误、超过大小上限或者内容为空"""
+
+
+class MediaTooLarge(DownloadError):
+    """超过大小上限"""
+
+
+class MediaDownloader(object):
+    """媒体文件下载
+    - 响应体分块写入同目录下的临时文件，写完再原子重命名，不会留下半个文件，也不会整个读进内存
+    - 超过大小上限立即中止
+    - 文件按内容哈希命名，相同的内容只保存一份，已存在时直接返回已有的文件
+    - 统计下载次数、字节数、耗时和速度
+    """
+
+    def __init__(self, client: HttpClient = http_client, max_bytes: int = 100 << 20,
+                 chunk_size: int = 64 << 10) -> None:
+        """
+        :param client: 发送请求的 HTTP 客户端
+        :param max_bytes: 默认的单个文件大小上限
+        :param chunk_size: 每次读取写入的字节数
+        """
+        self.LOG = logging.getLogger("MediaDownloader")
+        self.client = client
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.lock = Lock()
+        self.counters = {"downloads": 0, "reused": 0, "errors": 0, "too_large": 0, "bytes": 0, "seconds": 0.0}
+
+    def configure(self, max_bytes: int = None, chunk_size: int = None) -> None:
+        """修改参数，没有传的参数保持不变"""
+        self.max_bytes = max_bytes or self.max_bytes
+        self.chunk_size = chunk_size or self.chunk_size
+
+    def download(self, url: str, dir_path: str, suffix: str = "", max_bytes: int = None, **kwargs) -> str:
+        """下载到 dir_path，返回文件路径，失败抛出 DownloadError 或网络异常
+        :param suffix: 文件扩展名（例如 .mp4），为空时按 URL 或 Content-Type 推断
+        :param max_bytes: 大小上限，默认使用初始化时的配置
+        :param kwargs: 传给 HttpClient.get 的其他参数
+        """
+        max_bytes = max_bytes or self.max_bytes
+        os.makedirs(dir_path, exist_ok=True)
+        start = time.perf_counter()
+        try:
+            path, size, reused = self._download(url, dir_path, suffix, max_bytes, **kwargs)
+        except Exception as e:
+            with self.lock:
+                self.counters["errors"] += 1
+                self.counters["too_large"] += int(isinstance(e, MediaTooLarge))
+            raise
+
+        cost = time.perf_counter() - start
+        with self.lock:
+            self.counters["downloads"] += 1
+            self.counters["reused"] += int(reused)
+            self.counters["bytes"] += size
+            self.counters["seconds"] += cost
+        self.LOG.info(f"下载 {url} -> {path}: {size} 字节, {cost:.2f}s, {size / cost / 1024 if cost else 0:.0f} KB/s")
+        return path
+
+    def stats(self) -> dict:
+        with self.lock:
+            c = dict(self.counters)
+        c["bytes_per_sec"] = c["bytes"] / c["seconds"] if c["seconds"] else 0.0
+        c["avg_seconds"] = c["seconds"] / c["downloads"] if c["downloads"] else 0.0
+        return c
+
+    def _download(self, url: str, dir_path: str, suffix: str, max_bytes: int, **kwargs):
+        response = self.client.get(url, stream=True, **kwargs)
+        with response:
+            if response.status_code != 200:
+                raise DownloadError(f"HTTP {response.status_code}: {url}")
+            length = response.headers.get("Content-Length")
+            if length and length.isdigit() and int(length) > max_bytes:
+                raise MediaTooLarge(f"{url} 大小 {length} 超过上限 {max_bytes}")
+
+            suffix = suffix or self._guess_suffix(url, response.headers.get("Content-Type"))
+            digest = hashlib.sha256()
+            size = 0
+            fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=dir_path)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(self.chunk_size):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise MediaTooLarge(f"{url} 超过大小上限 {max_bytes}")
+                        digest.update(chunk)
+                        f.write(chunk)
+                if size == 0:
+                    raise DownloadError(f"{url} 内容为空")
+
+                path = os.path.join(dir_path, digest.hexdigest()[:32] + suffix)
+                if os.path.exists(path):
+                    os.remove(tmp)
+                    return path, size, True
+                os.replace(tmp, path)
+                return path, size, False
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+
+    @staticmethod
+    def _guess_suffix(url: str, content_type: str = None) -> str:
+        ext = os.path.splitext(urlsplit(url).path)[1]
+        if ext and len(ext) <= 5 and ext != ".php":
+            return ext
+        if content_type:
+            ext = mimetypes.guess_extension(content_type.split(";")[0].strip())
+            if ext:
+                return ".jpg" if ext == ".jpe" else ext
+        return ""
+
+
+# 进程内共享的下载器
+media_downloader = MediaDownloader()
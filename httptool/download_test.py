@@ -0,0 +1,97 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from httptool.client import HttpClient
+from httptool.download import DownloadError, MediaDownloader, MediaTooLarge
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path == "/missing":
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        size = int(query or 0)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        if path != "/chunked":
+            self.send_header("Content-Length", str(size))
+        self.end_headers()
+        self.wfile.write(b"x" * size)
+
+    def log_message(self, *args):
+        pass
+
+
+class MediaDownloaderTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        cls.server.handle_error = lambda *args: None  # 超过上限时客户端提前断开
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.downloader = MediaDownloader(HttpClient(retries=0), max_bytes=1000, chunk_size=100)
+
+    def files(self):
+        return sorted(os.listdir(self.tmp.name))
+
+    def test_download_named_by_content(self):
+        path = self.downloader.download(self.base + "/a.mp4?500", self.tmp.name)
+
+        self.assertTrue(path.endswith(".mp4"))
+        self.assertEqual(os.path.getsize(path), 500)
+        self.assertEqual(self.files(), [os.path.basename(path)])
+
+    def test_same_content_reused(self):
+        first = self.downloader.download(self.base + "/a.mp4?500", self.tmp.name)
+        second = self.downloader.download(self.base + "/b.mp4?500", self.tmp.name)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.files(), [os.path.basename(first)])
+        self.assertEqual(self.downloader.stats()["reused"], 1)
+
+    def test_suffix_from_content_type(self):
+        path = self.downloader.download(self.base + "/apis.php?10", self.tmp.name)
+        self.assertTrue(path.endswith(".png"))
+
+    def test_too_large_by_header(self):
+        with self.assertRaises(MediaTooLarge):
+            self.downloader.download(self.base + "/big?2000", self.tmp.name)
+        self.assertEqual(self.files(), [])
+
+    def test_too_large_while_streaming(self):
+        # 没有 Content-Length，边下边数，超过上限中止，不留下临时文件
+        with self.assertRaises(MediaTooLarge):
+            self.downloader.download(self.base + "/chunked?2000", self.tmp.name)
+        self.assertEqual(self.files(), [])
+        self.assertEqual(self.downloader.stats()["too_large"], 1)
+
+    def test_per_call_limit(self):
+        with self.assertRaises(MediaTooLarge):
+            self.downloader.download(self.base + "/a?500", self.tmp.name, max_bytes=100)
+
+    def test_http_error_and_empty(self):
+        with self.assertRaises(DownloadError):
+            self.downloader.download(self.base + "/missing", self.tmp.name)
+        with self.assertRaises(DownloadError):
+            self.downloader.download(self.base + "/empty?0", self.tmp.name)
+        self.assertEqual(self.files(), [])
+        self.assertEqual(self.downloader.stats()["errors"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
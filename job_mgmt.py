@@ -1,59 +1,339 @@
 # -*- coding: utf-8 -*-
 
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
 import time
-from typing import Any, Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Condition, Lock
+from typing import Any, Callable, Optional
 
-import schedule
+
+class IntervalTrigger(object):
+    """每隔 seconds 秒执行"""
+
+    def __init__(self, seconds: float) -> None:
+        if seconds <= 0:
+            raise ValueError(f"Invalid interval: {seconds}")
+        self.seconds = seconds
+
+    def __repr__(self):
+        return f"every {self.seconds}s"
+
+    def next_after(self, ts: float) -> float:
+        return ts + self.seconds
+
+    def previous(self, now: float, last_run: float) -> Optional[float]:
+        """last_run 之后、now 之前最近一次应该执行的时间，没有错过则返回 None"""
+        if now - last_run < self.seconds:
+            return None
+        return last_run + self.seconds * ((now - last_run) // self.seconds)
+
+
+class DailyTrigger(object):
+    """每天在指定的时间执行，时间格式 HH:MM 或 HH:MM:SS"""
+
+    def __init__(self, times: list) -> None:
+        self.times = sorted(self._parse(t) for t in times)
+
+    def __repr__(self):
+        return "daily at " + ",".join("%02d:%02d:%02d" % t for t in self.times)
+
+    @staticmethod
+    def _parse(t: str) -> tuple:
+        parts = t.split(":")
+        try:
+            if len(parts) not in (2, 3):
+                raise ValueError
+            h, m, s = (int(p) for p in parts + ["0"] * (3 - len(parts)))
+            if not (0 <= h < 24 and 0 <= m < 60 and 0 <= s < 60):
+                raise ValueError
+        except ValueError:
+            raise ValueError(f"Invalid time format: {t}, must be HH:MM or HH:MM:SS")
+        return h, m, s
+
+    def _candidates(self, day: datetime):
+        for h, m, s in self.times:
+            yield day.replace(hour=h, minute=m, second=s, microsecond=0)
+
+    def next_after(self, ts: float) -> float:
+        dt = datetime.fromtimestamp(ts)
+        for day in (dt, dt + timedelta(days=1)):
+            for c in self._candidates(day):
+                if c.timestamp() > ts:
+                    return c.timestamp()
+
+    def previous(self, now: float, last_run: float) -> Optional[float]:
+        dt = datetime.fromtimestamp(now)
+        prev = max(c.timestamp() for day in (dt - timedelta(days=1), dt) for c in self._candidates(day)
+                   if c.timestamp() <= now)
+        return prev if prev > last_run else None
+
+
+class ScheduledJob(object):
+    def __init__(self, name: str, trigger, task: Callable[..., Any], args: tuple, kwargs: dict,
+                 options: dict) -> None:
+        self.name = name
+        self.trigger = trigger
+        self.task = task
+        self.args = args
+        self.kwargs = kwargs
+        self.no_overlap = options.get("no_overlap", True)  # 上一次还没执行完时跳过这一次
+        self.jitter = options.get("jitter", 0)  # 在计划时间之后随机推迟 0~jitter 秒执行
+        self.misfire_grace = options.get("misfire_grace", 60)  # 超过计划时间多少秒还没开始就放弃这一次
+        self.catch_up = options.get("catch_up", "skip")  # 重启后错过的执行：skip 跳过，run_once 补执行一次
+        self.catch_up_window = options.get("catch_up_window", 43200)  # 只补执行这么多秒以内错过的
+        self.base = None  # 下一次的计划时间，不含抖动
+        self.running = 0
+        self.counters = {"runs": 0, "failures": 0, "skipped_overlap": 0, "misfired": 0, "caught_up": 0,
+                         "total_ms": 0.0, "max_ms": 0.0, "last_ms": 0.0, "last_run": None, "last_error": None}
+
+
+class Scheduler(object):
+    """定时任务调度
+    - 任务按下一次执行时间放在堆里，调度线程一直睡到最近的一个任务到期（最长 60 秒醒一次，应对系统时间调整）
+    - 到期的任务交给线程池执行，慢任务不影响其他任务准时执行
+    - 每个任务可以配置：不重叠执行、随机抖动、错过执行的宽限时间、重启后是否补执行
+    - 每个任务的上次执行时间保存在 state_file 里，重启后据此判断是否错过
+    """
+    MAX_SLEEP = 60
+
+    def __init__(self, workers: int = 4, state_file: Optional[str] = None, conf: Optional[dict] = None) -> None:
+        self.LOG = logging.getLogger("Scheduler")
+        self.workers = workers
+        self.pool = None
+        self.state_file = state_file
+        self.state = None
+        self.conf = conf or {}
+        self.jobs = {}
+        self.heap = []
+        self.seq = itertools.count()
+        self.running = False
+        self.cond = Condition()
+        self.stateLock = Lock()
+
+    def configure(self, conf: dict) -> None:
+        """加载配置，需要在添加任务之前调用"""
+        conf = conf or {}
+        with self.cond:
+            self.conf = conf
+            self.workers = conf.get("workers", self.workers)
+            self.state_file = conf.get("state_file", self.state_file)
+            self.state = None
+
+    def add(self, trigger, task: Callable[..., Any], *args, name: Optional[str] = None, **kwargs) -> ScheduledJob:
+        """添加任务，任务名用于配置和保存执行时间
+        :param name: 任务名，默认为函数名（重名时按添加顺序加序号）；
+            同一函数添加多次时应该指定，否则调整添加顺序后保存的执行时间和配置会对不上
+        """
+        with self.cond:
+            if name is not None:
+                if name in self.jobs:
+                    raise ValueError(f"Duplicate job name: {name}")
+            else:
+                name = getattr(task, "__name__", None) or repr(task)
+                if name in self.jobs:
+                    name = f"{name}#{sum(1 for n in self.jobs if n.split('#')[0] == name) + 1}"
+            options = {k: v for k, v in self.conf.items() if k not in ("workers", "state_file", "jobs")}
+            options.update((self.conf.get("jobs") or {}).get(name, {}))
+            job = ScheduledJob(name, trigger, task, args, kwargs, options)
+            self.jobs[name] = job
+
+            now = time.time()
+            last_run = self._load_state().get(name)
+            if last_run and job.catch_up == "run_once":
+                missed = trigger.previous(now, last_run)
+                if missed and now - missed <= job.catch_up_window:
+                    self.LOG.info(f"{name} 在 {datetime.fromtimestamp(missed)} 错过执行，补执行一次")
+                    job.counters["caught_up"] += 1
+                    heapq.heappush(self.heap, (now, next(self.seq), job, False))
+
+            job.base = trigger.next_after(now)
+            self._push(job)
+            self.cond.notify()
+        self.LOG.info(f"添加任务 {name}: {trigger}")
+        return job
+
+    def run_pending(self) -> None:
+        """执行所有已到期的任务，不等待"""
+        with self.cond:
+            due = self._pop_due(time.time())
+        for job, fire_at in due:
+            self._dispatch(job, fire_at)
+
+    def run_forever(self) -> None:
+        """阻塞运行，直到 stop()"""
+        with self.cond:
+            self.running = True
+        while True:
+            with self.cond:
+                if not self.running:
+                    return
+                wait = self.heap[0][0] - time.time() if self.heap else self.MAX_SLEEP
+                if wait > 0:
+                    self.cond.wait(min(wait, self.MAX_SLEEP))
+                    continue
+                due = self._pop_due(time.time())
+            for job, fire_at in due:
+                self._dispatch(job, fire_at)
+
+    def stop(self) -> None:
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def stats(self) -> dict:
+        """按任务统计：执行/失败/跳过/错过次数，平均/最大/最近一次耗时（毫秒），下一次执行时间"""
+        with self.cond:
+            stats = {}
+            for name, job in self.jobs.items():
+                c = dict(job.counters, running=job.running, next_run=job.base)
+                c["avg_ms"] = c["total_ms"] / c["runs"] if c["runs"] else 0.0
+                stats[name] = c
+            return stats
+
+    def _push(self, job: ScheduledJob) -> None:
+        fire_at = job.base + (random.uniform(0, job.jitter) if job.jitter else 0)
+        heapq.heappush(self.heap, (fire_at, next(self.seq), job, True))
+
+    def _pop_due(self, now: float) -> list:
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            fire_at, _, job, reschedule = heapq.heappop(self.heap)
+            due.append((job, fire_at))
+            if reschedule:
+                # 从计划时间往后排，不随执行延迟漂移；停顿太久时从现在往后排
+                nxt = job.trigger.next_after(job.base)
+                job.base = nxt if nxt > now else job.trigger.next_after(now)
+                self._push(job)
+        return due
+
+    def _dispatch(self, job: ScheduledJob, fire_at: float) -> None:
+        late = time.time() - fire_at
+        with self.cond:
+            if late > job.misfire_grace:
+                job.counters["misfired"] += 1
+                self.LOG.warning(f"{job.name} 晚了 {late:.0f}s，超过宽限时间，跳过这一次")
+                return
+            if job.no_overlap and job.running:
+                job.counters["skipped_overlap"] += 1
+                self.LOG.warning(f"{job.name} 上一次还没执行完，跳过这一次")
+                return
+            job.running += 1
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="Job")
+        self.pool.submit(self._run, job)
+
+    def _run(self, job: ScheduledJob) -> None:
+        start = time.time()
+        self._save_state(job.name, start)
+        error = None
+        try:
+            job.task(*job.args, **job.kwargs)
+        except Exception as e:
+            error = str(e)
+            self.LOG.error(f"{job.name} 执行出错: {e}")
+        cost = (time.time() - start) * 1000
+        with self.cond:
+            job.running -= 1
+            c = job.counters
+            c["runs"] += 1
+            c["failures"] += int(error is not None)
+            c["total_ms"] += cost
+            c["max_ms"] = max(c["max_ms"], cost)
+            c["last_ms"] = cost
+            c["last_run"] = start
+            c["last_error"] = error
+
+    def _load_state(self) -> dict:
+        with self.stateLock:
+            if self.state is None:
+                self.state = {}
+                if self.state_file and os.path.exists(self.state_file):
+                    try:
+                        with open(self.state_file, encoding="utf-8") as f:
+                            self.state = json.load(f)
+                    except (OSError, ValueError) as e:
+                        self.LOG.error(f"读取 {self.state_file} 失败: {e}")
+            return self.state
+
+    def _save_state(self, name: str, last_run: float) -> None:
+        state = self._load_state()
+        with self.stateLock:
+            state[name] = last_run
+            if not self.state_file:
+                return
+            tmp = self.state_file + ".tmp"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp, self.state_file)
+            except OSError as e:
+                self.LOG.error(f"保存 {self.state_file} 失败: {e}")
+
+
+scheduler = Scheduler()
 
 
 class Job(object):
     def __init__(self) -> None:
         pass
 
-    def onEverySeconds(self, seconds: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    def onEverySeconds(self, seconds: int, task: Callable[..., Any], *args,
+                       name: Optional[str] = None, **kwargs) -> None:
         """
         每 seconds 秒执行
         :param seconds: 间隔，秒
         :param task: 定时执行的方法
+        :param name: 任务名，默认为函数名
         :return: None
         """
-        schedule.every(seconds).seconds.do(task, *args, **kwargs)
+        scheduler.add(IntervalTrigger(seconds), task, *args, name=name, **kwargs)
 
-    def onEveryMinutes(self, minutes: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    def onEveryMinutes(self, minutes: int, task: Callable[..., Any], *args,
+                       name: Optional[str] = None, **kwargs) -> None:
         """
         每 minutes 分钟执行
         :param minutes: 间隔，分钟
         :param task: 定时执行的方法
+        :param name: 任务名，默认为函数名
         :return: None
         """
-        schedule.every(minutes).minutes.do(task, *args, **kwargs)
+        scheduler.add(IntervalTrigger(minutes * 60), task, *args, name=name, **kwargs)
 
-    def onEveryHours(self, hours: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    def onEveryHours(self, hours: int, task: Callable[..., Any], *args,
+                     name: Optional[str] = None, **kwargs) -> None:
         """
         每 hours 小时执行
         :param hours: 间隔，小时
         :param task: 定时执行的方法
+        :param name: 任务名，默认为函数名
         :return: None
         """
-        schedule.every(hours).hours.do(task, *args, **kwargs)
+        scheduler.add(IntervalTrigger(hours * 3600), task, *args, name=name, **kwargs)
 
-    def onEveryDays(self, days: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    def onEveryDays(self, days: int, task: Callable[..., Any], *args,
+                    name: Optional[str] = None, **kwargs) -> None:
         """
         每 days 天执行
         :param days: 间隔，天
         :param task: 定时执行的方法
+        :param name: 任务名，默认为函数名
         :return: None
         """
-        schedule.every(days).days.do(task, *args, **kwargs)
+        scheduler.add(IntervalTrigger(days * 86400), task, *args, name=name, **kwargs)
 
-    def onEveryTime(self, times: int, task: Callable[..., Any], *args, **kwargs) -> None:
+    def onEveryTime(self, times: int, task: Callable[..., Any], *args,
+                    name: Optional[str] = None, **kwargs) -> None:
         """
         每天定时执行
-        :param times: 时间字符串列表，格式:
-            - For daily jobs -> HH:MM:SS or HH:MM
-            - For hourly jobs -> MM:SS or :MM
-            - For minute jobs -> :SS
+        :param times: 时间字符串列表，格式: HH:MM:SS or HH:MM
         :param task: 定时执行的方法
+        :param name: 任务名，默认为函数名
         :return: None
 
         例子: times=["10:30", "10:45", "11:00"]
@@ -61,11 +341,14 @@ class Job(object):
         if not isinstance(times, list):
             times = [times]
 
-        for t in times:
-            schedule.every(1).days.at(t).do(task, *args, **kwargs)
+        scheduler.add(DailyTrigger(times), task, *args, name=name, **kwargs)
 
     def runPendingJobs(self) -> None:
-        schedule.run_pending()
+        scheduler.run_pending()
+
+    def runJobsForever(self) -> None:
+        """阻塞运行定时任务，睡到下一个任务到期"""
+        scheduler.run_forever()
 
 
 if __name__ == "__main__":
@@ -79,6 +362,4 @@ if __name__ == "__main__":
     job.onEveryDays(1, printStr, "onEveryDays 1")
     job.onEveryTime("23:59", printStr, "onEveryTime 23:59")
 
-    while True:
-        job.runPendingJobs()
-        time.sleep(1)
+    job.runJobsForever()
@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from threading import Event, Thread
+
+from job_mgmt import DailyTrigger, IntervalTrigger, Scheduler
+
+
+class SchedulerTestCase(unittest.TestCase):
+    def scheduler(self, **kwargs):
+        scheduler = Scheduler(**kwargs)
+        self.addCleanup(self.drain, scheduler)
+        return scheduler
+
+    @staticmethod
+    def drain(scheduler):
+        if scheduler.pool:
+            scheduler.pool.shutdown(wait=True)
+
+    def test_heap_orders_by_next_run(self):
+        scheduler = self.scheduler()
+        scheduler.add(IntervalTrigger(60), lambda: None)
+        soon = scheduler.add(IntervalTrigger(5), lambda: None)
+
+        self.assertIs(scheduler.heap[0][2], soon)
+
+    def test_run_pending_runs_due_jobs_and_reschedules(self):
+        calls = []
+        scheduler = self.scheduler()
+        job = scheduler.add(IntervalTrigger(0.05), calls.append, 1)
+        first = job.base
+
+        scheduler.run_pending()
+        self.assertEqual(calls, [])  # 还没到期
+        time.sleep(0.06)
+        scheduler.run_pending()
+        self.drain(scheduler)
+
+        self.assertEqual(calls, [1])
+        self.assertGreater(job.base, first)
+        self.assertEqual(scheduler.stats()[job.name]["runs"], 1)
+
+    def test_catch_up_run_once(self):
+        calls = []
+
+        def report():
+            calls.append(1)
+
+        with tempfile.TemporaryDirectory() as d:
+            state_file = os.path.join(d, "jobs.json")
+            with open(state_file, "w") as f:
+                json.dump({"report": time.time() - 120}, f)
+            scheduler = self.scheduler(state_file=state_file, conf={"catch_up": "run_once"})
+            job = scheduler.add(IntervalTrigger(60), report)
+
+            scheduler.run_pending()
+            self.drain(scheduler)
+
+            self.assertEqual(calls, [1])
+            self.assertEqual(job.counters["caught_up"], 1)
+            with open(state_file) as f:
+                self.assertGreater(json.load(f)["report"], time.time() - 5)
+
+    def test_catch_up_skip_and_window(self):
+        def report():
+            pass
+
+        with tempfile.TemporaryDirectory() as d:
+            state_file = os.path.join(d, "jobs.json")
+            with open(state_file, "w") as f:
+                json.dump({"report": time.time() - 7200}, f)
+
+            # 默认跳过错过的执行
+            job = self.scheduler(state_file=state_file).add(IntervalTrigger(60), report)
+            self.assertEqual(job.counters["caught_up"], 0)
+
+            # 错过的时间超出补执行窗口
+            conf = {"catch_up": "run_once", "catch_up_window": 30}
+            job = self.scheduler(state_file=state_file, conf=conf).add(IntervalTrigger(5000), report)
+            self.assertEqual(job.counters["caught_up"], 0)
+
+    def test_explicit_names(self):
+        def prefetch(name):
+            pass
+
+        conf = {"jobs": {"prefetch:moyu": {"jitter": 5}}}
+        scheduler = self.scheduler(conf=conf)
+        news = scheduler.add(IntervalTrigger(60), prefetch, "news", name="prefetch:news")
+        moyu = scheduler.add(IntervalTrigger(60), prefetch, "moyu", name="prefetch:moyu")
+
+        # 按名字取配置，和添加顺序无关
+        self.assertEqual((news.name, news.jitter), ("prefetch:news", 0))
+        self.assertEqual((moyu.name, moyu.jitter), ("prefetch:moyu", 5))
+        with self.assertRaises(ValueError):
+            scheduler.add(IntervalTrigger(60), prefetch, "moyu", name="prefetch:moyu")
+
+        # 不指定名字时按函数名，重名加序号
+        self.assertEqual(scheduler.add(IntervalTrigger(60), prefetch, "a").name, "prefetch")
+        self.assertEqual(scheduler.add(IntervalTrigger(60), prefetch, "b").name, "prefetch#2")
+
+    def test_no_overlap(self):
+        started, release = Event(), Event()
+
+        def slow():
+            started.set()
+            release.wait(1)
+
+        scheduler = self.scheduler()
+        job = scheduler.add(IntervalTrigger(60), slow)
+        scheduler._dispatch(job, time.time())
+        started.wait(1)
+        scheduler._dispatch(job, time.time())
+        release.set()
+        self.drain(scheduler)
+
+        self.assertEqual(job.counters["runs"], 1)
+        self.assertEqual(job.counters["skipped_overlap"], 1)
+
+    def test_misfire_skipped(self):
+        calls = []
+        scheduler = self.scheduler(conf={"misfire_grace": 10})
+        job = scheduler.add(IntervalTrigger(60), calls.append, 1)
+        scheduler._dispatch(job, time.time() - 30)
+        self.drain(scheduler)
+
+        self.assertEqual(calls, [])
+        self.assertEqual(job.counters["misfired"], 1)
+
+    def test_task_error_counted(self):
+        def broken():
+            raise RuntimeError("boom")
+
+        scheduler = self.scheduler()
+        job = scheduler.add(IntervalTrigger(60), broken)
+        scheduler._dispatch(job, time.time())
+        self.drain(scheduler)
+
+        self.assertEqual(job.counters["failures"], 1)
+        self.assertEqual(job.counters["last_error"], "boom")
+        self.assertEqual(job.running, 0)
+
+    def test_run_forever_wakes_for_due_job(self):
+        ran = Event()
+        scheduler = self.scheduler()
+        scheduler.add(IntervalTrigger(0.05), ran.set)
+        scheduler.running = True
+
+        t = Thread(target=scheduler.run_forever, daemon=True)
+        t.start()
+        self.assertTrue(ran.wait(1))
+        scheduler.stop()
+        t.join(1)
+        self.assertFalse(t.is_alive())
+
+
+class TriggerTestCase(unittest.TestCase):
+    def test_interval_previous(self):
+        trigger = IntervalTrigger(10)
+        self.assertIsNone(trigger.previous(105, 100))
+        self.assertEqual(trigger.previous(135, 100), 130)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            IntervalTrigger(0)
+        with self.assertRaises(ValueError):
+            DailyTrigger(["25:00"])
+        with self.assertRaises(ValueError):
+            DailyTrigger(["10"])
+
+    def test_daily_next_after(self):
+        trigger = DailyTrigger(["10:30"])
+        now = time.time()
+        nxt = trigger.next_after(now)
+        self.assertTrue(0 < nxt - now <= 86400)
+        self.assertEqual(time.strftime("%H:%M:%S", time.localtime(nxt)), "10:30:00")
+
+
+if __name__ == '__main__':
+    unittest.main()
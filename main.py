@@ -29,8 +29,11 @@ def weather_report(robot: Robot) -> None:
 def main(chat_type: int):
     config = Config()
     wcf = Wcf(debug=True)
+    robot = None
 
     def handler(sig, frame):
+        if robot:
+            robot.cleanup()  # 退出前把缓冲的消息落库
         wcf.cleanup()  # 退出前清理环境
         exit(0)
 
@@ -43,13 +46,13 @@ def main(chat_type: int):
     robot.enableReceivingMsg()  # 加队列
 
     # 历史上的今天
-    robot.onEveryTime("08:00", robot.todayInHistory)
+    robot.onEveryTimeWithPrefetch("08:00", "todayInHistory", robot.todayInHistory)
 
     # 发送新闻
-    robot.onEveryTime("08:00", robot.newsReport)
+    robot.onEveryTimeWithPrefetch("08:00", "newsReport", robot.newsReport)
 
     # 发送摸鱼
-    robot.onEveryTime("10:00", robot.moyu)
+    robot.onEveryTimeWithPrefetch("10:00", "moyu", robot.moyu)
 
     # 每天 16:30 提醒发日报周报月报
     # robot.onEveryTime("17:30", ReportReminder.remind, robot=robot)
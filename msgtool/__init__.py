@@ -0,0 +1,8 @@
+__all__ = ['broadcast', 'dispatcher', 'fair_queue', 'ingress', 'outbox', 'stream']
+
+from .broadcast import *
+from .dispatcher import *
+from .fair_queue import *
+from .ingress import *
+from .outbox import *
+from .stream import *
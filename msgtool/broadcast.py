@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Iterable, Optional
+
+from base.rate_limit import TokenBucket
+
+
+class BroadcastReport(object):
+    """一次群发的结果"""
+
+    def __init__(self, name: str, receivers: list) -> None:
+        self.name = name
+        self.receivers = receivers
+        self.succeeded = []
+        self.failed = {}  # 接收人 -> 最后一次的错误
+        self.retries = 0
+        self.started = time.time()
+        self.duration = 0.0
+
+    def __repr__(self):
+        return (f"BroadcastReport({self.name}: {len(self.succeeded)}/{len(self.receivers)} 成功, "
+                f"{len(self.failed)} 失败, 重试 {self.retries} 次, 耗时 {self.duration:.1f}s)")
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "total": len(self.receivers), "succeeded": len(self.succeeded),
+                "failed": dict(self.failed), "retries": self.retries, "started": self.started,
+                "duration": self.duration}
+
+
+class Broadcaster(object):
+    """群发：内容只准备一次，在有界线程池里并发发给所有接收人
+    - 同一接收人的多条内容按顺序发送，某一条失败时只重试这一条
+    - 所有发送共用一个令牌桶限速，可以传入发送队列的全局令牌桶，和日常回复共享额度
+    - 每次群发结束后记录成功、失败和耗时
+    """
+
+    def __init__(self, send_text: Callable[[str, str], Any], send_file: Callable[[str, str], Any],
+                 workers: int = 8, rate: float = 5, burst: int = 10, retries: int = 2, backoff: float = 1.0,
+                 bucket: Optional[TokenBucket] = None, history: int = 20) -> None:
+        """
+        :param send_text: 发送文本 (内容, 接收人)，返回 0 表示成功
+        :param send_file: 发送文件 (路径, 接收人)，返回 0 表示成功
+        :param workers: 并发发送的线程数
+        :param rate: 每秒最多发送条数，传入 bucket 时忽略
+        :param burst: 允许的突发条数，传入 bucket 时忽略
+        :param retries: 每条内容失败后重试几次
+        :param backoff: 第一次重试前等待的秒数，之后每次翻倍
+        :param bucket: 共用的令牌桶
+        :param history: 保留最近多少次群发的结果
+        """
+        self.LOG = logging.getLogger("Broadcaster")
+        self.send_text = send_text
+        self.send_file = send_file
+        self.bucket = bucket or TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="Broadcast")
+        # 群发本身在单独的线程里等待结果，不阻塞定时任务
+        self.coordinator = ThreadPoolExecutor(max_workers=2, thread_name_prefix="BroadcastCoordinator")
+        self.reports = deque(maxlen=history)
+        self.lock = Lock()
+
+    @classmethod
+    def from_config(cls, conf: dict, send_text: Callable, send_file: Callable,
+                    bucket: Optional[TokenBucket] = None) -> "Broadcaster":
+        conf = conf or {}
+        return cls(send_text, send_file, conf.get("workers", 8), conf.get("rate", 5), conf.get("burst", 10),
+                   conf.get("retries", 2), conf.get("backoff", 1.0), bucket)
+
+    def submit(self, name: str, receivers: Iterable[str], texts: Iterable[str] = (),
+               files: Iterable[str] = ()) -> Future:
+        """后台群发，立即返回，Future 的结果为 BroadcastReport
+        :param name: 群发名称，用于日志和统计
+        :param receivers: 接收人 wxid 或群 roomid，重复的只发一次
+        :param texts: 依次发送的文本
+        :param files: 文本之后依次发送的文件路径
+        """
+        items = [("text", t) for t in texts if t] + [("file", f) for f in files if f]
+        return self.coordinator.submit(self.broadcast, name, list(dict.fromkeys(receivers)), items)
+
+    def broadcast(self, name: str, receivers: list, items: list) -> BroadcastReport:
+        """群发并等待全部完成"""
+        report = BroadcastReport(name, receivers)
+        if items:
+            start = time.monotonic()
+            futures = [(r, self.pool.submit(self._deliver, r, items)) for r in receivers]
+            for receiver, future in futures:
+                error, retries = future.result()
+                report.retries += retries
+                if error:
+                    report.failed[receiver] = error
+                else:
+                    report.succeeded.append(receiver)
+            report.duration = time.monotonic() - start
+
+        log = self.LOG.warning if report.failed else self.LOG.info
+        log(f"{report}" + (f"，失败: {report.failed}" if report.failed else ""))
+        with self.lock:
+            self.reports.append(report)
+        return report
+
+    def stats(self) -> list:
+        with self.lock:
+            return [r.to_dict() for r in self.reports]
+
+    def _deliver(self, receiver: str, items: list):
+        """按顺序发送一个接收人的所有内容，返回 (错误或 None, 重试次数)"""
+        retries = 0
+        for kind, content in items:
+            send = self.send_file if kind == "file" else self.send_text
+            for attempt in range(self.retries + 1):
+                if attempt:
+                    retries += 1
+                    time.sleep(self.backoff * 2 ** (attempt - 1))
+                self.bucket.consume()
+                try:
+                    rc = send(content, receiver)
+                    error = None if rc in (0, None) else f"返回 {rc}"
+                except Exception as e:
+                    error = str(e)
+                if error is None:
+                    break
+                self.LOG.warning(f"发送 {kind} 到 {receiver} 失败（第 {attempt + 1} 次）: {error}")
+            else:
+                return error, retries
+        return None, retries
@@ -0,0 +1,99 @@
+import threading
+import time
+import unittest
+
+from msgtool.broadcast import Broadcaster
+
+
+class FakeSender(object):
+    """记录发送，按 (内容, 接收人) 配置前几次发送失败"""
+
+    def __init__(self, failures=None) -> None:
+        self.failures = dict(failures or {})
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def __call__(self, content, receiver):
+        with self.lock:
+            left = self.failures.get((content, receiver), 0)
+            if left:
+                self.failures[(content, receiver)] = left - 1
+                return -1
+            self.sent.append((content, receiver))
+            return 0
+
+
+class BroadcasterTestCase(unittest.TestCase):
+    def make(self, sender, **kwargs):
+        kwargs = dict({"rate": 1000, "burst": 1000, "backoff": 0.01}, **kwargs)
+        broadcaster = Broadcaster(sender, sender, **kwargs)
+        self.addCleanup(broadcaster.pool.shutdown, wait=False)
+        self.addCleanup(broadcaster.coordinator.shutdown, wait=False)
+        return broadcaster
+
+    def test_send_all_in_order(self):
+        sender = FakeSender()
+        broadcaster = self.make(sender)
+        report = broadcaster.submit("news", ["a", "b", "a"], texts=["t1", "t2"], files=["f.png"]).result(1)
+
+        self.assertEqual(report.succeeded, ["a", "b"])
+        self.assertEqual(report.failed, {})
+        for r in ("a", "b"):
+            self.assertEqual([c for c, receiver in sender.sent if receiver == r], ["t1", "t2", "f.png"])
+
+    def test_retry_only_failed_item(self):
+        sender = FakeSender({("t2", "a"): 1})
+        broadcaster = self.make(sender)
+        report = broadcaster.broadcast("news", ["a"], [("text", "t1"), ("text", "t2")])
+
+        # 第一条不会重发
+        self.assertEqual(sender.sent, [("t1", "a"), ("t2", "a")])
+        self.assertEqual((report.succeeded, report.retries), (["a"], 1))
+
+    def test_report_failures(self):
+        sender = FakeSender({("t1", "b"): 10})
+        broadcaster = self.make(sender, retries=2)
+        report = broadcaster.broadcast("news", ["a", "b"], [("text", "t1"), ("text", "t2")])
+
+        self.assertEqual(report.succeeded, ["a"])
+        self.assertEqual(report.failed, {"b": "返回 -1"})
+        self.assertEqual(report.retries, 2)
+        # 失败后不再发后面的内容
+        self.assertNotIn(("t2", "b"), sender.sent)
+
+    def test_exception_counts_as_failure(self):
+        def send(content, receiver):
+            raise RuntimeError("offline")
+
+        broadcaster = self.make(send, retries=0)
+        report = broadcaster.broadcast("news", ["a"], [("text", "t1")])
+
+        self.assertEqual(report.failed, {"a": "offline"})
+
+    def test_backoff(self):
+        sender = FakeSender({("t1", "a"): 2})
+        broadcaster = self.make(sender, backoff=0.05)
+        start = time.monotonic()
+        broadcaster.broadcast("news", ["a"], [("text", "t1")])
+
+        # 0.05 + 0.1
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_stats_history(self):
+        broadcaster = self.make(FakeSender(), history=2)
+        for name in ("n1", "n2", "n3"):
+            broadcaster.submit(name, ["a"], texts=["t"]).result(1)
+
+        stats = broadcaster.stats()
+        self.assertEqual([s["name"] for s in stats], ["n2", "n3"])
+        self.assertEqual((stats[0]["total"], stats[0]["succeeded"]), (1, 1))
+
+    def test_empty_items(self):
+        sender = FakeSender()
+        report = self.make(sender).submit("news", ["a"], texts=[""]).result(1)
+
+        self.assertEqual((sender.sent, report.succeeded, report.failed), ([], [], {}))
+
+
+if __name__ == '__main__':
+    unittest.main()
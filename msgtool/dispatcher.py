@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import logging
+import zlib
+from collections import deque
+from threading import Condition, Thread
+from typing import Callable
+
+from wcferry import WxMsg
+
+
+class _Shard(object):
+    """一个处理线程的待处理消息：每个会话一个先进先出队列，会话之间按优先级排队
+    会话的优先级取它排队中最紧急的消息，同优先级按会话最早一条消息的投递顺序；
+    会话内的消息始终按投递顺序处理。
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.size = 0
+        self.conversations = {}  # 会话 -> deque[(优先级, 序号, 消息)]
+        self.ranks = {}  # 会话 -> 当前在 ready 里的有效排位
+        self.ready = []  # 堆 [(优先级, 序号, 会话)]，排位过期的条目出堆时跳过
+        self.stopped = False
+        self.cond = Condition()
+
+    def put(self, key: str, priority: int, seq: int, msg: WxMsg, timeout: float = None) -> bool:
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.size < self.maxsize, timeout):
+                return False
+            conv = self.conversations.setdefault(key, deque())
+            conv.append((priority, seq, msg))
+            self.size += 1
+            self._rank(key)
+            self.cond.notify_all()
+            return True
+
+    def get(self):
+        """取出下一条要处理的消息，停止且已处理完时返回 None"""
+        with self.cond:
+            while True:
+                self.cond.wait_for(lambda: self.ready or self.stopped)
+                if not self.ready:
+                    return None
+                rank = heapq.heappop(self.ready)
+                key = rank[2]
+                if self.ranks.get(key) != rank:
+                    continue
+                del self.ranks[key]
+                conv = self.conversations[key]
+                _, _, msg = conv.popleft()
+                if conv:
+                    self._rank(key)
+                else:
+                    del self.conversations[key]
+                self.size -= 1
+                self.cond.notify_all()
+                return msg
+
+    def stop(self) -> None:
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+    def _rank(self, key: str) -> None:
+        """调用方持有 self.cond"""
+        conv = self.conversations[key]
+        rank = (min(p for p, _, _ in conv), conv[0][1], key)
+        if self.ranks.get(key) != rank:
+            self.ranks[key] = rank
+            heapq.heappush(self.ready, rank)
+
+
+class MsgDispatcher(object):
+    """按会话分片的消息分发器
+    同一个会话（群聊按 roomid，私聊按 sender）的消息总是落到同一个处理线程，并按收到的顺序处理；
+    不同会话分散到多个处理线程并行处理，一个慢回复不会阻塞其他会话。
+    同一处理线程上的会话之间按优先级处理，有管理员消息的会话不用排在积压的闲聊会话后面。
+    """
+
+    def __init__(self, handler: Callable[[WxMsg], None], workers: int = 4, queue_size: int = 100) -> None:
+        """
+        :param handler: 消息处理函数
+        :param workers: 处理线程数
+        :param queue_size: 每个处理线程的队列长度，队列满时 submit 会阻塞，形成反压
+        """
+        self.LOG = logging.getLogger("MsgDispatcher")
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.shards = [_Shard(max(1, queue_size)) for _ in range(self.workers)]
+        self.seq = itertools.count()  # 投递顺序
+        self.threads = []
+        for i, shard in enumerate(self.shards):
+            t = Thread(target=self._work, name=f"MsgWorker-{i}", args=(shard,), daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    @staticmethod
+    def shard_key(msg: WxMsg) -> str:
+        """会话标识：群聊为 roomid，私聊为 sender"""
+        return msg.roomid if msg.from_group() else msg.sender
+
+    def shard_of(self, key: str) -> int:
+        # 使用 crc32 而不是 hash()，保证同一会话在进程内外都映射到同一个分片
+        return zlib.crc32((key or "").encode()) % self.workers
+
+    def submit(self, msg: WxMsg, timeout: float = None, priority: int = 0) -> bool:
+        """投递消息到对应会话的处理线程
+        :param msg: 微信消息结构
+        :param timeout: 队列满时最多等待的秒数，None 表示一直等待
+        :param priority: 数值越小越先处理，同 MsgPriority；只影响会话之间的顺序
+        :return: 是否投递成功
+        """
+        key = self.shard_key(msg)
+        if self.shards[self.shard_of(key)].put(key, priority, next(self.seq), msg, timeout):
+            return True
+        self.LOG.warning(f"消息队列已满，丢弃消息：{msg.id}")
+        return False
+
+    def qsize(self) -> int:
+        return sum(s.size for s in self.shards)
+
+    def stop(self) -> None:
+        """通知所有处理线程在处理完已排队的消息后退出"""
+        for shard in self.shards:
+            shard.stop()
+
+    def _work(self, shard: _Shard) -> None:
+        while True:
+            msg = shard.get()
+            if msg is None:
+                break
+            try:
+                self.handler(msg)
+            except Exception as e:
+                self.LOG.error(f"Processing message error: {e}")
@@ -0,0 +1,160 @@
+import time
+import unittest
+from threading import Event, Lock
+
+from msgtool.dispatcher import MsgDispatcher
+from msgtool.ingress import MsgPriority
+
+
+class FakeMsg(object):
+    def __init__(self, id, roomid="", sender="wxid"):
+        self.id = id
+        self.roomid = roomid
+        self.sender = sender
+
+    def from_group(self):
+        return bool(self.roomid)
+
+
+class MsgDispatcherTestCase(unittest.TestCase):
+    def dispatcher(self, handler, workers=1, queue_size=100):
+        dispatcher = MsgDispatcher(handler, workers, queue_size)
+        self.addCleanup(dispatcher.stop)
+        return dispatcher
+
+    def test_conversation_stays_in_order(self):
+        started, gate, handled = Event(), Event(), []
+
+        def handler(msg):
+            started.set()
+            gate.wait(1)
+            handled.append(msg.id)
+
+        dispatcher = self.dispatcher(handler)
+        dispatcher.submit(FakeMsg(0, sender="blocker"), priority=MsgPriority.CHAT)
+        started.wait(1)  # 处理线程忙着，后面的消息都在排队
+        # 同一个群里先来的闲聊，不能被后来的管理员消息和成语命令插队
+        dispatcher.submit(FakeMsg(1, "room"), priority=MsgPriority.CHAT)
+        dispatcher.submit(FakeMsg(2, "room"), priority=MsgPriority.IDIOM)
+        dispatcher.submit(FakeMsg(3, "room"), priority=MsgPriority.ADMIN)
+        gate.set()
+        dispatcher.stop()
+        for t in dispatcher.threads:
+            t.join(1)
+
+        self.assertEqual(handled, [0, 1, 2, 3])
+
+    def test_priority_between_conversations(self):
+        started, gate, handled = Event(), Event(), []
+
+        def handler(msg):
+            started.set()
+            gate.wait(1)
+            handled.append(msg.id)
+
+        dispatcher = self.dispatcher(handler)
+        dispatcher.submit(FakeMsg(0, sender="blocker"), priority=MsgPriority.CHAT)
+        started.wait(1)  # 处理线程忙着，后面的消息都在排队
+        dispatcher.submit(FakeMsg(1, "chat-room"), priority=MsgPriority.CHAT)
+        dispatcher.submit(FakeMsg(2, "other-room"), priority=MsgPriority.OTHER)
+        dispatcher.submit(FakeMsg(3, "admin-room"), priority=MsgPriority.OTHER)
+        dispatcher.submit(FakeMsg(4, "admin-room"), priority=MsgPriority.ADMIN)
+        gate.set()
+        dispatcher.stop()
+        for t in dispatcher.threads:
+            t.join(1)
+
+        # 有管理员消息的会话整体提前，会话内仍按顺序
+        self.assertEqual(handled, [0, 3, 4, 1, 2])
+
+    def test_conversations_run_in_parallel(self):
+        gate = Event()
+        done = []
+        lock = Lock()
+
+        def handler(msg):
+            if msg.id == "slow":
+                gate.wait(1)
+            with lock:
+                done.append(msg.id)
+
+        dispatcher = self.dispatcher(handler, workers=4)
+        slow = FakeMsg("slow", sender="a")
+        fast = next(FakeMsg("fast", sender=s) for s in "bcdefgh"
+                    if dispatcher.shard_of(s) != dispatcher.shard_of("a"))
+        dispatcher.submit(slow)
+        dispatcher.submit(fast)
+        deadline = time.monotonic() + 1
+        while "fast" not in done and time.monotonic() < deadline:
+            time.sleep(0.01)
+        gate.set()
+
+        self.assertEqual(done[0], "fast")
+
+    def test_full_queue_rejects(self):
+        gate = Event()
+        dispatcher = self.dispatcher(lambda msg: gate.wait(1), queue_size=1)
+        self.addCleanup(gate.set)
+        dispatcher.submit(FakeMsg(0))
+        while dispatcher.qsize():  # 等第一条被处理线程取走
+            time.sleep(0.01)
+        self.assertTrue(dispatcher.submit(FakeMsg(1), timeout=0.05))
+        self.assertFalse(dispatcher.submit(FakeMsg(2), timeout=0.05))
+        self.assertEqual(dispatcher.qsize(), 1)
+
+    def test_shard_key(self):
+        dispatcher = self.dispatcher(lambda msg: None, workers=4)
+
+        # 群聊按群分片，私聊按发送人分片
+        self.assertEqual(dispatcher.shard_key(FakeMsg(0, "room", "a")), "room")
+        self.assertEqual(dispatcher.shard_key(FakeMsg(0, sender="a")), "a")
+        # 分片只取决于会话标识，重启后也一样
+        self.assertEqual(dispatcher.shard_of("room"), self.dispatcher(lambda msg: None, workers=4).shard_of("room"))
+        self.assertEqual({dispatcher.shard_of(f"wxid_{i}") for i in range(100)}, {0, 1, 2, 3})
+
+    def test_conversation_never_concurrent(self):
+        lock = Lock()
+        active, overlaps, handled = {}, [], []
+
+        def handler(msg):
+            with lock:
+                if active.get(msg.roomid):
+                    overlaps.append(msg.id)
+                active[msg.roomid] = True
+            time.sleep(0.001)
+            with lock:
+                active[msg.roomid] = False
+                handled.append((msg.roomid, msg.id))
+
+        dispatcher = self.dispatcher(handler, workers=4)
+        for i in range(200):
+            dispatcher.submit(FakeMsg(i, f"room{i % 5}"))
+        dispatcher.stop()
+        for t in dispatcher.threads:
+            t.join(2)
+
+        self.assertEqual(overlaps, [])
+        for room in range(5):
+            ids = [i for r, i in handled if r == f"room{room}"]
+            self.assertEqual(ids, sorted(ids))
+            self.assertEqual(len(ids), 40)
+
+    def test_handler_error_does_not_stop_worker(self):
+        handled = []
+
+        def handler(msg):
+            if msg.id == 0:
+                raise RuntimeError("boom")
+            handled.append(msg.id)
+
+        dispatcher = self.dispatcher(handler)
+        dispatcher.submit(FakeMsg(0))
+        dispatcher.submit(FakeMsg(1))
+        dispatcher.stop()
+        dispatcher.threads[0].join(1)
+
+        self.assertEqual(handled, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import OrderedDict, deque
+from threading import Condition, Thread
+from typing import Callable, Optional
+
+
+class _Tenant(object):
+    def __init__(self, weight: float, max_inflight: int) -> None:
+        self.weight = weight
+        self.max_inflight = max_inflight
+        self.queue = deque()
+        self.inflight = 0
+        self.vtime = 0.0  # 下一个任务的虚拟开始时间，权重越大增长越慢
+
+
+class FairScheduler(object):
+    """按租户（群 roomid 或私聊 wxid）加权公平调度的任务队列
+    每个租户一个先进先出队列，工作线程每次从虚拟时间最小的租户取任务（start-time fair queuing）：
+    权重为 2 的租户在都有积压时能拿到权重为 1 的租户两倍的执行机会；
+    每个租户同时执行的任务不超过 max_inflight，默认 1，保证同一会话内按序回答。
+    队列为空且没有执行中任务的租户会被移除，调度开销只和活跃租户数有关；
+    统计数据单独保存，最多保留最近活跃的 max_tracked 个租户。
+    """
+
+    def __init__(self, workers: int = 4, default_weight: float = 1, default_max_inflight: int = 1,
+                 max_queue: int = 20, tenants: Optional[dict] = None, name: str = "FairScheduler",
+                 max_tracked: int = 1000) -> None:
+        """
+        :param workers: 工作线程数，即总并发
+        :param default_weight: 租户默认权重
+        :param default_max_inflight: 租户默认最大并发
+        :param max_queue: 每个租户排队上限，超过后拒绝新任务
+        :param tenants: 单独配置的租户 {租户: {"weight": 2, "max_inflight": 2, "max_queue": 50}}
+        :param max_tracked: 最多保留多少个租户的统计数据，超过时丢弃最久没有活动的
+        """
+        self.LOG = logging.getLogger(name)
+        self.default_weight = default_weight
+        self.default_max_inflight = max(1, default_max_inflight)
+        self.max_queue = max_queue
+        self.overrides = tenants or {}
+        self.tenants = {}
+        self.metrics = OrderedDict()  # 租户 -> 统计，按最近活动排序
+        self.max_tracked = max(1, max_tracked)
+        self.vclock = 0.0
+        self.running = True
+        self.cond = Condition()
+        self.threads = []
+        for i in range(max(1, workers)):
+            t = Thread(target=self._run, name=f"{name}-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    @classmethod
+    def from_config(cls, conf: dict, name: str = "FairScheduler") -> "FairScheduler":
+        conf = conf or {}
+        return cls(conf.get("workers", 4), conf.get("default_weight", 1), conf.get("max_inflight", 1),
+                   conf.get("max_queue", 20), conf.get("tenants"), name, conf.get("max_tracked", 1000))
+
+    def submit(self, tenant: str, fn: Callable, *args, **kwargs) -> bool:
+        """放入租户的队列，返回 False 表示租户排队已满被拒绝"""
+        with self.cond:
+            t = self._tenant(tenant)
+            if len(t.queue) >= self.overrides.get(tenant, {}).get("max_queue", self.max_queue):
+                self._counters(tenant)["rejected"] += 1
+                if not t.queue and not t.inflight:
+                    del self.tenants[tenant]  # max_queue 为 0 时不留下空租户
+                return False
+            if not t.queue and not t.inflight:
+                # 空闲后重新活跃的租户从当前虚拟时间开始，不能用空闲期间攒下的额度插队
+                t.vtime = max(t.vtime, self.vclock)
+            t.queue.append((time.monotonic(), fn, args, kwargs))
+            self._counters(tenant)["enqueued"] += 1
+            self.cond.notify()
+        return True
+
+    def stats(self) -> dict:
+        """按租户统计：权重、排队数、执行中、入队/拒绝/完成数、平均/最大等待时间（毫秒）"""
+        with self.cond:
+            stats = {}
+            for key, counters in self.metrics.items():
+                t = self.tenants.get(key)
+                weight = t.weight if t else self.overrides.get(key, {}).get("weight") or self.default_weight
+                c = dict(counters, weight=weight, queued=len(t.queue) if t else 0, inflight=t.inflight if t else 0)
+                c["avg_wait_ms"] = c["total_wait_ms"] / c["served"] if c["served"] else 0.0
+                stats[key] = c
+            return stats
+
+    def qsize(self) -> int:
+        with self.cond:
+            return sum(len(t.queue) for t in self.tenants.values())
+
+    def stop(self) -> None:
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+
+    def _tenant(self, key: str) -> _Tenant:
+        t = self.tenants.get(key)
+        if t is None:
+            conf = self.overrides.get(key, {})
+            t = _Tenant(conf.get("weight", self.default_weight) or self.default_weight,
+                        max(1, conf.get("max_inflight", self.default_max_inflight)))
+            self.tenants[key] = t
+        return t
+
+    def _counters(self, key: str) -> dict:
+        """租户的统计数据，调用方持有 self.cond"""
+        c = self.metrics.get(key)
+        if c is None:
+            c = self.metrics[key] = {"enqueued": 0, "rejected": 0, "served": 0, "total_wait_ms": 0.0,
+                                     "max_wait_ms": 0.0}
+            while len(self.metrics) > self.max_tracked:
+                self.metrics.popitem(last=False)
+        else:
+            self.metrics.move_to_end(key)
+        return c
+
+    def _next(self):
+        """虚拟时间最小、且没有达到并发上限的租户"""
+        best = None
+        for key, t in self.tenants.items():
+            if t.queue and t.inflight < t.max_inflight and (best is None or t.vtime < best[1].vtime):
+                best = (key, t)
+        return best
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: not self.running or self._next() is not None)
+                if not self.running:
+                    return
+                key, t = self._next()
+                enqueued_at, fn, args, kwargs = t.queue.popleft()
+                self.vclock = t.vtime
+                t.vtime += 1 / t.weight
+                t.inflight += 1
+                wait = (time.monotonic() - enqueued_at) * 1000
+                c = self._counters(key)
+                c["served"] += 1
+                c["total_wait_ms"] += wait
+                c["max_wait_ms"] = max(c["max_wait_ms"], wait)
+
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                self.LOG.error(f"[{key}] task error: {e}")
+            finally:
+                with self.cond:
+                    t.inflight -= 1
+                    if not t.queue and not t.inflight and self.tenants.get(key) is t:
+                        # 空闲的租户直接移除，重新活跃时从当前虚拟时间开始，不会插队
+                        del self.tenants[key]
+                    self.cond.notify_all()
@@ -0,0 +1,80 @@
+import threading
+import time
+import unittest
+
+from msgtool.fair_queue import FairScheduler
+
+
+class FairSchedulerTestCase(unittest.TestCase):
+    def make(self, **kwargs):
+        scheduler = FairScheduler(**kwargs)
+        self.addCleanup(scheduler.stop)
+        return scheduler
+
+    def test_weighted_share(self):
+        gate = threading.Event()
+        order = []
+        scheduler = self.make(workers=1, tenants={"big": {"weight": 2}})
+        scheduler.submit("blocker", gate.wait)
+        time.sleep(0.05)
+        for i in range(6):
+            scheduler.submit("big", order.append, "big")
+            scheduler.submit("small", order.append, "small")
+        gate.set()
+        time.sleep(0.2)
+
+        # 都有积压时权重为 2 的租户拿到两倍的执行机会
+        self.assertEqual(order[:6].count("big"), 4)
+
+    def test_reject_when_queue_full(self):
+        gate = threading.Event()
+        scheduler = self.make(workers=1, max_queue=2)
+        scheduler.submit("a", gate.wait)
+        time.sleep(0.05)
+
+        self.assertTrue(scheduler.submit("a", lambda: None))
+        self.assertTrue(scheduler.submit("a", lambda: None))
+        self.assertFalse(scheduler.submit("a", lambda: None))
+        self.assertEqual(scheduler.stats()["a"]["rejected"], 1)
+        gate.set()
+
+    def test_idle_tenants_removed(self):
+        scheduler = self.make(workers=2)
+        for i in range(50):
+            scheduler.submit(f"t{i}", lambda: None)
+        time.sleep(0.2)
+
+        self.assertEqual(scheduler.qsize(), 0)
+        self.assertEqual(scheduler.tenants, {})
+
+    def test_stats_kept_after_idle(self):
+        done = threading.Event()
+        scheduler = self.make(workers=1)
+        scheduler.submit("a", lambda: None)
+        scheduler.submit("a", done.set)
+        done.wait(1)
+        time.sleep(0.05)
+
+        self.assertNotIn("a", scheduler.tenants)
+        stats = scheduler.stats()["a"]
+        self.assertEqual((stats["enqueued"], stats["served"], stats["queued"], stats["inflight"]), (2, 2, 0, 0))
+
+    def test_stats_bounded(self):
+        scheduler = self.make(workers=1, max_tracked=3)
+        for i in range(5):
+            scheduler.submit(f"t{i}", lambda: None)
+        time.sleep(0.1)
+
+        self.assertEqual(list(scheduler.stats()), ["t2", "t3", "t4"])
+
+    def test_task_error_does_not_stop_worker(self):
+        done = threading.Event()
+        scheduler = self.make(workers=1)
+        scheduler.submit("a", lambda: 1 / 0)
+        scheduler.submit("a", done.set)
+
+        self.assertTrue(done.wait(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import logging
+import time
+from collections import deque
+from enum import IntEnum, unique
+from threading import Condition
+from typing import Any, Callable, Optional
+
+
+@unique
+class MsgPriority(IntEnum):
+    # 数值越小越优先，过载时从数值最大的类别开始丢弃
+    ADMIN = 0  # 自己或管理员发的消息，例如 ^更新$
+    FRIEND = 1  # 好友请求、加好友后的系统消息
+    IDIOM = 2  # 成语查询/接龙
+    CHAT = 3  # 需要调用大模型的闲聊
+    OTHER = 4  # 其他消息，例如未启用群的消息
+
+
+class IngressQueue(object):
+    """有界优先级入口队列
+    位于 wcf.get_msg() 和消息处理之间：按类别优先出队，总长度超过上限时丢弃低优先级的消息。
+    丢弃策略：
+        drop_oldest: 丢弃最低优先级类别里排队最久的消息
+        drop_newest: 丢弃最低优先级类别里最新的消息（同类别时直接拒绝新消息）
+    低于 shed_from 的类别永远不会被丢弃，队列满时也会超额放入。
+    放入时给了会话标识的消息，同一会话内保持先后顺序：轮到某个会话时先出它最早的消息，
+    优先级只决定先处理哪个会话。
+    """
+
+    POLICIES = ("drop_oldest", "drop_newest")
+
+    def __init__(self, capacity: int = 500, policy: str = "drop_oldest", shed_from: MsgPriority = MsgPriority.IDIOM,
+                 on_shed: Optional[Callable[[Any, MsgPriority], None]] = None) -> None:
+        """
+        :param capacity: 队列总长度上限
+        :param policy: 丢弃策略，见类说明
+        :param shed_from: 从哪个类别开始允许丢弃
+        :param on_shed: 消息被丢弃时的回调，参数为 (消息, 类别)
+        """
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unsupported policy: {policy}, must be one of {self.POLICIES}")
+        self.LOG = logging.getLogger("IngressQueue")
+        self.capacity = max(1, capacity)
+        self.policy = policy
+        self.shed_from = MsgPriority(shed_from)
+        self.on_shed = on_shed
+        self.queues = {p: deque() for p in MsgPriority}  # 类别 -> deque[(入队时间, 序号, 会话, 消息)]
+        self.seq = itertools.count()
+        self.size = 0
+        self.cond = Condition()
+        self.counters = {p: {"enqueued": 0, "dropped": 0, "served": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+                         for p in MsgPriority}
+
+    def put(self, item: Any, priority: MsgPriority, key: Optional[str] = None) -> bool:
+        """放入一条消息，返回是否被接收（False 表示这条新消息被丢弃）
+        :param key: 会话标识，同一会话的消息按放入顺序出队，None 表示不限制
+        """
+        priority = MsgPriority(priority)
+        shed = None
+        accepted = True
+        with self.cond:
+            if self.size >= self.capacity:
+                shed, accepted = self._make_room(priority)
+            if accepted:
+                self.queues[priority].append((time.monotonic(), next(self.seq), key, item))
+                self.size += 1
+                self.counters[priority]["enqueued"] += 1
+                self.cond.notify()
+            else:
+                self.counters[priority]["dropped"] += 1
+
+        if shed is not None:
+            self._shed(*shed)
+        if not accepted:
+            self._shed(item, priority)
+        return accepted
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """按优先级取出一条消息，超时返回 None"""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.size > 0, timeout):
+                return None
+            p = next(p for p in MsgPriority if self.queues[p])
+            entry = self.queues[p][0]
+            if entry[2] is not None:
+                # 同一会话里更早的消息可能还排在更低优先级的类别里，先出那一条
+                for lower in MsgPriority:
+                    earlier = next((e for e in self.queues[lower] if e[2] == entry[2]), None) if lower > p else None
+                    if earlier is not None and earlier[1] < entry[1]:
+                        p, entry = lower, earlier
+            self.queues[p].remove(entry)
+            self.size -= 1
+            wait = (time.monotonic() - entry[0]) * 1000
+            c = self.counters[p]
+            c["served"] += 1
+            c["total_wait_ms"] += wait
+            c["max_wait_ms"] = max(c["max_wait_ms"], wait)
+            return entry[3]
+
+    def qsize(self) -> int:
+        with self.cond:
+            return self.size
+
+    def stats(self) -> dict:
+        """按类别统计：排队数、入队数、丢弃数、出队数、平均/最大排队时间（毫秒）"""
+        with self.cond:
+            stats = {}
+            for p in MsgPriority:
+                c = dict(self.counters[p])
+                c["queued"] = len(self.queues[p])
+                c["avg_wait_ms"] = c["total_wait_ms"] / c["served"] if c["served"] else 0.0
+                stats[p.name] = c
+            return stats
+
+    def _make_room(self, priority: MsgPriority):
+        """队列已满时腾出位置，返回 (被挤掉的消息或 None, 新消息是否可以入队)"""
+        lowest = next((p for p in reversed(MsgPriority) if self.queues[p]), None)
+        if lowest is not None and lowest >= self.shed_from and lowest >= priority:
+            if lowest == priority and self.policy == "drop_newest":
+                return None, priority < self.shed_from
+
+            q = self.queues[lowest]
+            item = (q.popleft() if self.policy == "drop_oldest" else q.pop())[3]
+            self.size -= 1
+            self.counters[lowest]["dropped"] += 1
+            return (item, lowest), True
+
+        # 没有可以挤掉的消息，受保护的类别超额放入，其余丢弃
+        return None, priority < self.shed_from
+
+    def _shed(self, item: Any, priority: MsgPriority) -> None:
+        self.LOG.warning(f"消息过载，丢弃 {priority.name} 消息")
+        if self.on_shed:
+            try:
+                self.on_shed(item, priority)
+            except Exception as e:
+                self.LOG.error(f"on_shed error: {e}")
@@ -0,0 +1,61 @@
+import unittest
+
+from msgtool.ingress import IngressQueue, MsgPriority
+
+
+class IngressQueueTestCase(unittest.TestCase):
+    def test_priority_order(self):
+        q = IngressQueue(capacity=10)
+        q.put("chat", MsgPriority.CHAT)
+        q.put("other", MsgPriority.OTHER)
+        q.put("admin", MsgPriority.ADMIN)
+
+        self.assertEqual([q.get(0), q.get(0), q.get(0)], ["admin", "chat", "other"])
+        self.assertIsNone(q.get(0))
+
+    def test_conversation_order_kept(self):
+        q = IngressQueue(capacity=10)
+        q.put("room-chat", MsgPriority.CHAT, "room")
+        q.put("other", MsgPriority.OTHER, "other")
+        q.put("room-admin", MsgPriority.ADMIN, "room")
+        q.put("room-idiom", MsgPriority.IDIOM, "room")
+
+        # 同一会话先出早的消息，不同会话仍按优先级
+        self.assertEqual([q.get(0) for _ in range(4)], ["room-chat", "room-admin", "room-idiom", "other"])
+
+    def test_drop_oldest_lowest_priority(self):
+        shed = []
+        q = IngressQueue(capacity=2, on_shed=lambda item, p: shed.append(item))
+        q.put("other", MsgPriority.OTHER)
+        q.put("chat1", MsgPriority.CHAT)
+        self.assertTrue(q.put("chat2", MsgPriority.CHAT))
+        self.assertTrue(q.put("chat3", MsgPriority.CHAT))
+
+        self.assertEqual(shed, ["other", "chat1"])
+        self.assertEqual([q.get(0), q.get(0)], ["chat2", "chat3"])
+
+    def test_drop_newest(self):
+        shed = []
+        q = IngressQueue(capacity=1, policy="drop_newest", on_shed=lambda item, p: shed.append(item))
+        q.put("chat1", MsgPriority.CHAT)
+
+        self.assertFalse(q.put("chat2", MsgPriority.CHAT))
+        self.assertEqual(shed, ["chat2"])
+        self.assertEqual(q.stats()["CHAT"]["dropped"], 1)
+
+    def test_protected_priority_never_shed(self):
+        q = IngressQueue(capacity=1)
+        q.put("admin1", MsgPriority.ADMIN)
+
+        # 受保护的类别超额放入，不能丢弃的新消息被拒绝
+        self.assertTrue(q.put("admin2", MsgPriority.ADMIN))
+        self.assertFalse(q.put("chat", MsgPriority.CHAT))
+        self.assertEqual(q.qsize(), 2)
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            IngressQueue(policy="random")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import deque
+from threading import Condition, Thread
+from typing import Any, Callable
+
+from base.rate_limit import TokenBucket
+
+
+class _Outgoing(object):
+    __slots__ = ("kind", "content", "at_list", "enqueued")
+
+    def __init__(self, kind: str, content: str, at_list: str = "") -> None:
+        self.kind = kind  # text / file
+        self.content = content
+        self.at_list = at_list
+        self.enqueued = time.monotonic()
+
+
+class Outbox(object):
+    """发送队列：所有发出去的文本和文件都先排队，由后台线程按接收人限速发送
+    - 每个接收人一个队列，同一时间只有一个线程在发，保证顺序
+    - 每个接收人一个令牌桶，另有一个全局令牌桶，避免发得太快触发风控
+    - 同一接收人短时间内连续的短文本合并成一条发送
+    - 空闲接收人的队列和令牌桶（已经补满的）会被清理，只保留统计
+    """
+
+    def __init__(self, send_text: Callable[[str, str, str], Any], send_file: Callable[[str, str], Any],
+                 workers: int = 4, rate: float = 1, burst: int = 3, global_rate: float = 5, global_burst: int = 10,
+                 coalesce_window: float = 0.5, coalesce_max_chars: int = 500) -> None:
+        """
+        :param send_text: 实际发送文本的函数 (内容, 接收人, @名单)，返回 0 或 None 表示成功
+        :param send_file: 实际发送文件的函数 (路径, 接收人)，返回 0 或 None 表示成功
+        :param workers: 发送线程数
+        :param rate: 每个接收人每秒最多发送条数
+        :param burst: 每个接收人允许的突发条数
+        :param global_rate: 所有接收人合计每秒最多发送条数
+        :param global_burst: 合计允许的突发条数
+        :param coalesce_window: 相邻文本间隔在这个时间（秒）内才合并，0 表示不合并
+        :param coalesce_max_chars: 合并后文本的最大长度
+        """
+        self.LOG = logging.getLogger("Outbox")
+        self.send_text = send_text
+        self.send_file = send_file
+        self.rate = rate
+        self.burst = burst
+        self.globalBucket = TokenBucket(global_rate, global_burst)
+        self.window = coalesce_window
+        self.maxChars = coalesce_max_chars
+        self.queues = {}
+        self.buckets = {}
+        self.active = set()  # 有消息待发或正在发送的接收人
+        self.ready = deque()  # 等待发送线程处理的接收人
+        self.counters = {}
+        self.nextPrune = 0.0
+        self.running = True
+        self.cond = Condition()
+        self.threads = []
+        for i in range(max(1, workers)):
+            t = Thread(target=self._run, name=f"Outbox-{i}", daemon=True)
+            t.start()
+            self.threads.append(t)
+
+    @classmethod
+    def from_config(cls, conf: dict, send_text: Callable, send_file: Callable) -> "Outbox":
+        conf = conf or {}
+        return cls(send_text, send_file, conf.get("workers", 4), conf.get("rate", 1), conf.get("burst", 3),
+                   conf.get("global_rate", 5), conf.get("global_burst", 10), conf.get("coalesce_window", 0.5),
+                   conf.get("coalesce_max_chars", 500))
+
+    def text(self, content: str, receiver: str, at_list: str = "") -> None:
+        self._put(receiver, _Outgoing("text", content, at_list))
+
+    def file(self, path: str, receiver: str) -> None:
+        self._put(receiver, _Outgoing("file", path))
+
+    def qsize(self) -> int:
+        with self.cond:
+            return sum(len(q) for q in self.queues.values())
+
+    def stats(self) -> dict:
+        """按接收人统计：排队数、发送次数、合并掉的条数、失败数、平均/最大排队时间（毫秒）"""
+        with self.cond:
+            stats = {}
+            for receiver, c in self.counters.items():
+                c = dict(c, queued=len(self.queues.get(receiver, ())))
+                c["avg_wait_ms"] = c["total_wait_ms"] / c["items"] if c["items"] else 0.0
+                stats[receiver] = c
+            return stats
+
+    def stop(self, timeout: float = 5) -> None:
+        """等待队列发完（最多 timeout 秒）后停止"""
+        with self.cond:
+            self.cond.wait_for(lambda: not self.active, timeout)
+            self.running = False
+            self.cond.notify_all()
+
+    def _put(self, receiver: str, item: _Outgoing) -> None:
+        with self.cond:
+            self.queues.setdefault(receiver, deque()).append(item)
+            if receiver not in self.active:
+                self.active.add(receiver)
+                self.ready.append(receiver)
+                self.cond.notify_all()
+
+    def _bucket(self, receiver: str) -> TokenBucket:
+        with self.cond:
+            bucket = self.buckets.get(receiver)
+            if bucket is None:
+                bucket = self.buckets[receiver] = TokenBucket(self.rate, self.burst)
+            return bucket
+
+    def _coalescible(self, item: _Outgoing) -> bool:
+        return self.window > 0 and item.kind == "text" and len(item.content) < self.maxChars
+
+    def _take(self, receiver: str) -> list:
+        """取出下一批要发送的消息：一个文件，或者一条文本连同后面可以合并的短文本"""
+        q = self.queues[receiver]
+        batch = [q.popleft()]
+        if self._coalescible(batch[0]):
+            size = len(batch[0].content)
+            while q and self._coalescible(q[0]) and not q[0].at_list \
+                    and q[0].enqueued - batch[-1].enqueued <= self.window \
+                    and size + 1 + len(q[0].content) <= self.maxChars:
+                size += 1 + len(q[0].content)
+                batch.append(q.popleft())
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: not self.running or self.ready)
+                if not self.running:
+                    return
+                receiver = self.ready.popleft()
+                head = self.queues[receiver][0]
+
+            # 短文本先等一个合并窗口，让紧接着的消息可以一起发
+            if self._coalescible(head):
+                wait = head.enqueued + self.window - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+            self._bucket(receiver).consume()
+            self.globalBucket.consume()
+
+            with self.cond:
+                batch = self._take(receiver)
+            try:
+                if batch[0].kind == "file":
+                    rc = self.send_file(batch[0].content, receiver)
+                else:
+                    rc = self.send_text("\n".join(i.content for i in batch), receiver, batch[0].at_list)
+                failed = rc not in (0, None)
+                if failed:
+                    self.LOG.error(f"发送到 {receiver} 失败: 返回 {rc}")
+            except Exception as e:
+                self.LOG.error(f"发送到 {receiver} 失败: {e}")
+                failed = True
+
+            now = time.monotonic()
+            with self.cond:
+                c = self.counters.setdefault(receiver, {"sends": 0, "items": 0, "merged": 0, "errors": 0,
+                                                        "total_wait_ms": 0.0, "max_wait_ms": 0.0})
+                c["sends"] += 1
+                c["items"] += len(batch)
+                c["merged"] += len(batch) - 1
+                c["errors"] += int(failed)
+                for i in batch:
+                    wait = (now - i.enqueued) * 1000
+                    c["total_wait_ms"] += wait
+                    c["max_wait_ms"] = max(c["max_wait_ms"], wait)
+
+                if self.queues[receiver]:
+                    self.ready.append(receiver)
+                else:
+                    del self.queues[receiver]
+                    self.active.discard(receiver)
+                    if now >= self.nextPrune:
+                        self._prune_buckets(now)
+                self.cond.notify_all()
+
+    def _prune_buckets(self, now: float) -> None:
+        """删除空闲接收人已经补满的令牌桶（和新建的一样），最多每个补满周期清理一次；调用方持有 self.cond"""
+        for receiver in [r for r, b in self.buckets.items() if r not in self.active and b.fill_ratio() >= 1]:
+            del self.buckets[receiver]
+        self.nextPrune = now + max(1.0, self.burst / self.rate if self.rate else 0)
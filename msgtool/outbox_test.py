@@ -0,0 +1,104 @@
+import threading
+import time
+import unittest
+
+from msgtool.outbox import Outbox
+
+
+class OutboxTestCase(unittest.TestCase):
+    def make(self, **kwargs):
+        self.sent = []
+        self.lock = threading.Lock()
+
+        def send_text(content, receiver, at_list):
+            with self.lock:
+                self.sent.append((receiver, content))
+
+        def send_file(path, receiver):
+            with self.lock:
+                self.sent.append((receiver, "file:" + path))
+
+        options = dict(workers=4, rate=100, burst=100, global_rate=100, global_burst=100)
+        options.update(kwargs)
+        outbox = Outbox(send_text, send_file, **options)
+        self.addCleanup(outbox.stop, 0)
+        return outbox
+
+    def test_coalesce_short_texts(self):
+        outbox = self.make(coalesce_window=0.1)
+        for i in range(3):
+            outbox.text(f"第{i}句", "a")
+        outbox.stop()
+
+        self.assertEqual(self.sent, [("a", "第0句\n第1句\n第2句")])
+        self.assertEqual(outbox.stats()["a"]["merged"], 2)
+
+    def test_order_per_receiver(self):
+        outbox = self.make(coalesce_window=0)
+        for i in range(20):
+            outbox.text(str(i), "a")
+            outbox.file(str(i), "b")
+        outbox.stop()
+
+        self.assertEqual([c for r, c in self.sent if r == "a"], [str(i) for i in range(20)])
+        self.assertEqual([c for r, c in self.sent if r == "b"], ["file:" + str(i) for i in range(20)])
+
+    def test_file_not_coalesced(self):
+        outbox = self.make(coalesce_window=0.1)
+        outbox.text("一", "a")
+        outbox.file("x.png", "a")
+        outbox.text("二", "a")
+        outbox.stop()
+
+        self.assertEqual([c for _, c in self.sent], ["一", "file:x.png", "二"])
+
+    def test_rate_limit(self):
+        outbox = self.make(coalesce_window=0, rate=10, burst=1)
+        start = time.monotonic()
+        for i in range(4):
+            outbox.text(str(i), "a")
+        outbox.stop()
+
+        self.assertEqual(len(self.sent), 4)
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_send_error_counted(self):
+        outbox = Outbox(lambda *args: 1 / 0, lambda *args: None, workers=1, coalesce_window=0)
+        outbox.text("x", "a")
+        outbox.stop()
+
+        self.assertEqual(outbox.stats()["a"]["errors"], 1)
+
+
+    def test_nonzero_rc_counted(self):
+        outbox = Outbox(lambda *args: -1, lambda *args: 1, workers=1, coalesce_window=0)
+        outbox.text("x", "a")
+        outbox.file("x.png", "a")
+        outbox.text("y", "b")
+        outbox.stop()
+
+        self.assertEqual(outbox.stats()["a"]["errors"], 2)
+        self.assertEqual(outbox.stats()["b"]["errors"], 1)
+
+    def test_idle_receivers_pruned(self):
+        outbox = self.make(coalesce_window=0, rate=100, burst=1)
+        for i in range(10):
+            outbox.text("x", f"r{i}")
+        self.wait_idle(outbox)
+        self.assertEqual(outbox.queues, {})
+
+        # 清理周期过后，下一个空闲的接收人触发清理，已经补满的令牌桶都删掉
+        time.sleep(1.05)
+        outbox.text("x", "last")
+        self.wait_idle(outbox)
+
+        self.assertEqual(set(outbox.buckets), {"last"})
+        self.assertEqual(len(outbox.stats()), 11)
+
+    @staticmethod
+    def wait_idle(outbox):
+        with outbox.cond:
+            outbox.cond.wait_for(lambda: not outbox.active, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+import re
+from typing import Iterable, Iterator
+
+# 句子结束：中英文句号、问号、感叹号、分号、省略号和换行
+_SENTENCE_END = re.compile(r"[。！？；!?;…\n]|\.(?=\s)")
+_PARAGRAPH_END = re.compile(r"\n\s*\n")
+
+
+def iter_chunks(pieces: Iterable[str], min_chars: int = 20, mode: str = "sentence") -> Iterator[str]:
+    """把流式返回的零碎文本拼成完整的句子或段落再吐出去
+    :param pieces: 模型流式返回的文本片段
+    :param min_chars: 每段最少字数，太短的句子会和后面的合并，避免刷屏
+    :param mode: sentence 按句切分，paragraph 按段切分
+    """
+    boundary = _PARAGRAPH_END if mode == "paragraph" else _SENTENCE_END
+    buffer = ""
+    for piece in pieces:
+        if not piece:
+            continue
+        buffer += piece
+        # 找到最后一个满足最小长度的边界，把边界之前的内容作为一段输出
+        cut = 0
+        for m in boundary.finditer(buffer):
+            if m.end() >= min_chars:
+                cut = m.end()
+        if cut:
+            chunk, buffer = buffer[:cut], buffer[cut:]
+            yield chunk
+
+    if buffer:
+        yield buffer
@@ -0,0 +1,36 @@
+import unittest
+
+from msgtool.stream import iter_chunks
+
+
+class IterChunksTestCase(unittest.TestCase):
+    def test_sentences_across_pieces(self):
+        pieces = ["今天天", "气很好。明天", "会下雨吗？不", "知道"]
+        self.assertEqual(list(iter_chunks(pieces, min_chars=1)), ["今天天气很好。", "明天会下雨吗？", "不知道"])
+
+    def test_short_sentences_merged(self):
+        pieces = ["好。", "是的。", "这是一个比较长的句子。"]
+        self.assertEqual(list(iter_chunks(pieces, min_chars=5)), ["好。是的。", "这是一个比较长的句子。"])
+        # 已经到手的内容在最后一个够长的边界处一起发出
+        self.assertEqual(list(iter_chunks(["好。是的。很好。"], min_chars=5)), ["好。是的。很好。"])
+
+    def test_nothing_lost(self):
+        text = "First sentence. Second one! 第三句；第四句…最后没有标点"
+        pieces = [text[i:i + 3] for i in range(0, len(text), 3)]
+        self.assertEqual("".join(iter_chunks(pieces, min_chars=5)), text)
+
+    def test_decimal_point_not_a_boundary(self):
+        self.assertEqual(list(iter_chunks(["圆周率约为 3.14 左右"], min_chars=1)), ["圆周率约为 3.14 左右"])
+
+    def test_paragraph_mode(self):
+        pieces = ["第一段。还是第一段。\n\n", "第二段。"]
+        self.assertEqual(list(iter_chunks(pieces, min_chars=1, mode="paragraph")),
+                         ["第一段。还是第一段。\n\n", "第二段。"])
+
+    def test_empty_pieces_skipped(self):
+        self.assertEqual(list(iter_chunks(["", None, "你好。", ""], min_chars=1)), ["你好。"])
+        self.assertEqual(list(iter_chunks([])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
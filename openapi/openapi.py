@@ -1,16 +1,29 @@
+import json
 import re
 
 import requests
 
+from cachetool import TTLCache
+from httptool import http_client
+
 
 class OpenAPIHandler:
+    # 各接口的缓存时间（秒），不在这里的接口不缓存。舔狗日记、抖音视频每次都要随机内容，不能缓存
+    cache_ttl = {
+        "todayInHistory": 60 * 60,
+        "weather": 10 * 60,
+        "search_movie": 60 * 60,
+    }
+    # 所有实例共享，并发的相同请求只会真正请求一次
+    cache = TTLCache(max_size=512)
+
     @staticmethod
     def request_api(method, url, params=None, is_json=True):
         try:
             if method == 'GET':
-                response = requests.get(url, params=params, verify=False)
+                response = http_client.get(url, params=params, verify=False)
             elif method == 'POST':
-                response = requests.post(url, json=params, verify=False)
+                response = http_client.post(url, json=params, verify=False)
             else:
                 raise ValueError("Unsupported method. Only GET and POST are supported.")
 
@@ -29,10 +42,23 @@ class OpenAPIHandler:
         except Exception as e:
             print("An error occurred:", e)
 
+    def cached_request(self, endpoint, method, url, params=None, is_json=True):
+        """按接口配置的缓存时间缓存 request_api 的结果，请求失败（返回 None）不缓存"""
+        ttl = self.cache_ttl.get(endpoint)
+        if not ttl:
+            return self.request_api(method, url, params, is_json)
+
+        key = (endpoint, method, url, json.dumps(params, sort_keys=True, ensure_ascii=False), is_json)
+        return self.cache.get_or_load(key, lambda: self.request_api(method, url, params, is_json), ttl)
+
+    @classmethod
+    def cache_stats(cls) -> dict:
+        return cls.cache.stats()
+
     def todayInHistory(self):
         """历史上的今天"""
         url = "https://api.oick.cn/lishi/api.php"
-        return self.request_api("GET", url)
+        return self.cached_request("todayInHistory", "GET", url)
 
     def tiTokGirlVideo(self):
         """抖音美女视频"""
@@ -51,12 +77,12 @@ class OpenAPIHandler:
     def weather(self, city):
         """天气预报"""
         url = "https://www.apii.cn/api/weather/?city=%s" % city
-        return self.request_api("GET", url)
+        return self.cached_request("weather", "GET", url)
 
     def search_movie(self, movie_name):
         """搜索电影"""
         url = "https://www.662688.xyz/api/get_zy?keyword=%s" % movie_name
-        return self.request_api("GET", url)
+        return self.cached_request("search_movie", "GET", url)
 
 
 # 示例使用
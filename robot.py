@@ -7,11 +7,13 @@ import time
 import xml.etree.ElementTree as ET
 from datetime import datetime
 from queue import Empty
-from threading import Thread
+from threading import Lock, Thread
+from typing import Iterator
 
-import requests
 from wcferry import Wcf, WxMsg
 
+from base.answer_cache import AnswerCache
+from base.deadline import TIMEOUT_REPLY, Deadline
 from base.func_bard import BardAssistant
 from base.func_chatglm import ChatGLM
 from base.func_chatgpt import ChatGPT
@@ -19,10 +21,17 @@ from base.func_chengyu import cy
 from base.func_news import News
 from base.func_tigerbot import TigerBot
 from base.func_xinghuo_web import XinghuoWeb
+from base.image_jobs import ImageJobs
+from base.media_pool import ReadyPool
+from base.media_store import media_store
+from base.prefetch import Prefetcher
+from base.llm_router import LLMRouter
 from configuration import Config
 from constants import ChatType
-from dbtool import MysqlFactor
-from job_mgmt import Job
+from dbtool import MsgBuffer, MysqlFactor
+from httptool import http_client, media_downloader
+from job_mgmt import Job, scheduler
+from msgtool import Broadcaster, FairScheduler, IngressQueue, MsgDispatcher, MsgPriority, Outbox, iter_chunks
 
 __version__ = "39.0.10.1"
 
@@ -37,22 +46,55 @@ class Robot(Job):
         self.wcf = wcf
         self.config = config
         self.LOG = logging.getLogger("Robot")
+        scheduler.configure(self.config.SCHEDULER)
+        # 消息由多个线程并行处理，共享状态需要加锁
+        self.contactsLock = Lock()
+        self.fileLock = Lock()  # wcf.send_file 不是线程安全的
+        self.dispatcher = None
+        self.ingress = None
+        self.busyReplied = {}  # 会话 -> 上次回复“忙”的时间
+        self.busyLock = Lock()
         if wcf:
             self.wxid = self.wcf.get_self_wxid()
             self.allContacts = self.getAllContacts()
+        conf = self.config.HTTP or {}
+        if conf:
+            http_client.configure(timeout=(conf.get("connect_timeout", 5), conf.get("read_timeout", 30)),
+                                  retries=conf.get("retries"), backoff=conf.get("backoff"),
+                                  max_per_host=conf.get("max_per_host"))
+            media_downloader.configure(max_bytes=conf.get("max_download_mb", 0) << 20)
         db = MysqlFactor().create(config.DB, pool=False, log_enabled=True)
         self.db = db
+        # 消息先进写缓冲，由后台线程批量落库，不占用回复的时间
+        conf = self.config.MSG_BUFFER or {}
+        self.msgBuffer = MsgBuffer(db, "INSERT INTO messages (id, type, xml, sender, roomid, content, thumb, extra) "
+                                       "VALUES (%s, %s, %s, %s, %s, %s, %s, %s)",
+                                   batch_size=conf.get("batch_size", 100),
+                                   flush_interval=conf.get("flush_interval", 1.0),
+                                   max_size=conf.get("max_size", 10000))
         self.openapi = OpenAPIHandler()
-
-        if ChatType.is_in_chat_types(chat_type):
+        # 定时群发的内容提前准备好，发送时直接读取
+        self.prefetcher = Prefetcher.from_config(self.config.PREFETCH)
+        self.prefetcher.register("newsReport", lambda: News().get_important_news())
+        self.prefetcher.register("todayInHistory", self.fetchTodayInHistory)
+        self.prefetcher.register("moyu", self.fetchMoYu, kind="files")
+        self.videoPool = ReadyPool.from_config(self.config.TIKTOK_POOL, self.getAndSaveTiTokGirlVideo,
+                                               os.path.join(os.getcwd(), "video", "pool"), "VideoPool")
+        # 生成和下载的媒体文件按容量和时间清理，视频池和预取目录各自管理
+        media_store.configure(self.config.MEDIA_STORE, exclude=[self.videoPool.pool_dir, self.prefetcher.cache_dir])
+        self.onEveryMinutes(self.config.MEDIA_STORE.get("sweep_minutes", 10), media_store.sweep)
+
+        if self.config.ROUTER.get("enable"):
+            self.chat = self.createRouter()
+        elif ChatType.is_in_chat_types(chat_type):
             if chat_type == ChatType.TIGER_BOT.value and TigerBot.value_check(self.config.TIGERBOT):
                 self.chat = TigerBot(self.config.TIGERBOT)
             elif chat_type == ChatType.CHATGPT.value and ChatGPT.value_check(self.config.CHATGPT):
-                self.chat = ChatGPT(self.config.CHATGPT)
+                self.chat = ChatGPT(self.config.CHATGPT, self.config.CONVERSATION)
             elif chat_type == ChatType.XINGHUO_WEB.value and XinghuoWeb.value_check(self.config.XINGHUO_WEB):
                 self.chat = XinghuoWeb(self.config.XINGHUO_WEB)
             elif chat_type == ChatType.CHATGLM.value and ChatGLM.value_check(self.config.CHATGLM):
-                self.chat = ChatGLM(self.config.CHATGLM)
+                self.chat = ChatGLM(self.config.CHATGLM, store_conf=self.config.CONVERSATION)
             elif chat_type == ChatType.BardAssistant.value and BardAssistant.value_check(self.config.BardAssistant):
                 self.chat = BardAssistant(self.config.BardAssistant)
             else:
@@ -62,11 +104,11 @@ class Robot(Job):
             if TigerBot.value_check(self.config.TIGERBOT):
                 self.chat = TigerBot(self.config.TIGERBOT)
             elif ChatGPT.value_check(self.config.CHATGPT):
-                self.chat = ChatGPT(self.config.CHATGPT)
+                self.chat = ChatGPT(self.config.CHATGPT, self.config.CONVERSATION)
             elif XinghuoWeb.value_check(self.config.XINGHUO_WEB):
                 self.chat = XinghuoWeb(self.config.XINGHUO_WEB)
             elif ChatGLM.value_check(self.config.CHATGLM):
-                self.chat = ChatGLM(self.config.CHATGLM)
+                self.chat = ChatGLM(self.config.CHATGLM, store_conf=self.config.CONVERSATION)
             elif BardAssistant.value_check(self.config.BardAssistant):
                 self.chat = BardAssistant(self.config.BardAssistant)
             else:
@@ -74,6 +116,34 @@ class Robot(Job):
                 self.chat = None
 
         self.LOG.info(f"已选择: {self.chat}")
+        self.answerCache = AnswerCache.from_config(self.config.ANSWER_CACHE)
+        self.llmScheduler = FairScheduler.from_config(self.config.LLM_SCHEDULER, "LLMScheduler")
+        self.outbox = Outbox.from_config(self.config.OUTBOX, lambda *args: self.wcf.send_text(*args),
+                                         self.sendQueuedFile)
+        # 定时群发和日常回复共用发送队列的全局限速
+        self.broadcaster = Broadcaster.from_config(self.config.BROADCAST, lambda *args: self.wcf.send_text(*args),
+                                                   self.sendFileNow, self.outbox.globalBucket)
+        # 画图在后台排队生成，不占用消息处理线程
+        self.imageJobs = ImageJobs.from_config(self.config.IMAGE_JOBS, self.chat, self.deliverImage)
+
+    def createRouter(self):
+        """多模型路由：初始化所有配置好的模型，由路由按延迟和健康状态选择"""
+        backends = {}
+        if ChatGPT.value_check(self.config.CHATGPT):
+            backends["chatgpt"] = ChatGPT(self.config.CHATGPT, self.config.CONVERSATION)
+        if ChatGLM.value_check(self.config.CHATGLM):
+            backends["chatglm"] = ChatGLM(self.config.CHATGLM, store_conf=self.config.CONVERSATION)
+        if TigerBot.value_check(self.config.TIGERBOT):
+            backends["tigerbot"] = TigerBot(self.config.TIGERBOT)
+        if XinghuoWeb.value_check(self.config.XINGHUO_WEB):
+            backends["xinghuo_web"] = XinghuoWeb(self.config.XINGHUO_WEB)
+        if BardAssistant.value_check(self.config.BardAssistant):
+            backends["bard"] = BardAssistant(self.config.BardAssistant)
+
+        if not backends:
+            self.LOG.warning("未配置模型")
+            return None
+        return LLMRouter(backends, self.config.ROUTER)
 
     @staticmethod
     def value_check(args: dict) -> bool:
@@ -81,20 +151,25 @@ class Robot(Job):
             return all(value is not None for key, value in args.items() if key != 'proxy')
         return False
 
-    def toAt(self, msg: WxMsg) -> bool:
+    def toAt(self, msg: WxMsg, deadline: Deadline = None) -> bool:
         """处理被 @ 消息
         :param msg: 微信消息结构
+        :param deadline: 这条消息的时间预算
         :return: 处理状态，`True` 成功，`False` 失败
         """
         self.LOG.info(f"接收到消息:{msg.content}")
         cmd = re.sub(r"^@.*?[\u2005|\s]", "", msg.content).replace(" ", "")
         if cmd == "tiktok":
-            sendPath = self.getAndSaveTiTokGirlVideo()
+            # 优先用后台预先下载好的视频，池空时才现场下载
+            sendPath = self.videoPool.take() or self.getAndSaveTiTokGirlVideo()
+            if not sendPath:
+                self.sendTextMsg("视频还没准备好，请稍后再试", msg.roomid, msg.sender)
+                return False
             self.LOG.info(f"发送视频:{sendPath},到群聊:{msg.roomid}")
-            self.wcf.send_file(sendPath, msg.roomid)
+            self.sendFile(media_store.add(sendPath, "tiktok"), msg.roomid)
             return True
 
-        return self.toChitchat(msg)
+        return self.toChitchat(msg, deadline)
 
     def toChengyu(self, msg: WxMsg) -> bool:
         """
@@ -123,10 +198,12 @@ class Robot(Job):
 
         return status
 
-    def toChitchat(self, msg: WxMsg) -> bool:
+    def toChitchat(self, msg: WxMsg, deadline: Deadline = None) -> bool:
         """闲聊，接入 ChatGPT
         """
+        deadline = deadline or Deadline()
         send_image = False
+        start = time.time()
         q = re.sub(r"@.*?[\u2005|\s]", "", msg.content).replace(" ", "")
         if not self.chat:  # 没接 ChatGPT，固定回复
             rsp = "你@我干嘛？"
@@ -147,7 +224,43 @@ class Robot(Job):
                 if q.startswith("舔我"):
                     rsp = self.openapi.dog()
                 else:
-                    rsp = self.chat.get_answer(q, (msg.roomid if msg.from_group() else msg.sender))
+                    # 大模型回答按群/私聊排队公平调度，一个很活跃的群不会占满所有并发
+                    receiver = msg.roomid if msg.from_group() else msg.sender
+                    if not self.llmScheduler.submit(receiver, self.chitchatWithLLM, msg, q, start, deadline):
+                        self.LOG.warning(f"[{receiver}] 排队的问题太多，丢弃：{q}")
+                        self.onShed(msg, MsgPriority.CHAT)
+                        return False
+                    return True
+
+        return self.replyChitchat(msg, rsp, send_image, start, deadline)
+
+    def chitchatWithLLM(self, msg: WxMsg, q: str, start: float, deadline: Deadline) -> bool:
+        """调用大模型回答闲聊，在公平调度器的线程里执行"""
+        receiver = msg.roomid if msg.from_group() else msg.sender
+        if not deadline.check("queue"):
+            # 排队太久，已经来不及回答了
+            self.LOG.warning(f"[{receiver}] 排队超时，放弃回答：{q}")
+            reply = self.config.DEADLINE.get("timeout_reply", TIMEOUT_REPLY)
+            return self.replyChitchat(msg, reply, False, start, deadline)
+
+        scope = self.answerCacheScope(q, receiver)
+        rsp = self.answerCache.get(q, scope) if scope else None
+        if rsp:
+            self.LOG.info(f"命中回答缓存：{q}")
+        elif self.canStream():
+            # 流式回复：生成一句发一句，不用等整个回答生成完
+            pieces = self.chat.get_answer_stream(q, receiver, deadline)
+            if scope:
+                pieces = self.answerCache.record(pieces, q, scope)
+            atList = msg.sender if msg.from_group() else ""
+            return self.sendStreamMsg(pieces, receiver, atList)
+        else:
+            rsp = self.chat.get_answer(q, receiver, deadline=deadline)
+            if scope:
+                self.answerCache.put(q, scope, rsp)
+        return self.replyChitchat(msg, rsp, False, start, deadline)
+
+    def replyChitchat(self, msg: WxMsg, rsp: str, send_image: bool, start: float, deadline: Deadline) -> bool:
         if rsp:
             if msg.from_group():
                 if send_image:
@@ -155,7 +268,7 @@ class Robot(Job):
                     return True
 
                 if self.config.SEND_AUDIO:
-                    self.sendAudioMsg(rsp, msg.roomid)
+                    self.sendAudioMsg(rsp, msg.roomid, deadline, msg.sender)
                 else:
                     self.sendTextMsg(rsp, msg.roomid, msg.sender)
             else:
@@ -164,14 +277,62 @@ class Robot(Job):
                     return True
 
                 if self.config.SEND_AUDIO:
-                    self.sendAudioMsg(rsp, msg.sender)
+                    self.sendAudioMsg(rsp, msg.sender, deadline)
                 else:
                     self.sendTextMsg(rsp, msg.sender)
+            self.LOG.info(f"首条消息耗时 {time.time() - start:.2f}s")
             return True
         else:
             self.LOG.error(f"无法从 ChatGPT 获得答案")
             return False
 
+    def answerCacheScope(self, q: str, receiver: str) -> str:
+        """回答缓存的作用域（模型 + 人设），返回空表示这次不使用缓存"""
+        if not self.config.ANSWER_CACHE.get("enable") or not self.answerCache.enabled_for(receiver):
+            return ""
+        if q.startswith("#"):  # 指令，例如 ChatGLM 切换模式
+            return ""
+        if hasattr(self.chat, "cache_identity"):
+            return self.chat.cache_identity(receiver) or ""
+        return repr(self.chat)
+
+    def canStream(self) -> bool:
+        """是否使用流式回复：需要开启配置、模型支持，且不是语音回复"""
+        return bool(self.config.STREAM.get("enable")) and not self.config.SEND_AUDIO \
+            and hasattr(self.chat, "get_answer_stream")
+
+    def sendStreamMsg(self, pieces: Iterator[str], receiver: str, at_list: str = "") -> bool:
+        """边生成边发送，凑够一句（或一段）就发出去
+        :param pieces: 模型流式返回的文本片段
+        :param receiver: 接收人wxid或者群id
+        :param at_list: 要@的wxid，只在第一条消息里@
+        :return: 是否发送了内容
+        """
+        conf = self.config.STREAM
+        interval = conf.get("interval", 1.0)
+        start = time.time()
+        lastSend = 0
+        count = 0
+        for chunk in iter_chunks(pieces, conf.get("min_chars", 20), conf.get("mode", "sentence")):
+            chunk = chunk.strip().replace("\n\n", "\n")
+            if not chunk:
+                continue
+            # 两次发送之间至少间隔 interval 秒，避免触发风控
+            wait = interval - (time.time() - lastSend)
+            if wait > 0:
+                time.sleep(wait)
+            self.sendTextMsg(chunk, receiver, at_list if count == 0 else "")
+            lastSend = time.time()
+            if count == 0:
+                self.LOG.info(f"首条消息耗时 {lastSend - start:.2f}s")
+            count += 1
+
+        if count == 0:
+            self.LOG.error(f"无法从 {self.chat} 获得答案")
+            return False
+        self.LOG.info(f"流式回复完成，共 {count} 条，总耗时 {time.time() - start:.2f}s")
+        return True
+
     def processMsg(self, msg: WxMsg) -> None:
         """当接收到消息的时候，会调用本方法。如果不实现本方法，则打印原始消息。
         此处可进行自定义发送的内容,如通过 msg.content 关键字自动获取当前天气信息，并发送到对应的群组@发送者
@@ -181,9 +342,8 @@ class Robot(Job):
         self.sendTextMsg(content, receivers, msg.sender)
         """
 
-        sql = "INSERT INTO messages (id, type, xml, sender, roomid, content, thumb, extra) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)"
-        val = (msg.id, msg.type, msg.xml, msg.sender, msg.roomid, msg.content, msg.thumb, msg.extra)
-        self.db.execute(sql, val)
+        # 每条消息从这里开始计时，后面的大模型、工具、语音、画图都不能超出这个预算
+        deadline = Deadline(self.config.DEADLINE.get("budget", 90))
 
         # 群聊消息
         if msg.from_group():
@@ -192,7 +352,7 @@ class Robot(Job):
                 return
 
             if msg.is_at(self.wxid):  # 被@
-                self.toAt(msg)
+                self.toAt(msg, deadline)
 
             else:  # 其他消息
                 self.toChengyu(msg)
@@ -213,11 +373,60 @@ class Robot(Job):
                     self.config.reload()
                     self.LOG.info("已更新")
             else:
-                self.toChitchat(msg)  # 闲聊
+                self.toChitchat(msg, deadline)  # 闲聊
+
+    def saveMsg(self, msg: WxMsg) -> None:
+        """消息落库，只放入写缓冲，不阻塞"""
+        self.msgBuffer.append((msg.id, msg.type, msg.xml, msg.sender, msg.roomid, msg.content, msg.thumb, msg.extra))
+
+    def classifyMsg(self, msg: WxMsg) -> MsgPriority:
+        """消息分类，决定过载时的处理顺序和丢弃顺序"""
+        if msg.from_self() or msg.sender in (self.config.INGRESS.get("admins") or []):
+            return MsgPriority.ADMIN
+
+        if msg.from_group():
+            if msg.roomid not in self.config.GROUPS:
+                return MsgPriority.OTHER
+            if msg.is_at(self.wxid):
+                return MsgPriority.CHAT
+            if re.match(r"^[#?？]", msg.content):
+                return MsgPriority.IDIOM
+            return MsgPriority.OTHER
+
+        if msg.type in (37, 10000):  # 好友请求、系统信息
+            return MsgPriority.FRIEND
+        if msg.type == 0x01:
+            return MsgPriority.CHAT
+        return MsgPriority.OTHER
+
+    def onShed(self, msg: WxMsg, priority: MsgPriority) -> None:
+        """过载丢弃消息时，礼貌地回复一下，同一会话一段时间内只回复一次"""
+        if priority != MsgPriority.CHAT:
+            return
+
+        busyReply = self.config.INGRESS.get("busy_reply", "我有点忙不过来了，请稍后再试~")
+        if not busyReply:
+            return
+
+        receiver = msg.roomid if msg.from_group() else msg.sender
+        now = time.time()
+        interval = self.config.INGRESS.get("busy_reply_interval", 60)
+        with self.busyLock:
+            if now - self.busyReplied.get(receiver, 0) < interval:
+                return
+            if len(self.busyReplied) >= 1000:
+                # 超过间隔的记录已经没用了
+                self.busyReplied = {k: t for k, t in self.busyReplied.items() if now - t < interval}
+            self.busyReplied[receiver] = now
+        if msg.from_group():
+            self.sendTextMsg(busyReply, receiver, msg.sender)
+        else:
+            self.sendTextMsg(busyReply, receiver)
 
     def onMsg(self, msg: WxMsg) -> int:
         try:
             self.LOG.info(msg)  # 打印信息
+            self.saveMsg(msg)
             self.processMsg(msg)
         except Exception as e:
             self.LOG.error(e)
@@ -233,15 +442,38 @@ class Robot(Job):
                 try:
                     msg = wcf.get_msg()
                     self.LOG.info(msg)
-                    self.processMsg(msg)
+                    self.saveMsg(msg)
+                    self.ingress.put(msg, self.classifyMsg(msg), MsgDispatcher.shard_key(msg))
                 except Empty:
                     continue  # Empty message
                 except Exception as e:
                     self.LOG.error(f"Receiving message error: {e}")
 
+        def pumpMsg():
+            # 按优先级从入口队列取消息（同一会话内保持顺序），交给分发器；
+            # 分发器满了会阻塞在这里，积压留在入口队列里按优先级丢弃
+            while True:
+                msg = self.ingress.get()
+                if msg is not None:
+                    self.dispatcher.submit(msg, priority=self.classifyMsg(msg))
+
+        conf = self.config.DISPATCHER or {}
+        self.dispatcher = MsgDispatcher(self.processMsg, conf.get("workers", 4), conf.get("queue_size", 100))
+        conf = self.config.INGRESS or {}
+        self.ingress = IngressQueue(conf.get("capacity", 500), conf.get("policy", "drop_oldest"), on_shed=self.onShed)
         self.wcf.enable_receiving_msg()
+        Thread(target=pumpMsg, name="PumpMessage", daemon=True).start()
         Thread(target=innerProcessMsg, name="GetMessage", args=(self.wcf,), daemon=True).start()
 
+    def cleanup(self) -> None:
+        """退出前清理，把缓冲中的消息写入数据库"""
+        scheduler.stop()
+        self.videoPool.stop()
+        self.imageJobs.stop()
+        self.llmScheduler.stop()
+        self.outbox.stop()
+        self.msgBuffer.stop()
+
     def sendTextMsg(self, msg: str, receiver: str, at_list: str = "") -> None:
         """ 发送消息
         :param msg: 消息字符串
@@ -260,12 +492,30 @@ class Robot(Job):
                     ats += f" @{self.wcf.get_alias_in_chatroom(wxid, receiver)}"
 
         # {msg}{ats} 表示要发送的消息内容后面紧跟@，例如 北京天气情况为：xxx @张三
+        # 放入发送队列，由后台线程限速发送
         if ats == "":
             self.LOG.info(f"To {receiver}: {msg}")
-            self.wcf.send_text(f"{msg}", receiver, at_list)
+            self.outbox.text(f"{msg}", receiver, at_list)
         else:
             self.LOG.info(f"To {receiver}: {ats}\r{msg}")
-            self.wcf.send_text(f"{ats}\n\n{msg}", receiver, at_list)
+            self.outbox.text(f"{ats}\n\n{msg}", receiver, at_list)
+
+    def sendFile(self, path: str, receiver: str) -> None:
+        """发送文件（图片、视频、语音），和文本一起排队限速"""
+        self.LOG.info(f"To {receiver}: {path}")
+        media_store.acquire(path)  # 排队期间不会被清理
+        self.outbox.file(path, receiver)
+
+    def sendQueuedFile(self, path: str, receiver: str) -> int:
+        try:
+            return self.sendFileNow(path, receiver)
+        finally:
+            media_store.release(path)
+
+    def sendFileNow(self, path: str, receiver: str) -> int:
+        """直接发送文件，返回 0 表示成功"""
+        with self.fileLock:
+            return self.wcf.send_file(path, receiver)
 
     def getAllContacts(self) -> dict:
         """
@@ -279,9 +529,7 @@ class Robot(Job):
         """
         保持机器人运行，不让进程退出
         """
-        while True:
-            self.runPendingJobs()
-            time.sleep(1)
+        self.runJobsForever()
 
     def autoAcceptFriendRequest(self, msg: WxMsg) -> None:
         try:
@@ -298,46 +546,61 @@ class Robot(Job):
         nickName = re.findall(r"你已添加了(.*)，现在可以开始聊天了。", msg.content)
         if nickName:
             # 添加了好友，更新好友列表
-            self.allContacts[msg.sender] = nickName[0]
+            with self.contactsLock:
+                self.allContacts[msg.sender] = nickName[0]
             self.sendTextMsg(f"Hi {nickName[0]}，我自动通过了你的好友请求。", msg.sender)
 
+    def onEveryTimeWithPrefetch(self, times, name: str, task) -> None:
+        """每天定时发送，提前 prefetch.lead 秒预取内容
+        :param times: 发送时间，格式同 onEveryTime
+        :param name: 预取内容的名称，见 __init__ 中的 prefetcher.register
+        :param task: 发送任务，通过 self.prefetcher.get(name) 读取内容
+        """
+        if not isinstance(times, list):
+            times = [times]
+        self.onEveryTime([self.prefetcher.lead_time(t) for t in times], self.prefetcher.prefetch, name,
+                         name=f"prefetch:{name}")
+        self.onEveryTime(times, task)
+
     def newsReport(self) -> None:
         receivers = self.config.NEWS
         if not receivers:
             return
 
-        news = News().get_important_news()
-        for r in receivers:
-            self.sendTextMsg(news, r)
+        artifact = self.prefetcher.get("newsReport")
+        if artifact:
+            self.broadcaster.submit("newsReport", receivers, texts=[artifact["text"]])
 
     def moyu(self) -> None:
         receivers = self.config.NEWS
         if not receivers:
             return
 
-        path1 = self.getAndSaveMoYu()
-        path2 = self.getAndSaveMoYu(1)
-        for r in receivers:
-            if path1:
-                self.wcf.send_file(path1, r)
-            if path2:
-                self.wcf.send_file(path2, r)
+        artifact = self.prefetcher.get("moyu")
+        if artifact:
+            self.broadcaster.submit("moyu", receivers, files=[f["path"] for f in artifact["files"]])
 
     def todayInHistory(self) -> None:
         receivers = self.config.TODAY
         if not receivers:
             return
 
+        artifact = self.prefetcher.get("todayInHistory")
+        if artifact:
+            self.broadcaster.submit("todayInHistory", receivers, texts=[artifact["text"]])
+
+    @staticmethod
+    def fetchTodayInHistory() -> str:
         result = OpenAPIHandler().todayInHistory()
-        history = result.get("result", [])
+        history = (result or {}).get("result", [])
         if len(history) == 0:
-            return
+            return ""
 
         historyText = [f"{item['date']} {item['title']}" for item in history]
-        sendText = "历史上的今天 \n" + "\n".join(historyText)
+        return "历史上的今天 \n" + "\n".join(historyText)
 
-        for r in receivers:
-            self.sendTextMsg(sendText, r)
+    def fetchMoYu(self) -> list:
+        return [self.getAndSaveMoYu(), self.getAndSaveMoYu(1)]
 
     @staticmethod
     def getAndSaveTiTokGirlVideo() -> str:
@@ -350,21 +613,13 @@ class Robot(Job):
         # 通过URL下载视频
         # 手动添加协议部分
         full_url = 'https:' + url
-        response = requests.get(full_url, stream=True)
         today = datetime.now().strftime("%Y-%m-%d")
         dirPath = os.path.join(os.path.join(os.getcwd(), "video"), today)
-        if not os.path.exists(dirPath):
-            os.makedirs(dirPath)
-
-        # 毫秒时间戳字符串作为文件名
-        fileName = str(int(time.time() * 1000)) + ".mp4"
-        savePath = os.path.join(dirPath, fileName)
-        if response.status_code == 200:
-            with open(savePath, 'wb') as f:
-                f.write(response.content)
-            # 返回保存的路径和文件名
-            return savePath
-        else:
+        try:
+            # 边下边写，文件名为内容哈希
+            return media_downloader.download(full_url, dirPath, ".mp4")
+        except Exception as e:
+            logging.getLogger("Robot").error(f"下载视频失败: {e}")
             return ""
 
     @staticmethod
@@ -376,34 +631,47 @@ class Robot(Job):
             url = "https://dayu.qqsuu.cn/moyuribao/apis.php"
         today = datetime.now().strftime("%Y-%m-%d")
         dirPath = os.path.join(os.path.join(os.getcwd(), "images"), today)
-        if not os.path.exists(dirPath):
-            os.makedirs(dirPath)
-        fileName = str(time.time()) + ".jpg"
-        savePath = os.path.join(dirPath, fileName)
 
         try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                with open(savePath, 'wb') as file:
-                    file.write(response.content)
-                return savePath
-            else:
-                return ""
+            # 由预取器移到预取目录后再登记到 media_store
+            return media_downloader.download(url, dirPath, ".jpg")
         except Exception as e:
-            print(e)
+            logging.getLogger("Robot").error(f"下载摸鱼日报失败: {e}")
             return ""
 
-    def sendAudioMsg(self, rsp, receiver) -> None:
-        """发送语音消息"""
-        filePath = self.chat.generateAudio(rsp)
-        self.wcf.send_file(filePath, receiver)
+    def sendAudioMsg(self, rsp, receiver, deadline: Deadline = None, at_list: str = "") -> None:
+        """发送语音消息，剩余时间不够生成语音时改发文字"""
+        deadline = deadline or Deadline()
+        if not deadline.check("audio", self.config.DEADLINE.get("audio_reserve", 10)):
+            self.sendTextMsg(rsp, receiver, at_list)
+            return
+        try:
+            filePath = self.chat.generateAudio(rsp, deadline)
+        except Exception as e:
+            self.LOG.error(f"生成语音失败，改发文字: {e}")
+            filePath = ""
+        if not filePath:
+            self.sendTextMsg(rsp, receiver, at_list)
+            return
+        self.sendFile(filePath, receiver)
 
     def sendImageMsg(self, rsp, receiver) -> None:
-        """发送图片消息"""
-        filePath = self.chat.generateImage(rsp)
-        print(filePath)
+        """提交画图任务并马上回复，图片画好后由 deliverImage 发送"""
+        status, ahead = self.imageJobs.submit(rsp, receiver)
+        if status == ImageJobs.REJECTED:
+            self.sendTextMsg("画图的人太多了，请稍后再试", receiver)
+        elif status == ImageJobs.QUEUED:
+            self.sendTextMsg(f"收到，正在排队画图，前面还有 {ahead} 张", receiver)
+        elif status == ImageJobs.STARTED:
+            self.sendTextMsg("收到，正在画图，请稍等", receiver)
+        elif status == ImageJobs.JOINED:
+            self.sendTextMsg("同样的图已在画了，画好一起发给你", receiver)
+
+    def deliverImage(self, receiver: str, filePath: str) -> None:
         if filePath:
-            self.wcf.send_file(filePath, receiver)
+            self.sendFile(filePath, receiver)
+        else:
+            self.sendTextMsg("画图失败了，换个描述试试", receiver)
 
 
 if __name__ == "__main__":